@@ -0,0 +1,200 @@
+"""
+Per-API-key admission control.
+
+Every inference endpoint opens an admission session for the key it was
+called with before doing any work. A session is refused, with a 429 over
+HTTP or a 1013 (try again later) close on a WebSocket, when the key is over
+its request rate, already has ``ADMISSION_MAX_SESSIONS`` sessions open, or
+when the inference queue's estimated wait for the session's priority class
+is past its SLO. Jobs submitted later in a session can still be shed by the
+inference executor; endpoints turn those into the same responses.
+"""
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+
+from fastapi import HTTPException, WebSocket, status
+from fastapi.responses import StreamingResponse
+
+from app.metrics import ADMISSION_REJECTED
+from app.service.executor import InferenceExecutor, InferenceQueueFull, LoadShed, Priority, get_inference_executor
+
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", 32))  # open sessions per API key, 0 = unlimited
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", 20))  # sessions started per second per API key, 0 = unlimited
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", 40))  # sessions a key may start at once before the rate applies
+
+WS_1013_TRY_AGAIN_LATER = 1013
+
+
+class AdmissionDenied(Exception):
+    """Raised when a request is turned away, ``reason`` is a short machine-readable code."""
+
+    def __init__(self, reason: str, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Budget:
+    __slots__ = ("tokens", "updated", "sessions")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.sessions = 0
+
+
+class AdmissionSession:
+    """An admitted session, released by ``close`` or leaving the ``with`` block."""
+
+    def __init__(self, admission: "Admission", budget: _Budget):
+        self._admission = admission
+        self._budget: _Budget | None = budget
+
+    def close(self) -> None:
+        budget, self._budget = self._budget, None
+        if budget is not None:
+            self._admission._release(budget)
+
+    def __enter__(self) -> "AdmissionSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Admission:
+    """
+    Session-start rate (a token bucket of ``burst`` refilled at ``rate`` per
+    second) and concurrent-session budgets per API key, plus load shedding
+    on the inference executor's estimated queue wait.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = ADMISSION_MAX_SESSIONS,
+        rate: float = ADMISSION_RATE,
+        burst: float = ADMISSION_BURST,
+        executor: InferenceExecutor | None = None,
+    ):
+        self.max_sessions = max_sessions
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.executor = executor
+        self._budgets: dict[str, _Budget] = {}
+        self._lock = threading.Lock()
+
+    def _take(self, key: str) -> _Budget:
+        # Called with the lock held
+        now = time.monotonic()
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = _Budget(self.burst, now)
+        if self.max_sessions > 0 and budget.sessions >= self.max_sessions:
+            raise AdmissionDenied(
+                "too_many_sessions", f"At most {self.max_sessions} concurrent sessions per API key"
+            )
+        if self.rate > 0:
+            budget.tokens = min(self.burst, budget.tokens + (now - budget.updated) * self.rate)
+            budget.updated = now
+            if budget.tokens < 1:
+                raise AdmissionDenied(
+                    "rate_limited",
+                    f"At most {self.rate:g} requests per second per API key",
+                    (1 - budget.tokens) / self.rate,
+                )
+            budget.tokens -= 1
+        budget.sessions += 1
+        return budget
+
+    def _release(self, budget: _Budget) -> None:
+        with self._lock:
+            budget.sessions -= 1
+
+    def session(self, authorization: str, endpoint: str, priority: Priority | None = None) -> AdmissionSession:
+        """
+        Admit a session for the key in ``authorization`` (the value checked by
+        ``get_api_key``), or raise ``AdmissionDenied``. With a ``priority``
+        the session is also refused while jobs of that class would be shed.
+        """
+        key = authorization.split(" ", 1)[-1]
+        try:
+            if priority is not None and self.executor is not None:
+                try:
+                    self.executor.check(priority)
+                except LoadShed as e:
+                    raise AdmissionDenied("overloaded", str(e), e.wait) from None
+            with self._lock:
+                budget = self._take(key)
+        except AdmissionDenied as e:
+            ADMISSION_REJECTED.labels(endpoint, e.reason).inc()
+            raise
+        return AdmissionSession(self, budget)
+
+
+@lru_cache
+def get_admission() -> Admission:
+    return Admission(executor=get_inference_executor())
+
+
+def shed(endpoint: str, error: InferenceQueueFull) -> AdmissionDenied:
+    """Count a job refused by the inference executor and describe it like a refused session."""
+    if isinstance(error, LoadShed):
+        denied = AdmissionDenied("overloaded", str(error), error.wait)
+    else:
+        denied = AdmissionDenied("queue_full", str(error))
+    ADMISSION_REJECTED.labels(endpoint, denied.reason).inc()
+    return denied
+
+
+def too_many_requests(denied: AdmissionDenied) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={"error": str(denied), "code": denied.reason},
+        headers={"Retry-After": str(max(math.ceil(denied.retry_after), 1))},
+    )
+
+
+def open_http_session(authorization: str, endpoint: str, priority: Priority | None = None) -> AdmissionSession:
+    """``Admission.session`` for HTTP endpoints, refusals become 429 responses."""
+    try:
+        return get_admission().session(authorization, endpoint, priority)
+    except AdmissionDenied as e:
+        raise too_many_requests(e) from None
+
+
+async def close_refused(websocket: WebSocket, denied: AdmissionDenied) -> None:
+    """Tell an accepted WebSocket why it is turned away and close it with 1013."""
+    await websocket.send_json({
+        "type": "error",
+        "error": str(denied),
+        "code": denied.reason,
+        "retry_after": round(denied.retry_after, 3),
+    })
+    # Close reasons are limited to 123 bytes
+    await websocket.close(code=WS_1013_TRY_AGAIN_LATER, reason=denied.reason)
+
+
+async def open_websocket_session(
+    websocket: WebSocket, authorization: str, endpoint: str, priority: Priority
+) -> AdmissionSession | None:
+    """``Admission.session`` for accepted WebSockets, None after closing a refused one."""
+    try:
+        return get_admission().session(authorization, endpoint, priority)
+    except AdmissionDenied as e:
+        await close_refused(websocket, e)
+        return None
+
+
+class SessionStreamingResponse(StreamingResponse):
+    """A StreamingResponse that holds its admission session until the body is sent or the client leaves."""
+
+    def __init__(self, session: AdmissionSession, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = session
+
+    async def __call__(self, scope, receive, send) -> None:
+        with self.session:
+            await super().__call__(scope, receive, send)
@@ -1,125 +1,295 @@
+import logging
 import os
+import uuid
 from typing import Literal
-from fastapi import APIRouter, Security, WebSocket
-from app.auth import get_api_key_ws
+from fastapi import APIRouter, HTTPException, Security, UploadFile, WebSocket, status
+from app.admission import close_refused, open_http_session, open_websocket_session, shed, too_many_requests
+from app.auth import get_api_key, get_api_key_ws
+from app.log import chunk_logger
+from app.utils import AUDIO_PTIME, AudioBuffer, Context, FrameAssembler, current_context
 import numpy as np
 from dotenv import load_dotenv
 import json
 import asyncio
-from app.service.stt import get_stt_model
+import time
+from concurrent.futures import Future
+from app.metrics import ACTIVE_SESSIONS, BUFFERED_AUDIO_SECONDS, STT_CHUNK_SECONDS
+from app.service.codecs import FRAME_HEADER, INGRESS_ENCODINGS, FrameSequence, decode_audio, decoded_length
+from app.service.executor import InferenceQueueFull, LoadShed, Priority, get_inference_executor
+from app.service.stt import get_stt_model, transcribe_file
+from app.service.vad import get_vad_model, quietest_point
+from app.tracing import get_trace, span
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 STT_REPO = os.getenv("STT_REPO")
-STT_CHUNK_DURATION = float(os.getenv("STT_CHUNK_DURATION", 0.4))  # 400ms like ReplyOnPause
+STT_CHUNK_DURATION = float(os.getenv("STT_CHUNK_DURATION", 0.4))  # 400ms VAD window like ReplyOnPause
+STT_HOP_DURATION = float(os.getenv("STT_HOP_DURATION", AUDIO_PTIME))  # pause decisions every 20ms
 STT_STARTED_THRESHOLD = float(os.getenv("STT_STARTED_THRESHOLD", 0.2))  # 200ms speech to start
 STT_SPEECH_THRESHOLD = float(os.getenv("STT_SPEECH_THRESHOLD", 0.1))  # 100ms speech to continue
+STT_VAD_MODEL = os.getenv("STT_VAD_MODEL", "energy")  # "energy" or "silero"
+STT_MAX_UTTERANCE_DURATION = float(os.getenv("STT_MAX_UTTERANCE_DURATION", 30))  # force a flush after 30s of speech
+STT_INTERIM_INTERVAL = float(os.getenv("STT_INTERIM_INTERVAL", 1.0))  # new speech between interim results
+STT_INTERIM_WINDOW = float(os.getenv("STT_INTERIM_WINDOW", 8.0))  # most uncommitted audio decoded per interim result
 
 router = APIRouter()
 
+# States of open sessions, read when metrics are scraped
+_active_states: set["AudioState"] = set()
+BUFFERED_AUDIO_SECONDS.set_function(
+    lambda: sum(len(s.buffer) / s.sample_rate for s in list(_active_states))
+)
+
 
 class AudioState:
     """Simple state management similar to ReplyOnPause AppState"""
-    def __init__(self):
-        self.buffer = np.array([], dtype=np.int16)
+    __slots__ = (
+        "buffer", "frames", "captions", "started_talking", "last_speech_time", "sample_rate",
+        "interim_results", "committed_text", "committed_samples", "last_interim_samples",
+        "flushed_overlap",
+    )
+
+    def __init__(self, sample_rate: int = 8000, interim_results: bool = False):
+        # Preallocate a few seconds so typical utterances never reallocate
+        self.buffer = AudioBuffer(sample_rate * 4)
+        # Incoming packets of any size, re-framed into hops for pause detection.
+        # Not cleared by reset, the window slides on across utterances.
+        self.frames = FrameAssembler(
+            int(STT_HOP_DURATION * sample_rate), int(STT_CHUNK_DURATION * sample_rate)
+        )
         self.captions = ""
         self.started_talking = False
         self.last_speech_time = 0
-        self.sample_rate = 8000
+        self.sample_rate = sample_rate
+        self.interim_results = interim_results
+        # Transcript of buffer[:committed_samples], decoded once and never revisited
+        self.committed_text = ""
+        self.committed_samples = 0
+        self.last_interim_samples = 0
+        # Samples at the start of the current window that a forced flush already
+        # transcribed. Kept across reset so they are not sent again as pre-roll.
+        self.flushed_overlap = 0
 
+    def reset(self):
+        self.buffer.clear()
+        self.started_talking = False
+        self.committed_text = ""
+        self.committed_samples = 0
+        self.last_interim_samples = 0
 
-def has_speech_content(audio_chunk: np.ndarray, sample_rate: int) -> bool:
-    """Check if audio chunk contains speech using STT (more accurate than energy)"""
+
+def speech_duration(audio_chunk: np.ndarray, sample_rate: int) -> float:
+    """Seconds of speech in the audio chunk according to the VAD model (dur_vad)"""
     if len(audio_chunk) == 0:
-        return False
-    
-    # Only check speech for reasonably sized chunks to avoid STT errors
-    min_samples = int(sample_rate * 0.1)  # 100ms minimum
-    if len(audio_chunk) < min_samples:
-        return False
+        return 0.0
     
     try:
-        moonshine = get_stt_model(STT_REPO)
-        transcription = moonshine.stt((sample_rate, audio_chunk))
-        return bool(transcription and transcription.strip())
-    except:
-        # If STT fails, assume no speech
-        return False
+        vad_model = get_vad_model(STT_VAD_MODEL)
+        with span("vad", model=STT_VAD_MODEL):
+            duration, _ = vad_model.vad((sample_rate, audio_chunk))
+        return duration
+    except Exception as e:
+        # If VAD fails, assume no speech
+        logger.warning("VAD error: %s", e)
+        return 0.0
 
 
-def determine_pause(audio_chunk: np.ndarray, state: AudioState) -> bool:
+def determine_pause(audio_chunk: np.ndarray | None, state: AudioState) -> bool:
     """
     Pause detection logic matching ReplyOnPause.determine_pause
     Returns True if pause detected, False otherwise
+
+    The chunk may be any size. It is re-framed into STT_HOP_DURATION hops and
+    every hop is judged on the STT_CHUNK_DURATION window ending there, so the
+    thresholds mean what they did for 400ms chunks while a pause is noticed
+    within a hop. Hops after a detected pause are kept for the next call,
+    which may pass None to judge them without adding audio.
+    audio_chunk is None when the audio was already decoded into state.frames.
     """
-    duration = len(audio_chunk) / state.sample_rate
-    
-    # Only process chunks that meet minimum duration (like ReplyOnPause)
-    if duration >= STT_CHUNK_DURATION:
-        # Use STT to get speech duration (equivalent to dur_vad)
-        has_speech = has_speech_content(audio_chunk, state.sample_rate)
-        dur_stt = duration if has_speech else 0.0  # Binary: full duration or none
+    if audio_chunk is not None:
+        state.frames.append(audio_chunk)
+    hop = state.frames.hop
+    while (window := state.frames.next_window()) is not None:
+        state.flushed_overlap = max(state.flushed_overlap - hop, 0)
+        duration = len(window) / state.sample_rate
+        # Use the VAD model to get the speech duration in the window
+        dur_vad = speech_duration(window, state.sample_rate)
         
-        print(f"Chunk duration: {duration:.2f}s, STT speech duration: {dur_stt:.2f}s")
+        chunk_logger.debug("Chunk processed", extra={"duration": round(duration, 3), "dur_vad": round(dur_vad, 3)})
         
         # Check if user started talking (like started_talking_threshold check)
-        if dur_stt > STT_STARTED_THRESHOLD and not state.started_talking:
+        if dur_vad > STT_STARTED_THRESHOLD and not state.started_talking:
             state.started_talking = True
-            print("Started talking")
+            logger.info("Started talking")
+            # The whole window is pre-roll, the speech that crossed the threshold is in it,
+            # except what the last utterance ended with if it was flushed at the max duration
+            state.buffer.append(window[state.flushed_overlap:-hop])
         
         # If user started talking, accumulate speech in buffer (like state.stream)
         if state.started_talking:
-            if len(state.buffer) == 0:
-                state.buffer = audio_chunk
-            else:
-                state.buffer = np.concatenate([state.buffer, audio_chunk])
+            state.buffer.append(window[-hop:])
             
-            # Check if continuous speech limit has been reached (optional feature)
-            # current_duration = len(state.buffer) / state.sample_rate
-            # if current_duration >= max_continuous_speech_s:
-            #     return True
+            # Check if continuous speech limit has been reached
+            current_duration = len(state.buffer) / state.sample_rate
+            if current_duration >= STT_MAX_UTTERANCE_DURATION:
+                logger.info("Max utterance duration reached", extra={"duration": round(current_duration, 2)})
+                # The flushed utterance ends with this whole window
+                state.flushed_overlap = len(window)
+                return True
         
         # Check if a pause has been detected (like speech_threshold check)
-        if dur_stt < STT_SPEECH_THRESHOLD and state.started_talking:
-            print(f"Pause detected: STT speech duration {dur_stt:.2f}s < threshold {STT_SPEECH_THRESHOLD}")
+        if dur_vad < STT_SPEECH_THRESHOLD and state.started_talking:
+            logger.info("Pause detected", extra={"dur_vad": round(dur_vad, 3), "threshold": STT_SPEECH_THRESHOLD})
             return True
     
     return False
 
 
-def stream_stt_with_pause_detection(audio_chunk: np.ndarray, state: AudioState) -> tuple[str, bool]:
+def _join(*parts: str) -> str:
+    return " ".join(p.strip() for p in parts if p and p.strip())
+
+
+def transcribe_utterance(state: AudioState) -> str:
+    """Transcribe the buffered utterance, reusing the committed prefix from interim results"""
+    moonshine = get_stt_model(STT_REPO)
+    audio = state.buffer.view()
+    tail = moonshine.stt((state.sample_rate, audio[state.committed_samples:]))
+    return _join(state.committed_text, tail)
+
+
+def interim_transcript(state: AudioState) -> str:
+    """
+    Hypothesis for the utterance so far, or "" when it is not yet time for one.
+
+    Only audio after the committed prefix is decoded. Once that tail grows past
+    STT_INTERIM_WINDOW, its older half is committed at the quietest frame, so
+    each interim result decodes a bounded window instead of the whole buffer.
+    """
+    sr = state.sample_rate
+    buffered = len(state.buffer)
+    if buffered - state.last_interim_samples < STT_INTERIM_INTERVAL * sr:
+        return ""
+    state.last_interim_samples = buffered
+
+    audio = state.buffer.view()
+    window = int(STT_INTERIM_WINDOW * sr)
+    if buffered - state.committed_samples > window:
+        moonshine = get_stt_model(STT_REPO)
+        cut = quietest_point(audio, sr, state.committed_samples + window // 2, buffered - window // 2)
+        committed = moonshine.stt((sr, audio[state.committed_samples:cut]))
+        state.committed_text = _join(state.committed_text, committed)
+        state.committed_samples = cut
+    return transcribe_utterance(state)
+
+
+def final_transcript(state: AudioState) -> Future:
+    """
+    Queue the utterance that just ended for transcription and reset the state
+    for the next one. A batching model is handed the utterance without waiting
+    for its batch to run, so the inference worker moves on meanwhile. The
+    returned future resolves to the transcript, or to the error that ended it.
+    """
+    logger.info("Transcribing utterance", extra={"samples": len(state.buffer)})
+    transcript: Future = Future()
+    try:
+        moonshine = get_stt_model(STT_REPO)
+        audio = (state.sample_rate, state.buffer.view()[state.committed_samples:].copy())
+        committed = state.committed_text
+        if hasattr(moonshine, "submit"):
+            tail = moonshine.submit(audio)
+        else:
+            tail = Future()
+            tail.set_result(moonshine.stt(audio))
+    except Exception as e:
+        transcript.set_exception(e)
+        return transcript
+    finally:
+        # Reset state for next speech segment, even on error
+        state.reset()
+
+    def done(tail: Future) -> None:
+        try:
+            transcript.set_result(_join(committed, tail.result()))
+        except Exception as e:
+            transcript.set_exception(e)
+
+    tail.add_done_callback(done)
+    return transcript
+
+
+def stream_stt_with_pause_detection(audio_chunk: np.ndarray | None, state: AudioState) -> tuple[list[Future], str]:
     """
     Process audio chunk and detect pauses using ReplyOnPause-style logic
-    Returns: (updated_captions, pause_detected)
+    Returns the final transcripts of the utterances that ended in the chunk,
+    as futures, and an interim transcript of the utterance still open when
+    interim results are on ("" when there is none to send)
     """
-    # Use ReplyOnPause-style pause detection
-    pause_detected = determine_pause(audio_chunk, state)
-    
-    if pause_detected:
-        print(f"Processing accumulated buffer of {len(state.buffer)} samples")
-        # Process accumulated buffer with STT
+    finals = []
+    # Use ReplyOnPause-style pause detection, until every hop of the chunk is judged
+    while determine_pause(audio_chunk, state):
+        audio_chunk = None
+        finals.append(final_transcript(state))
+    interim = ""
+    if state.interim_results and state.started_talking:
         try:
-            moonshine = get_stt_model(STT_REPO)
-            transcription = moonshine.stt((state.sample_rate, state.buffer))
-            if transcription and transcription.strip():
-                new_captions = transcription.strip()
-                
-                # Reset state for next speech segment
-                state.buffer = np.array([], dtype=np.int16)
-                state.started_talking = False
-                
-                return new_captions, True
-            else:
-                # No transcription but reset state anyway
-                state.buffer = np.array([], dtype=np.int16)
-                state.started_talking = False
+            interim = interim_transcript(state)
         except Exception as e:
-            print(f"STT error: {e}")
-            # Reset state even on error
-            state.buffer = np.array([], dtype=np.int16)
-            state.started_talking = False
-    
-    return state.captions, False
+            logger.exception("Interim STT error: %s", e)
+    return finals, interim
+
+
+def finish_stream(state: AudioState) -> list[Future]:
+    """
+    Final transcripts, as futures, for the audio still held when the client
+    stops: hops not yet run through pause detection (e.g. of a chunk refused
+    with queue_full), then the utterance left open
+    """
+    finals = []
+    while determine_pause(None, state):
+        finals.append(final_transcript(state))
+    if state.started_talking and len(state.buffer) > 0:
+        finals.append(final_transcript(state))
+    return finals
+
+
+@router.post("/file")
+async def transcribe_upload(
+    file: UploadFile,
+    authorization: str = Security(get_api_key)
+):
+    """
+    Transcribe an uploaded recording in any format libsndfile reads.
+
+    The upload is read from its spooled file in blocks and segmented with the
+    VAD, and the segments are decoded in batches behind live STT while the
+    rest is read, so long recordings take a fraction of their duration.
+    Returns the ordered segments with their start and end in seconds.
+    """
+    try:
+        with open_http_session(authorization, "stt_file", Priority.BATCH):
+            result = await asyncio.to_thread(
+                transcribe_file,
+                file.file,
+                get_stt_model(STT_REPO),
+                get_vad_model(STT_VAD_MODEL),
+                STT_MAX_UTTERANCE_DURATION,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except InferenceQueueFull as e:
+        raise too_many_requests(shed("stt_file", e)) from None
+    logger.info(
+        "File transcribed",
+        extra={
+            "upload": file.filename,
+            "duration": result["duration"],
+            "segments": len(result["segments"]),
+            "elapsed_s": result["elapsed_s"],
+        },
+    )
+    return result
 
 
 @router.websocket("/")
@@ -128,57 +298,143 @@ async def stt_websocket(
     authorization: str = Security(get_api_key_ws)
 ):
     await websocket.accept()
+    current_context.set(Context(webrtc_id=uuid.uuid4().hex[:12], websocket=websocket, trace=get_trace()))
+    session = await open_websocket_session(websocket, authorization, "stt_ws", Priority.STT)
+    if session is None:
+        return
+    ACTIVE_SESSIONS.labels("stt").inc()
     
     state = AudioState()
+    _active_states.add(state)
     language = "en-US"
+    encoding = "linear16"
+    sequence: FrameSequence | None = None
+    executor = get_inference_executor()
+
+    async def send_transcription(captions: str, is_final: bool) -> None:
+        await websocket.send_json({
+            "type": "transcription",
+            "is_final": is_final,
+            "alternatives": [{"transcript": captions, "confidence": 1.0}],
+            "language": language,
+            "channel": 1
+        })
+
+    async def reject_frame(error: str) -> None:
+        # The frame is dropped, the session goes on with the next one
+        await websocket.send_json({"type": "error", "error": error, "code": "bad_frame"})
+
+    async def send_finals(finals: list[Future]) -> None:
+        for transcript in finals:
+            try:
+                captions = await asyncio.wrap_future(transcript)
+            except Exception as e:
+                logger.exception("STT error: %s", e)
+                continue
+            if captions:
+                await send_transcription(captions, True)
     
     try:
         while True:
             message = await websocket.receive()
             if message["type"] == "websocket.receive":
                 if "bytes" in message:
-                    # Convert bytes to numpy array
-                    audio_chunk = np.frombuffer(message["bytes"], dtype=np.int16)
-                    
-                    # Process with pause detection
-                    captions, pause_detected = stream_stt_with_pause_detection(audio_chunk, state)
+                    payload = memoryview(message["bytes"])
+                    if sequence is not None and len(payload) < FRAME_HEADER.size:
+                        await reject_frame(
+                            f"Frame of {len(payload)} bytes is shorter than its {FRAME_HEADER.size}-byte header"
+                        )
+                        continue
+                    itemsize = INGRESS_ENCODINGS[encoding].itemsize
+                    if (len(payload) - (FRAME_HEADER.size if sequence is not None else 0)) % itemsize:
+                        await reject_frame(f"Frame is not a whole number of {itemsize}-byte {encoding} samples")
+                        continue
+                    if sequence is not None:
+                        seq, timestamp = FRAME_HEADER.unpack_from(payload)
+                        payload = payload[FRAME_HEADER.size:]
+                        checked = sequence.check(seq, timestamp, decoded_length(payload, encoding))
+                        if checked is None:
+                            await websocket.send_json({"type": "warning", "code": "frame_out_of_order", "seq": seq})
+                            continue
+                        lost, gap = checked
+                        if lost:
+                            # Keep the timeline: the lost audio becomes silence
+                            state.frames.extend(gap)[:] = 0
+                            await websocket.send_json({
+                                "type": "warning",
+                                "code": "frames_lost",
+                                "seq": seq,
+                                "lost": lost,
+                                "silence_ms": round(gap * 1000 / state.sample_rate),
+                            })
+
+                    # Decode straight into the session's frame assembler
+                    with span("decode", bytes=len(payload), encoding=encoding):
+                        decode_audio(
+                            payload, encoding, out=state.frames.extend(decoded_length(payload, encoding))
+                        )
                     
-                    # Send transcript when pause is detected
-                    if pause_detected and captions:
+                    # Process with pause detection on the inference pool. Awaiting each
+                    # chunk before receiving the next keeps this session's chunks in order.
+                    try:
+                        received = time.perf_counter()
+                        finals, interim = await executor.submit(
+                            stream_stt_with_pause_detection, None, state, priority=Priority.STT
+                        )
+                    except LoadShed as e:
+                        # Live audio that cannot be kept up with is better ended than delayed
+                        await close_refused(websocket, shed("stt_ws", e))
+                        break
+                    except InferenceQueueFull as e:
+                        shed("stt_ws", e)
                         await websocket.send_json({
-                            "type": "transcription",
-                            "is_final": True,
-                            "alternatives": [{"transcript": captions, "confidence": 1.0}],
-                            "language": language,
-                            "channel": 1
+                            "type": "error",
+                            "error": str(e),
+                            "code": "queue_full",
                         })
-                        
+                        continue
+                    
+                    # Send a final transcript for every detected pause, then the interim one.
+                    # Finals are awaited here, not on the worker, while the batcher decodes them.
+                    await send_finals(finals)
+                    STT_CHUNK_SECONDS.observe(time.perf_counter() - received)
+                    if interim:
+                        await send_transcription(interim, False)
+
                 elif "text" in message:
                     control = json.loads(message["text"])
-                    print(f"Control message received: {control}")
+                    logger.info("Control message received", extra={"control": control})
                     if control.get("type") == "start":
                         language = control.get("language", "en-US")
+                        encoding = control.get("encoding", "linear16").lower()
+                        if encoding not in INGRESS_ENCODINGS:
+                            raise ValueError(f"Unsupported audio encoding: {encoding}")
                         # Reset state properly
-                        state = AudioState()
-                        state.sample_rate = control.get("sampleRateHz", 8000)
+                        _active_states.discard(state)
+                        state = AudioState(
+                            control.get("sampleRateHz", 8000),
+                            interim_results=bool(
+                                control.get("interim_results", control.get("interimResults", False))
+                            ),
+                        )
+                        _active_states.add(state)
+                        # At most a second of silence stands in for lost frames
+                        header = control.get("frame_header", control.get("frameHeader", False))
+                        sequence = FrameSequence(state.sample_rate) if header else None
                     elif control.get("type") == "stop":
                         # Send any remaining captions
-                        if state.started_talking and len(state.buffer) > 0:
-                            try:
-                                moonshine = get_stt_model(STT_REPO)
-                                transcription = moonshine.stt((state.sample_rate, state.buffer))
-                                if transcription and transcription.strip():
-                                    await websocket.send_json({
-                                        "type": "transcription",
-                                        "is_final": True,
-                                        "alternatives": [{"transcript": transcription.strip(), "confidence": 1.0}],
-                                        "language": language,
-                                        "channel": 1
-                                    })
-                            except Exception as e:
-                                print(f"Final STT error: {e}")
+                        try:
+                            finals = await executor.submit(finish_stream, state, priority=Priority.STT)
+                        except Exception as e:
+                            logger.exception("Final STT error: %s", e)
+                            finals = []
+                        await send_finals(finals)
                         await websocket.close()
                         break
     except Exception as e:
         await websocket.send_json({"type": "error", "error": str(e)})
         await websocket.close()
+    finally:
+        session.close()
+        _active_states.discard(state)
+        ACTIVE_SESSIONS.labels("stt").dec()
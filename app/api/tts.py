@@ -1,30 +1,554 @@
-from fastapi import APIRouter, Response, status
-from app.auth import get_api_key
-import soundfile as sf
-import io
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from app.admission import SessionStreamingResponse, open_http_session, open_websocket_session, shed, too_many_requests
+from app.auth import get_api_key, get_api_key_ws
 from fastapi import Security
-from app.models.schemas import TTSRequest
-from app.service.tts import get_tts_model,KokoroTTSOptions
+from app.metrics import ACTIVE_SESSIONS, TTS_FIRST_AUDIO_SECONDS, TTS_SYNTHESIS_SECONDS
+from app.models.schemas import OUTPUT_SAMPLE_RATES, TTSBatchRequest, TTSRequest
+from app.service.cache import CachedAudio, get_synthesis_cache, synthesis_key
+from app.service.codecs import FILE_EXTENSIONS, MEDIA_TYPES, AudioEncoder, AudioFormat, audio_duration, encode_file
+from app.service.executor import InferenceQueueFull, Priority, inference_priority
+from app.service.tts import DEFAULT_TTS_ENGINE, TTSModel, TextSegmenter, get_tts_model, loaded_tts_models, KokoroTTSOptions
+from app.tracing import get_trace, span
+from app.utils import Context, current_context, wav_header
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+TTS_BATCH_MAX_ITEMS = int(os.getenv("TTS_BATCH_MAX_ITEMS", 10000))  # largest accepted /tts/batch
+TTS_BATCH_CONCURRENCY = int(os.getenv("TTS_BATCH_CONCURRENCY", os.getenv("TTS_POOL_SIZE", 1)))  # batch items rendered at once
+
+
+def request_options(tts_request: TTSRequest) -> KokoroTTSOptions:
+    return KokoroTTSOptions(voice=tts_request.voice, speed=1.0, lang=tts_request.language.lower())
+
+
+def request_cache_key(tts_request: TTSRequest, streamed: bool = False) -> str:
+    options = request_options(tts_request)
+    return synthesis_key(
+        tts_request.text,
+        options.voice,
+        options.speed,
+        options.lang,
+        tts_request.format,
+        tts_request.sample_rate,
+        tts_request.engine or DEFAULT_TTS_ENGINE,
+        streamed,
+    )
+
+
+def render(tts_request: TTSRequest) -> CachedAudio | None:
+    """Synthesize and encode a whole request, serving repeated prompts from the synthesis cache"""
+    cache = get_synthesis_cache()
+    key = request_cache_key(tts_request)
+    if cache is not None:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+
+    model = get_tts_model(tts_request.engine)
+    with TTS_SYNTHESIS_SECONDS.labels("http").time(), span("tts", chars=len(tts_request.text)):
+        sample_rate, audio = model.tts(tts_request.text, request_options(tts_request))
+    if audio is None:
+        return None
+    with span("encode", format=tts_request.format):
+        content, sample_rate = encode_file(
+            audio, sample_rate, tts_request.format, tts_request.sample_rate
+        )
+    entry = CachedAudio(sample_rate, content)
+    if cache is not None:
+        cache.put(key, entry)
+    return entry
+
+
+def prewarm_from_file(path: str) -> int:
+    """
+    Render every prompt listed in ``path`` into the synthesis cache.
+
+    Each line is either plain text, rendered with the TTSRequest defaults, or a
+    JSON object with TTSRequest fields. Returns the number of prompts rendered.
+    """
+    inference_priority.set(Priority.BATCH)
+    count = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                tts_request = TTSRequest.model_validate_json(line)
+            else:
+                tts_request = TTSRequest(text=line)
+            render(tts_request)
+            count += 1
+    return count
+
+
+async def stream_audio(
+    model: TTSModel,
+    text: str,
+    options: KokoroTTSOptions,
+    fmt: AudioFormat = "wav",
+    sample_rate: int | None = None,
+    cache_key: str | None = None,
+) -> AsyncGenerator[bytes, None]:
+    """Yield encoded audio (after a streaming header for WAV) as each sentence is synthesized"""
+    start_time = time.perf_counter()
+    audio_seconds = 0.0
+    encoder = None
+    body: list[bytes] = []
+    async for model_rate, audio in model.stream_tts(text, options):
+        if encoder is None:
+            first_audio = time.perf_counter() - start_time
+            TTS_FIRST_AUDIO_SECONDS.labels("http_stream").observe(first_audio)
+            logger.info("TTS first audio", extra={"ttfa_s": round(first_audio, 3)})
+            encoder = AudioEncoder(fmt, model_rate, sample_rate)
+            yield encoder.header()
+        audio_seconds += len(audio) / model_rate
+        with span("encode", format=fmt):
+            body.append(encoder.encode(audio))
+        yield body[-1]
+    if encoder is None:
+        return
+    body.append(encoder.flush())
+    yield body[-1]
+    TTS_SYNTHESIS_SECONDS.labels("http_stream").observe(time.perf_counter() - start_time)
+    logger.info(
+        "TTS streamed",
+        extra={
+            "audio_s": round(audio_seconds, 2),
+            "elapsed_s": round(time.perf_counter() - start_time, 3),
+        },
+    )
+
+    cache = get_synthesis_cache()
+    if cache is not None and cache_key is not None:
+        # Store a complete file, a WAV header with real sizes rather than the streaming one
+        content = b"".join(body)
+        if fmt == "wav":
+            content = wav_header(encoder.sample_rate, len(content) // 2) + content
+        cache.put(cache_key, CachedAudio(encoder.sample_rate, content))
+
+
 @router.post("/", status_code=status.HTTP_200_OK)
 async def synthesize(
     tts_request: TTSRequest,
     authorization: str = Security(get_api_key)
 ):
     
-    language = tts_request.language
-    voice = tts_request.voice
-    text = tts_request.text
+    if not tts_request.text.strip():
+        # Nothing to say, whether streamed, cached or not
+        return Response(content=b"", status_code=400, media_type="text/plain")
+    fmt = tts_request.format
+    media_type = MEDIA_TYPES[fmt]
 
-    model = get_tts_model()
-    options = KokoroTTSOptions(voice=voice, speed=1.0, lang=language.lower())
-    sample_rate, audio = model.tts(text, options)
+    if tts_request.stream:
+        key = request_cache_key(tts_request, streamed=True)
+        cache = get_synthesis_cache()
+        cached = None
+        if cache is not None:
+            # A buffered render, e.g. a prewarmed prompt, is a complete answer too
+            cached = cache.get(key) or cache.get(request_cache_key(tts_request))
+        if cached is not None:
+            # Counts against the key's rate, but a cache hit is never shed
+            with open_http_session(authorization, "tts"):
+                return StreamingResponse(
+                    iter([cached.content]),
+                    media_type=media_type,
+                    headers={"X-Sample-Rate": str(cached.sample_rate), "X-Cache": "hit"},
+                )
+        # Refused up front, a stream cut short by shedding would be worse
+        session = open_http_session(authorization, "tts", Priority.TTS)
+        try:
+            # The first request for an engine loads it, off the event loop
+            model = await asyncio.to_thread(get_tts_model, tts_request.engine)
+        except BaseException:
+            session.close()
+            raise
+        headers = {"X-Cache": "miss"}
+        if tts_request.sample_rate:
+            headers["X-Sample-Rate"] = str(tts_request.sample_rate)
+        return SessionStreamingResponse(
+            session,
+            stream_audio(
+                model,
+                tts_request.text,
+                request_options(tts_request),
+                fmt,
+                tts_request.sample_rate,
+                cache_key=key,
+            ),
+            media_type=media_type,
+            headers=headers,
+        )
 
-    if audio is None:
+    with open_http_session(authorization, "tts"):
+        try:
+            entry = await asyncio.to_thread(render, tts_request)
+        except InferenceQueueFull as e:
+            raise too_many_requests(shed("tts", e)) from None
+
+    if entry is None:
         return Response(content=b"", status_code=400, media_type="text/plain")
-    buf = io.BytesIO()
-    sf.write(buf, audio, sample_rate, format="WAV")
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="audio/wav")
+    return Response(
+        content=entry.content,
+        media_type=media_type,
+        headers={"X-Sample-Rate": str(entry.sample_rate)},
+    )
+
+
+def _cache_stats() -> dict:
+    cache = get_synthesis_cache()
+    stats = {"enabled": False} if cache is None else {"enabled": True, **cache.stats()}
+    # Report the sentence-level caches without loading a model just for that
+    for engine, model in loaded_tts_models().items():
+        if hasattr(model, "cache_stats"):
+            stats.setdefault("models", {})[engine] = model.cache_stats()
+    return stats
+
+
+@router.get("/cache")
+def cache_stats(authorization: str = Security(get_api_key)):
+    """Hit, miss and eviction counters of the synthesis cache"""
+    return _cache_stats()
+
+
+@router.post("/cache/prewarm")
+async def prewarm_cache(
+    tts_requests: list[TTSRequest],
+    authorization: str = Security(get_api_key)
+):
+    """Render the given prompts into the synthesis cache ahead of traffic"""
+    with open_http_session(authorization, "tts_prewarm", Priority.BATCH):
+        inference_priority.set(Priority.BATCH)
+        for tts_request in tts_requests:
+            await asyncio.to_thread(render, tts_request)
+    return _cache_stats()
+
+
+@dataclass
+class BatchResult:
+    indices: list[int]
+    entry: CachedAudio | None
+    error: str | None
+    seconds: float
+
+
+class BatchStats:
+    """Job-level counters of a /tts/batch run."""
+
+    def __init__(self, items: int):
+        self.start = time.perf_counter()
+        self.items = items
+        self.unique = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.synthesis_seconds = 0.0
+
+    def add(self, tts_request: TTSRequest, result: BatchResult) -> None:
+        self.unique += 1
+        self.synthesis_seconds += result.seconds
+        if result.entry is None:
+            self.failed += 1
+        else:
+            self.audio_seconds += audio_duration(
+                result.entry.content, tts_request.format, result.entry.sample_rate
+            )
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        return {
+            "items": self.items,
+            "unique": self.unique,
+            "failed": self.failed,
+            "elapsed_s": round(elapsed, 3),
+            "audio_s": round(self.audio_seconds, 3),
+            "items_per_s": round(self.items / elapsed, 3) if elapsed else None,
+            # Seconds of audio rendered per wall-clock second
+            "realtime_factor": round(self.audio_seconds / elapsed, 3) if elapsed else None,
+            "synthesis_s": round(self.synthesis_seconds, 3),
+        }
+
+
+def _group_key(tts_request: TTSRequest) -> tuple[str, str, str]:
+    return (
+        tts_request.engine or DEFAULT_TTS_ENGINE,
+        tts_request.voice,
+        tts_request.language.lower(),
+    )
+
+
+async def render_batch(
+    tts_requests: list[TTSRequest], concurrency: int = TTS_BATCH_CONCURRENCY
+) -> AsyncGenerator[BatchResult, None]:
+    """
+    Render each distinct request once and yield the results as they finish.
+
+    Identical requests share one render. The rest are ordered by engine, voice
+    and language so neighbouring renders reuse the same voice and pipeline,
+    and ``concurrency`` of them run at a time.
+    """
+    unique: dict[str, list[int]] = {}
+    for index, tts_request in enumerate(tts_requests):
+        unique.setdefault(request_cache_key(tts_request), []).append(index)
+    work = iter(sorted(unique.values(), key=lambda indices: _group_key(tts_requests[indices[0]])))
+    results: asyncio.Queue[BatchResult] = asyncio.Queue()
+
+    async def worker() -> None:
+        # Each worker is a task of its own, so this only marks the batch's renders
+        inference_priority.set(Priority.BATCH)
+        # The workers share one iterator, so each takes the next pending item
+        for indices in work:
+            start = time.perf_counter()
+            try:
+                entry = await asyncio.to_thread(render, tts_requests[indices[0]])
+                error = None if entry is not None else "No audio was produced"
+            except Exception as e:
+                logger.exception("TTS batch item failed: %s", e)
+                entry, error = None, str(e)
+            await results.put(BatchResult(indices, entry, error, time.perf_counter() - start))
+
+    workers = [
+        asyncio.create_task(worker()) for _ in range(max(min(concurrency, len(unique)), 1))
+    ]
+    try:
+        for _ in range(len(unique)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def batch_ndjson(tts_requests: list[TTSRequest]) -> AsyncGenerator[bytes, None]:
+    """One JSON line per distinct request as it finishes, then a summary line"""
+    stats = BatchStats(len(tts_requests))
+    async for result in render_batch(tts_requests):
+        tts_request = tts_requests[result.indices[0]]
+        stats.add(tts_request, result)
+        line = {"type": "result", "indices": result.indices, "seconds": round(result.seconds, 3)}
+        if result.entry is None:
+            line.update(type="error", error=result.error)
+        else:
+            line.update(
+                format=tts_request.format,
+                sample_rate=result.entry.sample_rate,
+                audio=base64.b64encode(result.entry.content).decode(),
+            )
+        yield json.dumps(line).encode() + b"\n"
+    summary = stats.summary()
+    logger.info("TTS batch finished", extra=summary)
+    yield json.dumps({"type": "summary", **summary}).encode() + b"\n"
+
+
+class _ZipStream:
+    """Unseekable file object that collects what ``zipfile`` writes so it can be streamed."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def batch_zip(tts_requests: list[TTSRequest]) -> AsyncGenerator[bytes, None]:
+    """
+    A zip archive with one file per request, named by its index, written as
+    each render finishes, and a summary.json with the job stats and errors.
+    """
+    stats = BatchStats(len(tts_requests))
+    errors = {}
+    stream = _ZipStream()
+    # Audio does not compress well, store it as is
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as archive:
+        async for result in render_batch(tts_requests):
+            tts_request = tts_requests[result.indices[0]]
+            stats.add(tts_request, result)
+            if result.entry is None:
+                errors.update({str(index): result.error for index in result.indices})
+                continue
+            for index in result.indices:
+                archive.writestr(
+                    f"{index:05d}.{FILE_EXTENSIONS[tts_request.format]}", result.entry.content
+                )
+            yield stream.drain()
+        summary = stats.summary()
+        logger.info("TTS batch finished", extra=summary)
+        archive.writestr("summary.json", json.dumps({**summary, "errors": errors}, indent=2))
+    yield stream.drain()
+
+
+@router.post("/batch")
+async def synthesize_batch(
+    batch: TTSBatchRequest,
+    authorization: str = Security(get_api_key)
+):
+    """
+    Render many prompts in one request.
+
+    Identical items are synthesized once, and results are streamed back as
+    each one finishes: NDJSON lines with base64 audio for ``"ndjson"``, or a
+    zip archive of audio files for ``"zip"``. Both end with the job's
+    throughput stats.
+    """
+    if len(batch.items) > TTS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {TTS_BATCH_MAX_ITEMS} items per batch",
+        )
+    session = open_http_session(authorization, "tts_batch", Priority.BATCH)
+    if batch.output == "zip":
+        return SessionStreamingResponse(
+            session,
+            batch_zip(batch.items),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="tts-batch.zip"'},
+        )
+    return SessionStreamingResponse(session, batch_ndjson(batch.items), media_type="application/x-ndjson")
+
+
+async def synthesize_segments(
+    websocket: WebSocket,
+    segments: asyncio.Queue,
+) -> None:
+    """Synthesize queued text segments in order and stream their encoded audio back as binary frames"""
+    first_segment = True
+    while True:
+        item = await segments.get()
+        if item is None:
+            break
+        segment, model, options, fmt, target_rate = item
+        start_time = time.perf_counter()
+        try:
+            encoder = None
+            async for sample_rate, audio in model.stream_tts(segment, options):
+                if encoder is None:
+                    TTS_FIRST_AUDIO_SECONDS.labels("websocket").observe(
+                        time.perf_counter() - start_time
+                    )
+                    encoder = AudioEncoder(fmt, sample_rate, target_rate)
+                    await websocket.send_json({
+                        "type": "segment",
+                        "text": segment,
+                        "format": fmt,
+                        "sample_rate": encoder.sample_rate,
+                    })
+                    if not first_segment:
+                        # Same gap stream_tts leaves between sentences
+                        silence = np.zeros(sample_rate // 7, dtype=np.float32)
+                        await websocket.send_bytes(encoder.encode(silence))
+                    first_segment = False
+                with span("encode", format=fmt):
+                    chunk = encoder.encode(audio)
+                await websocket.send_bytes(chunk)
+            if encoder is not None:
+                await websocket.send_bytes(encoder.flush())
+                TTS_SYNTHESIS_SECONDS.labels("websocket").observe(time.perf_counter() - start_time)
+        except InferenceQueueFull as e:
+            denied = shed("tts_ws", e)
+            await websocket.send_json({"type": "error", "error": str(denied), "code": denied.reason, "text": segment})
+        except Exception as e:
+            logger.exception("TTS websocket synthesis error: %s", e)
+            await websocket.send_json({"type": "error", "error": str(e), "text": segment})
+
+
+@router.websocket("/ws")
+async def tts_websocket(
+    websocket: WebSocket,
+    authorization: str = Security(get_api_key_ws)
+):
+    """
+    Incremental text in, audio out.
+
+    Client messages (JSON text frames):
+      {"type": "start", "voice": ..., "language": ..., "speed": ...,
+       "format": ..., "sample_rate": ..., "engine": ...}  optional, sets options
+      {"type": "text", "text": "..."}  a text delta
+      {"type": "flush"}  synthesize whatever is buffered without waiting for a boundary
+      {"type": "close"}  flush, finish synthesis, send {"type": "done"} and close
+
+    Each completed sentence (or clause of a long sentence) is synthesized while
+    more text is still arriving. Its audio is preceded by a {"type": "segment"}
+    message and sent as binary frames, 16-bit little-endian PCM by default or
+    any headerless TTSRequest format ("pcm_s16le", "mulaw", "alaw", "float32").
+
+    A session refused by admission control gets an {"type": "error"} message
+    with the reason as its "code" and is closed with 1013 (try again later).
+    """
+    await websocket.accept()
+    current_context.set(Context(webrtc_id=uuid.uuid4().hex[:12], websocket=websocket, trace=get_trace()))
+    session = await open_websocket_session(websocket, authorization, "tts_ws", Priority.TTS)
+    if session is None:
+        return
+    ACTIVE_SESSIONS.labels("tts").inc()
+
+    options = KokoroTTSOptions()
+    fmt: AudioFormat = "pcm_s16le"
+    target_rate = None
+    segmenter = TextSegmenter()
+    segments: asyncio.Queue = asyncio.Queue()
+    synthesis = asyncio.create_task(synthesize_segments(websocket, segments))
+
+    try:
+        # The first session for an engine loads it, off the event loop
+        model = await asyncio.to_thread(get_tts_model)
+        while True:
+            control = json.loads(await websocket.receive_text())
+            message_type = control.get("type")
+            if message_type == "start":
+                options = KokoroTTSOptions(
+                    voice=control.get("voice", options.voice),
+                    speed=float(control.get("speed", options.speed)),
+                    lang=control.get("language", options.lang).lower(),
+                )
+                fmt = control.get("format", fmt)
+                if fmt not in MEDIA_TYPES or fmt == "wav":
+                    raise ValueError(f"Unsupported websocket audio format: {fmt}")
+                target_rate = control.get("sample_rate", target_rate)
+                if target_rate is not None and target_rate not in OUTPUT_SAMPLE_RATES:
+                    raise ValueError(f"Unsupported websocket sample rate: {target_rate}")
+                if "engine" in control:
+                    model = await asyncio.to_thread(get_tts_model, control["engine"])
+            elif message_type == "text":
+                for segment in segmenter.push(control.get("text", "")):
+                    segments.put_nowait((segment, model, options, fmt, target_rate))
+            elif message_type in ("flush", "close"):
+                segment = segmenter.flush()
+                if segment:
+                    segments.put_nowait((segment, model, options, fmt, target_rate))
+                if message_type == "close":
+                    segments.put_nowait(None)
+                    await synthesis
+                    await websocket.send_json({"type": "done"})
+                    await websocket.close()
+                    break
+    except WebSocketDisconnect:
+        synthesis.cancel()
+    except Exception as e:
+        synthesis.cancel()
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close()
+    finally:
+        session.close()
+        ACTIVE_SESSIONS.labels("tts").dec()
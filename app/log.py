@@ -0,0 +1,121 @@
+"""
+Structured, non-blocking logging for the app.
+
+Records are handed to a bounded queue and formatted and written by a
+listener thread, so logging from the event loop or an inference worker never
+waits on stdout. Every record is tagged with the session id from
+``current_context``. Per-chunk diagnostics go to the ``app.chunks`` logger,
+which is off by default and sampled when enabled, so they cost a level check
+per chunk unless someone asks for them.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from app.metrics import LOG_RECORDS_DROPPED
+from app.utils import current_context
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # level of the app loggers
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+LOG_CHUNK_LEVEL = os.getenv("LOG_CHUNK_LEVEL", "WARNING").upper()  # DEBUG enables per-chunk events
+LOG_CHUNK_SAMPLE_RATE = float(os.getenv("LOG_CHUNK_SAMPLE_RATE", 0.05))  # fraction of per-chunk events kept
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records dropped beyond this backlog
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "session"}
+
+chunk_logger = logging.getLogger("app.chunks")
+
+
+class SessionFilter(logging.Filter):
+    """Tag records with the id of the session they were logged from."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = current_context.get()
+        record.session = context.webrtc_id if context is not None else "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random ``rate`` fraction of records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "session": getattr(record, "session", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(session)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        return f"{text} {fields}" if fields else text
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Enqueue records as they are; drop them rather than block when the listener falls behind."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens in the listener thread, not in the caller
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener: QueueListener | None = None
+
+
+def setup_logging() -> None:
+    """Route the ``app`` loggers through the queue. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _DroppingQueueHandler(log_queue)
+    handler.addFilter(SessionFilter())
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(LOG_LEVEL)
+    app_logger.addHandler(handler)
+    app_logger.propagate = False
+
+    chunk_logger.setLevel(LOG_CHUNK_LEVEL)
+    chunk_logger.addFilter(SamplingFilter(LOG_CHUNK_SAMPLE_RATE))
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
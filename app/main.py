@@ -1,10 +1,103 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response, status
+from app import metrics
+from app.auth import API_KEY
+from app.log import setup_logging
+from app.tracing import TracingMiddleware
 from app.api import tts, stt
+from app.service.resample import get_filter
+from app.service.stt import get_stt_model
+from app.service.tts import WARMUP_TEXT, KokoroTTSOptions, get_tts_model
+from app.service.vad import get_vad_model
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")  # Load models before /ready passes
+TTS_PRELOAD_PIPELINES = [lang.strip() for lang in os.getenv("TTS_PRELOAD_PIPELINES", "").split(",") if lang.strip()]  # KPipeline languages to load at startup
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def run_stage(app: FastAPI, name: str, fn, *args):
+	start = time.perf_counter()
+	try:
+		result = await asyncio.to_thread(fn, *args)
+	except Exception as e:
+		app.state.startup[name] = {"error": str(e)}
+		logger.error("Startup stage %s failed: %s", name, e, extra={"stage": name, "seconds": round(time.perf_counter() - start, 3)})
+		raise
+	elapsed = time.perf_counter() - start
+	app.state.startup[name] = {"seconds": round(elapsed, 3)}
+	logger.info("Startup stage %s finished", name, extra={"stage": name, "seconds": round(elapsed, 3)})
+	return result
+
+
+def warm_resamplers():
+	# Kokoro renders at 24 kHz and callers mostly stream telephony rates
+	for src, dst in ((24000, 8000), (24000, 16000), (8000, 16000)):
+		get_filter(src, dst)
+
+
+def preload_pipeline(lang: str):
+	get_tts_model("torch").tts(WARMUP_TEXT, KokoroTTSOptions(lang=lang))
 
-app = FastAPI()
+
+async def warm_tts(app: FastAPI):
+	await run_stage(app, "tts", get_tts_model)
+	prewarm_file = os.getenv("TTS_CACHE_PREWARM_FILE")
+	if prewarm_file:
+		count = await run_stage(app, "tts_cache", tts.prewarm_from_file, prewarm_file)
+		logger.info("Prewarmed TTS cache with %d prompts from %s", count, prewarm_file)
+
+
+async def warm_up(app: FastAPI):
+	start = time.perf_counter()
+	stages = [
+		warm_tts(app),
+		run_stage(app, "stt", get_stt_model, stt.STT_REPO),
+		run_stage(app, "vad", get_vad_model, stt.STT_VAD_MODEL),
+		run_stage(app, "resample", warm_resamplers),
+	]
+	stages += [
+		run_stage(app, f"pipeline:{lang}", preload_pipeline, lang)
+		for lang in TTS_PRELOAD_PIPELINES
+	]
+	results = await asyncio.gather(*stages, return_exceptions=True)
+	app.state.ready = not any(isinstance(r, BaseException) for r in results)
+	logger.info("Startup warmup %s", "finished" if app.state.ready else "failed", extra={"seconds": round(time.perf_counter() - start, 3)})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	app.state.startup = {}
+	app.state.ready = not WARMUP_ON_STARTUP
+	# Warm up in the background so /ready can answer 503 in the meantime
+	warmup = asyncio.create_task(warm_up(app)) if WARMUP_ON_STARTUP else None
+	yield
+	if warmup is not None:
+		warmup.cancel()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TracingMiddleware, api_key=API_KEY)
 
 @app.get("/")
 def root():
 	return {"message": "Welcome to the Voice Models API"}
+
+@app.get("/ready")
+def ready(response: Response):
+	is_ready = getattr(app.state, "ready", False)
+	if not is_ready:
+		response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+	return {"ready": is_ready, "stages": getattr(app.state, "startup", {})}
+
+@app.get("/metrics")
+def metrics_endpoint():
+	return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 app.include_router(tts.router, prefix="/tts", tags=["TTS"])
 app.include_router(stt.router, prefix="/stt", tags=["STT"])
@@ -0,0 +1,273 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Recording is a lock and a few additions, cheap enough for every audio chunk.
+Gauges that summarize live state (sessions, buffered audio, queue depth) can
+be computed by a function at scrape time instead of being updated on the hot
+path.
+"""
+import abc
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+# Seconds, from sub-millisecond DSP up to long syntheses
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A new series, for one combination of label values."""
+
+    def labels(self, *values: str):
+        """The series for ``values``, created on first use."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """(name suffix, label names, label values, value) of every sample to render."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", self.labelnames, values, child.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Callable[[], float] | None = None
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the (unlabelled) value when metrics are scraped."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            yield "", (), (), float(self._function())
+            return
+        for values, child in list(self._children.items()):
+            yield "", self.labelnames, values, child.value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        names = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", names, values + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, values, total
+            yield "_count", self.labelnames, values, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STT_INFERENCE_SECONDS = REGISTRY.histogram(
+    "stt_inference_seconds", "Moonshine generate time per call.", ("mode",)
+)
+STT_BATCH_SIZE = REGISTRY.histogram(
+    "stt_batch_size", "Utterances decoded together by the batching scheduler.", buckets=SIZE_BUCKETS
+)
+STT_CHUNK_SECONDS = REGISTRY.histogram(
+    "stt_chunk_processing_seconds", "Time from receiving an STT audio message to having its result, queueing included."
+)
+TTS_FIRST_AUDIO_SECONDS = REGISTRY.histogram(
+    "tts_time_to_first_audio_seconds", "Time from a streamed TTS request to its first audio.", ("endpoint",)
+)
+TTS_SYNTHESIS_SECONDS = REGISTRY.histogram(
+    "tts_synthesis_seconds", "Total time to synthesize a TTS request.", ("endpoint",)
+)
+RESAMPLE_SECONDS = REGISTRY.histogram("resample_seconds", "Time spent in each resampling call.")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "inference_queue_wait_seconds", "Time jobs wait in the inference queue before a worker picks them up."
+)
+ACTIVE_SESSIONS = REGISTRY.gauge(
+    "websocket_sessions_active", "Open WebSocket sessions.", ("endpoint",)
+)
+BUFFERED_AUDIO_SECONDS = REGISTRY.gauge(
+    "stt_buffered_audio_seconds", "Audio buffered across STT sessions waiting for end of speech."
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "inference_queue_depth", "Jobs waiting in the inference queue.", ("priority",)
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected", "Requests, sessions and jobs turned away by admission control.", ("endpoint", "reason")
+)
+TTS_CACHE_LOOKUPS = REGISTRY.counter(
+    "tts_cache_lookups", "Synthesis cache lookups by the tier that served them, or miss.", ("tier",)
+)
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped", "Log records dropped because the log queue was full."
+)
@@ -1,10 +1,24 @@
+from typing import Literal, get_args
+
 from pydantic import BaseModel
 
+# Output rates TTS can be resampled to, each one needs its own cached filter
+OutputSampleRate = Literal[8000, 16000, 22050, 24000, 44100, 48000]
+OUTPUT_SAMPLE_RATES: tuple[int, ...] = get_args(OutputSampleRate)
+
 class TTSRequest(BaseModel):
     language: str = "en-US"
     voice: str = "af_heart"
     type: str = "text"
     text: str
+    stream: bool = False
+    format: Literal["wav", "pcm_s16le", "mulaw", "alaw", "float32"] = "wav"
+    sample_rate: OutputSampleRate | None = None
+    engine: Literal["onnx", "torch"] | None = None
+
+class TTSBatchRequest(BaseModel):
+    items: list[TTSRequest]
+    output: Literal["ndjson", "zip"] = "ndjson"
 
 class TTSResponse(BaseModel):
     audio: bytes
@@ -0,0 +1,162 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from numpy.typing import NDArray
+
+from app.metrics import STT_BATCH_SIZE
+from app.service.executor import Priority
+from app.service.pool import ModelPool
+from app.service.stt import MoonshineSTT, STTModel
+from app.tracing import add_span
+from app.utils import current_context
+
+# Sample rate, audio, result, caller's context, submit time
+_Pending = tuple[int, NDArray, Future, contextvars.Context, float]
+
+
+class BatchingSTT(STTModel):
+    """
+    Dynamic micro-batching front end for ``MoonshineSTT``.
+
+    ``stt`` may be called from any number of threads (the inference executor,
+    ``stt_for_chunks``). A scheduler thread takes the first pending utterance,
+    waits at most ``max_wait`` seconds for others to arrive, groups them into
+    length buckets whose longest member is at most ``max_pad_ratio`` times the
+    shortest, and runs each bucket through ``MoonshineSTT.stt_batch``. Each
+    caller blocks until its own transcription is routed back.
+
+    Given a ``ModelPool`` there is one scheduler per model, so batches run on
+    every session at once; with ``max_batch_size=1`` this is a plain
+    dispatcher over the pool.
+
+    ``submit`` takes a ``Priority``: a batch starts with the oldest utterance
+    of the most urgent class and is filled the same way, so segments of a
+    long upload (``Priority.BATCH``) never delay live finals by more than the
+    batch already running. Callers that do not want to hold a thread while
+    the batch forms keep the returned future instead of calling ``stt``.
+
+    A batch runs in the context of its first traced caller, so that caller's
+    trace shows the model spans; every traced caller gets a ``batch_wait``
+    span for the time its utterance waited to be scheduled.
+    """
+
+    def __init__(
+        self,
+        model: MoonshineSTT | ModelPool[MoonshineSTT],
+        max_batch_size: int = 8,
+        max_wait: float = 0.02,
+        max_pad_ratio: float = 1.5,
+    ):
+        self.pool = model if isinstance(model, ModelPool) else ModelPool([model])
+        self.model = self.pool.models[0]
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_pad_ratio = max_pad_ratio
+        self._lanes: dict[Priority, deque[_Pending]] = {priority: deque() for priority in Priority}
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"stt-batcher-{i}", daemon=True)
+            for i in range(len(self.pool))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stt(self, audio: tuple[int, NDArray[np.int16 | np.float32]]) -> str:
+        return self.submit(audio).result()
+
+    def stt_batch(
+        self, audios: list[tuple[int, NDArray[np.int16 | np.float32]]]
+    ) -> list[str]:
+        futures = [self.submit(audio) for audio in audios]
+        return [f.result() for f in futures]
+
+    def submit(
+        self,
+        audio: tuple[int, NDArray[np.int16 | np.float32]],
+        priority: Priority = Priority.STT,
+    ) -> Future:
+        """Queue an utterance and return the future of its transcription."""
+        sr, audio_np = audio
+        future: Future = Future()
+        with self._cond:
+            self._lanes[priority].append(
+                (sr, audio_np, future, contextvars.copy_context(), time.perf_counter())
+            )
+            self._cond.notify()
+        return future
+
+    def _take(self) -> _Pending | None:
+        # Called with the condition held
+        for lane in self._lanes.values():
+            if lane:
+                return lane.popleft()
+        return None
+
+    def _collect(self) -> list[_Pending]:
+        with self._cond:
+            while (first := self._take()) is None:
+                self._cond.wait()
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                item = self._take()
+                if item is not None:
+                    batch.append(item)
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+        return batch
+
+    def _buckets(
+        self, batch: list[_Pending]
+    ) -> list[list[_Pending]]:
+        # Compare durations rather than sample counts, callers may use different rates
+        batch = sorted(batch, key=lambda item: len(item[1]) / item[0])
+        buckets: list[list[_Pending]] = []
+        for item in batch:
+            duration = len(item[1]) / item[0]
+            if buckets:
+                first_sr, first_audio, *_ = buckets[-1][0]
+                shortest = max(len(first_audio) / first_sr, 1e-3)
+                if duration <= shortest * self.max_pad_ratio:
+                    buckets[-1].append(item)
+                    continue
+            buckets.append([item])
+        return buckets
+
+    def _run(self) -> None:
+        while True:
+            # Callers may have given up on queued utterances, e.g. a failed upload
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            for bucket in self._buckets(batch):
+                STT_BATCH_SIZE.observe(len(bucket))
+                started = time.perf_counter()
+                traced = []
+                for _, _, _, context, submitted in bucket:
+                    if _is_traced(context):
+                        context.run(add_span, "batch_wait", submitted, started, batch=len(bucket))
+                        traced.append(context)
+                audios = [(sr, a) for sr, a, *_ in bucket]
+                try:
+                    with self.pool.lease() as model:
+                        if traced:
+                            texts = traced[0].run(model.stt_batch, audios)
+                        else:
+                            texts = model.stt_batch(audios)
+                except Exception as e:
+                    for _, _, future, *_ in bucket:
+                        future.set_exception(e)
+                else:
+                    for (_, _, future, *_), text in zip(bucket, texts):
+                        future.set_result(text)
+
+
+def _is_traced(context: contextvars.Context) -> bool:
+    request = context.get(current_context)
+    return request is not None and request.trace is not None
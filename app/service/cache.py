@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Generic, TypeVar
+
+from app.metrics import TTS_CACHE_LOOKUPS
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe least-recently-used cache bounded by the total size of its values.
+
+    ``sizeof`` gives the cost of a value in bytes; entries are evicted from the
+    cold end until the new value fits. A value larger than ``max_bytes`` is
+    not stored at all.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[V], int] = len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[K, tuple[V, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def get(self, key: K, count_miss: bool = True) -> V | None:
+        """The value for ``key``; ``count_miss=False`` for callers with a fallback that count their own."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: K, value: V) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            while self._entries and self.nbytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (value, size)
+            self.nbytes += size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+@dataclass(frozen=True)
+class CachedAudio:
+    sample_rate: int
+    content: bytes
+
+
+def synthesis_key(
+    text: str,
+    voice: str,
+    speed: float,
+    lang: str,
+    fmt: str,
+    sample_rate: int | None,
+    engine: str = "onnx",
+    streamed: bool = False,
+) -> str:
+    """
+    Content address of a rendered prompt; whitespace differences do not change it.
+
+    Streamed and buffered renders get different keys: resampled streams go
+    through the streaming filter, so they are not byte-identical to a
+    buffered render of the same prompt.
+    """
+    normalized = " ".join(text.split())
+    payload = json.dumps(
+        [normalized, voice, speed, lang.lower(), fmt, sample_rate, engine, streamed]
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SynthesisCache:
+    """
+    Rendered TTS responses, keyed by ``synthesis_key``.
+
+    Hot entries live in a byte-bounded in-memory LRU. With ``directory`` set,
+    every entry is also written there and misses fall back to reading that
+    file, so the cache survives restarts and is shared between workers on the
+    same host. The directory is kept under ``max_disk_bytes`` (0 = unbounded)
+    by deleting the least recently read files.
+
+    ``hits`` and ``disk_hits`` count lookups served by each tier and
+    ``misses`` those served by neither.
+    """
+
+    def __init__(self, max_bytes: int, directory: str | None = None, max_disk_bytes: int = 0):
+        self.memory: LRUCache[str, CachedAudio] = LRUCache(
+            max_bytes, sizeof=lambda entry: len(entry.content)
+        )
+        self.directory = Path(directory) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self.misses = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.disk_evictions = 0
+        self.disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def _disk_entries(self) -> list[tuple[float, Path, int]]:
+        """(last read, path, size) of every finished file, least recently read first."""
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, path, st.st_size))
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def _trim_disk(self) -> None:
+        # Rescan rather than trust the running total, other workers share the directory
+        with self._disk_lock:
+            entries = self._disk_entries()
+            total = sum(size for _, _, size in entries)
+            for _, path, size in entries:
+                if total <= self.max_disk_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                self.disk_evictions += 1
+            self.disk_bytes = total
+
+    def get(self, key: str) -> CachedAudio | None:
+        entry = self.memory.get(key, count_miss=False)
+        if entry is not None:
+            TTS_CACHE_LOOKUPS.labels("memory").inc()
+            return entry
+        entry = self._read_disk(key) if self.directory else None
+        with self._disk_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        TTS_CACHE_LOOKUPS.labels("miss" if entry is None else "disk").inc()
+        if entry is not None:
+            self.memory.put(key, entry)
+        return entry
+
+    def _read_disk(self, key: str) -> CachedAudio | None:
+        path = self.directory / key
+        try:
+            with open(path, "rb") as f:
+                header = f.read(4)
+                content = f.read()
+            # Mark it recently used for the disk eviction order
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        if len(header) < 4:
+            return None
+        return CachedAudio(int.from_bytes(header, "little"), content)
+
+    def put(self, key: str, entry: CachedAudio) -> None:
+        self.memory.put(key, entry)
+        if self.directory is None:
+            return
+        path = self.directory / key
+        if path.exists():
+            return
+        # Write then rename so a concurrent reader never sees a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(entry.sample_rate.to_bytes(4, "little") + entry.content)
+        os.replace(tmp, path)
+        with self._disk_lock:
+            self.disk_writes += 1
+            self.disk_bytes += 4 + len(entry.content)
+            over = self.max_disk_bytes > 0 and self.disk_bytes > self.max_disk_bytes
+        if over:
+            self._trim_disk()
+
+    def stats(self) -> dict[str, int | str | None]:
+        return {
+            **self.memory.stats(),
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "disk_writes": self.disk_writes,
+            "disk_bytes": self.disk_bytes,
+            "max_disk_bytes": self.max_disk_bytes,
+            "disk_evictions": self.disk_evictions,
+            "directory": str(self.directory) if self.directory else None,
+        }
+
+
+@lru_cache
+def get_synthesis_cache() -> SynthesisCache | None:
+    max_mb = float(os.getenv("TTS_CACHE_MAX_MB", 256))
+    if max_mb <= 0:
+        return None
+    max_disk_mb = float(os.getenv("TTS_CACHE_DIR_MAX_MB", 2048))
+    return SynthesisCache(
+        int(max_mb * 1024 * 1024),
+        os.getenv("TTS_CACHE_DIR") or None,
+        int(max(max_disk_mb, 0) * 1024 * 1024),
+    )
@@ -0,0 +1,203 @@
+import struct
+from typing import Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+from app.service.resample import StreamingResampler, resample
+from app.utils import audio_to_float32, audio_to_int16, wav_header
+
+AudioFormat = Literal["wav", "pcm_s16le", "mulaw", "alaw", "float32"]
+IngressEncoding = Literal["linear16", "mulaw", "alaw", "float32"]
+
+INGRESS_ENCODINGS: dict[str, np.dtype] = {
+    "linear16": np.dtype("<i2"),
+    "mulaw": np.dtype(np.uint8),
+    "alaw": np.dtype(np.uint8),
+    "float32": np.dtype("<f4"),
+}
+
+# Optional header of binary STT frames: sequence number, timestamp in samples
+FRAME_HEADER = struct.Struct("<II")
+
+MEDIA_TYPES: dict[str, str] = {
+    "wav": "audio/wav",
+    "pcm_s16le": "application/octet-stream",
+    "mulaw": "audio/basic",
+    "alaw": "audio/x-alaw-basic",
+    "float32": "application/octet-stream",
+}
+
+SAMPLE_WIDTHS: dict[str, int] = {"wav": 2, "pcm_s16le": 2, "mulaw": 1, "alaw": 1, "float32": 4}
+
+FILE_EXTENSIONS: dict[str, str] = {
+    "wav": "wav",
+    "pcm_s16le": "pcm",
+    "mulaw": "ulaw",
+    "alaw": "alaw",
+    "float32": "f32",
+}
+
+
+def audio_duration(content: bytes, fmt: AudioFormat, sample_rate: int) -> float:
+    """Seconds of audio in an encoded buffer as returned by ``encode_file``."""
+    size = len(content) - (44 if fmt == "wav" else 0)
+    return max(size, 0) / SAMPLE_WIDTHS[fmt] / sample_rate
+
+
+def _segment(values: NDArray[np.int32], ends: list[int]) -> NDArray[np.int64]:
+    # Index of the first segment whose end is >= value, as in the G.711 reference search()
+    return np.searchsorted(np.array(ends), values, side="left")
+
+
+def _mulaw_encode_table() -> NDArray[np.uint8]:
+    """G.711 mu-law code for every int16 value, indexed by the value viewed as uint16."""
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), 8159) + 0x21
+    seg = _segment(pcm, [0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+    code = np.where(seg >= 8, 0x7F, (seg << 4) | ((pcm >> (seg + 1)) & 0xF))
+    return (code ^ mask).astype(np.uint8)
+
+
+def _alaw_encode_table() -> NDArray[np.uint8]:
+    """G.711 A-law code for every int16 value, indexed by the value viewed as uint16."""
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = _segment(pcm, [0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+    shift = np.where(seg < 2, 1, seg)
+    code = np.where(seg >= 8, 0x7F, (np.minimum(seg, 7) << 4) | ((pcm >> shift) & 0xF))
+    return (code ^ mask).astype(np.uint8)
+
+
+def _mulaw_decode_table() -> NDArray[np.int16]:
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    t = (((u & 0x0F) << 3) + 0x84) << ((u & 0x70) >> 4)
+    return np.where(u & 0x80, 0x84 - t, t - 0x84).astype(np.int16)
+
+
+def _alaw_decode_table() -> NDArray[np.int16]:
+    a = np.arange(256, dtype=np.int32) ^ 0x55
+    seg = (a & 0x70) >> 4
+    t = (a & 0x0F) << 4
+    t = np.where(seg == 0, t + 8, (t + 0x108) << np.maximum(seg - 1, 0))
+    return np.where(a & 0x80, t, -t).astype(np.int16)
+
+
+MULAW_ENCODE = _mulaw_encode_table()
+ALAW_ENCODE = _alaw_encode_table()
+MULAW_DECODE = _mulaw_decode_table()
+ALAW_DECODE = _alaw_decode_table()
+
+
+def encode_audio(audio: NDArray[np.int16 | np.float32], fmt: AudioFormat) -> bytes:
+    """Encode samples as headerless bytes in ``fmt`` (a WAV header is the caller's job)."""
+    if fmt == "float32":
+        return audio_to_float32(audio).astype("<f4", copy=False).tobytes()
+    if audio.dtype == np.float32:
+        # Resampling and synthesis can overshoot full scale slightly
+        audio = np.clip(audio, -1.0, 1.0)
+    pcm = audio_to_int16(audio)
+    if fmt == "mulaw":
+        return MULAW_ENCODE[pcm.view(np.uint16)].tobytes()
+    if fmt == "alaw":
+        return ALAW_ENCODE[pcm.view(np.uint16)].tobytes()
+    return pcm.astype("<i2", copy=False).tobytes()
+
+
+def encode_file(
+    audio: NDArray[np.int16 | np.float32],
+    sample_rate: int,
+    fmt: AudioFormat = "wav",
+    target_rate: int | None = None,
+) -> tuple[bytes, int]:
+    """Resample a whole signal if needed and encode it, with a WAV header for ``wav``."""
+    target_rate = target_rate or sample_rate
+    audio = resample(audio, sample_rate, target_rate)
+    body = encode_audio(audio, fmt)
+    if fmt == "wav":
+        body = wav_header(target_rate, len(audio)) + body
+    return body, target_rate
+
+
+class AudioEncoder:
+    """Incremental counterpart of ``encode_file`` for streamed audio."""
+
+    def __init__(
+        self, fmt: AudioFormat, sample_rate: int, target_rate: int | None = None
+    ):
+        self.format = fmt
+        self.sample_rate = target_rate or sample_rate
+        self._resampler = StreamingResampler(sample_rate, self.sample_rate)
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def header(self) -> bytes:
+        return wav_header(self.sample_rate) if self.format == "wav" else b""
+
+    def encode(self, audio: NDArray[np.int16 | np.float32]) -> bytes:
+        return encode_audio(self._resampler.process(audio), self.format)
+
+    def flush(self) -> bytes:
+        return encode_audio(self._resampler.flush(), self.format)
+
+
+def decoded_length(data: bytes, encoding: IngressEncoding) -> int:
+    return len(data) // INGRESS_ENCODINGS[encoding].itemsize
+
+
+def decode_audio(
+    data: bytes, encoding: IngressEncoding, out: NDArray[np.int16] | None = None
+) -> NDArray[np.int16]:
+    """
+    Decode a binary frame to int16 samples, into ``out`` if given.
+
+    G.711 codes go through the 256-entry tables, so every encoding is a single
+    vectorized pass over the frame.
+    """
+    samples = np.frombuffer(data, dtype=INGRESS_ENCODINGS[encoding])
+    if encoding == "mulaw":
+        return np.take(MULAW_DECODE, samples, out=out)
+    if encoding == "alaw":
+        return np.take(ALAW_DECODE, samples, out=out)
+    if encoding == "float32":
+        if out is None:
+            out = np.empty(len(samples), dtype=np.int16)
+        np.multiply(np.clip(samples, -1.0, 1.0), 32767.0, out=out, casting="unsafe")
+        return out
+    if out is None:
+        return samples
+    out[:] = samples
+    return out
+
+
+class FrameSequence:
+    """
+    Follow the sequence numbers and timestamps of headered STT frames.
+
+    ``check`` returns the number of frames lost before a frame and the
+    samples of silence (at most ``max_gap``) that cover them, or None for a
+    frame that arrived late or twice and should be dropped. Both counters wrap
+    around at 2**32, as in RTP.
+    """
+
+    def __init__(self, max_gap: int):
+        self.max_gap = max_gap
+        self.next_seq: int | None = None
+        self.next_timestamp: int | None = None
+
+    def check(self, seq: int, timestamp: int, n_samples: int) -> tuple[int, int] | None:
+        lost = gap = 0
+        if self.next_seq is not None:
+            lost = (seq - self.next_seq) & 0xFFFFFFFF
+            if lost >= 1 << 31:
+                return None
+            if lost:
+                gap = (timestamp - self.next_timestamp) & 0xFFFFFFFF
+                gap = min(gap, self.max_gap) if gap < 1 << 31 else 0
+        self.next_seq = (seq + 1) & 0xFFFFFFFF
+        self.next_timestamp = (timestamp + n_samples) & 0xFFFFFFFF
+        return lost, gap
@@ -0,0 +1,243 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, TypeVar
+
+from app.metrics import QUEUE_DEPTH, QUEUE_WAIT_SECONDS
+from app.tracing import add_span, span
+
+R = TypeVar("R")
+
+
+class Priority(IntEnum):
+    """Job classes of the inference queue, lower values are served first."""
+
+    STT = 0  # live STT sessions
+    FIRST_AUDIO = 1  # the first sentence of a streamed TTS request
+    TTS = 2  # streamed and on-demand TTS
+    BATCH = 3  # /tts/batch, cache prewarming and file transcription
+
+
+# Class of the jobs a request submits, set by the endpoint and read wherever
+# model code submits work without knowing who asked for it
+inference_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "inference_priority", default=Priority.TTS
+)
+
+
+class InferenceQueueFull(RuntimeError):
+    """Raised when a job is submitted while the inference queue is at capacity."""
+
+
+class LoadShed(InferenceQueueFull):
+    """Raised when a job would wait in the queue longer than its class's SLO."""
+
+    def __init__(self, message: str, wait: float):
+        super().__init__(message)
+        self.wait = wait
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for blocking model inference.
+
+    Jobs are queued and picked up by ``max_workers`` daemon threads, so the
+    event loop never runs ONNX inference itself. Submitting while the queue
+    already holds ``max_queue_size`` waiting jobs raises ``InferenceQueueFull``
+    immediately instead of piling up latency.
+
+    Each job has a ``Priority`` and a free worker always takes the oldest job
+    of the most urgent class that has a slot. TTS jobs occupy at most
+    ``tts_workers`` of the threads and batch jobs at most ``batch_workers``,
+    so a burst of synthesis cannot take the workers live STT needs and a long
+    batch job cannot take the slots of interactive TTS. When ``slo`` gives a
+    class a wait budget in seconds, a job whose estimated queue wait exceeds
+    it raises ``LoadShed`` instead of being queued.
+
+    Ordering is per caller: a session that awaits each ``submit`` before the
+    next one gets its jobs executed strictly in order.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_queue_size: int,
+        tts_workers: int | None = None,
+        slo: dict[Priority, float] | None = None,
+        batch_workers: int | None = None,
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.tts_workers = max_workers if tts_workers is None else min(max(tts_workers, 1), max_workers)
+        self.batch_workers = (
+            self.tts_workers if batch_workers is None else min(max(batch_workers, 1), max_workers)
+        )
+        self.slo = slo or {}
+        self._lanes: dict[Priority, deque] = {priority: deque() for priority in Priority}
+        self._queued = 0
+        # Running jobs of the capped classes, by the priority that counts against each cap
+        self._running = {Priority.TTS: 0, Priority.BATCH: 0}
+        # Moving average of the seconds a job of each class keeps a worker busy
+        self._service_seconds = dict.fromkeys(Priority, 0.0)
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(
+                target=self._worker, name=f"inference-{i}", daemon=True
+            )
+            for i in range(max_workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def _estimated_wait(self, priority: Priority) -> float:
+        # Called with the condition held. Jobs of lower classes do not delay this one.
+        lanes, service = self._lanes, self._service_seconds
+        wait = len(lanes[Priority.STT]) * service[Priority.STT] / self.max_workers
+        if priority == Priority.BATCH:
+            wait += len(lanes[Priority.BATCH]) * service[Priority.BATCH] / self.batch_workers
+        elif priority != Priority.STT:
+            wait += sum(
+                len(lanes[p]) * service[p] for p in (Priority.FIRST_AUDIO, Priority.TTS) if p <= priority
+            ) / self.tts_workers
+        return wait
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """Seconds a job of ``priority`` submitted now would wait for a worker, roughly."""
+        with self._cond:
+            return self._estimated_wait(priority)
+
+    def _check(self, priority: Priority) -> None:
+        # Called with the condition held
+        slo = self.slo.get(priority)
+        if slo:
+            wait = self._estimated_wait(priority)
+            if wait > slo:
+                raise LoadShed(
+                    f"Inference queue wait of {wait:.2f}s exceeds the "
+                    f"{slo:.2f}s budget for {priority.name} jobs",
+                    wait,
+                )
+
+    def check(self, priority: Priority) -> None:
+        """Raise ``LoadShed`` if a job of ``priority`` would currently be shed."""
+        with self._cond:
+            self._check(priority)
+
+    def _put(self, priority: Priority, job: tuple) -> None:
+        with self._cond:
+            if 0 < self.max_queue_size <= self._queued:
+                raise InferenceQueueFull(
+                    f"Inference queue is full ({self.max_queue_size} jobs waiting)"
+                )
+            self._check(priority)
+            self._lanes[priority].append(job)
+            self._queued += 1
+            QUEUE_DEPTH.labels(priority.name.lower()).inc()
+            self._cond.notify()
+
+    async def submit(self, fn: Callable[..., R], *args: Any, priority: Priority | None = None) -> R:
+        """Run ``fn(*args)`` on a worker, as ``priority`` or the request's ``inference_priority``."""
+        # wrap_future marshals the result onto the loop (and drops it if the loop
+        # has closed), and cancelling the await cancels the job if it has not started
+        return await asyncio.wrap_future(self.submit_future(fn, *args, priority=priority))
+
+    def submit_future(self, fn: Callable[..., R], *args: Any, priority: Priority | None = None) -> Future:
+        """Like ``submit``, for threads without an event loop. Cancelling the future drops the job if it has not started."""
+        future: Future = Future()
+        # Run in the caller's context so session ids and traces follow the job
+        self._put(
+            inference_priority.get() if priority is None else priority,
+            (time.perf_counter(), contextvars.copy_context(), future, fn, args),
+        )
+        return future
+
+    def _cap(self, priority: Priority) -> Priority | None:
+        """The class whose worker limit a job of ``priority`` counts against, None for STT."""
+        if priority == Priority.STT:
+            return None
+        return Priority.BATCH if priority == Priority.BATCH else Priority.TTS
+
+    def _limit(self, cap: Priority) -> int:
+        return self.batch_workers if cap == Priority.BATCH else self.tts_workers
+
+    def _next_job(self) -> tuple[Priority, tuple]:
+        with self._cond:
+            while True:
+                for priority, lane in self._lanes.items():
+                    if not lane:
+                        continue
+                    cap = self._cap(priority)
+                    if cap is not None:
+                        if self._running[cap] >= self._limit(cap):
+                            # TTS jobs wait for TTS slots, batch jobs may still have theirs
+                            continue
+                        self._running[cap] += 1
+                    self._queued -= 1
+                    QUEUE_DEPTH.labels(priority.name.lower()).dec()
+                    return priority, lane.popleft()
+                self._cond.wait()
+
+    def _job_done(self, priority: Priority, seconds: float | None) -> None:
+        with self._cond:
+            cap = self._cap(priority)
+            if cap is not None:
+                self._running[cap] -= 1
+                # A job of the same class may have been waiting for this slot
+                self._cond.notify()
+            if seconds is not None:
+                average = self._service_seconds[priority]
+                self._service_seconds[priority] = seconds if not average else average + 0.2 * (seconds - average)
+
+    def _worker(self) -> None:
+        while True:
+            priority, (enqueued, context, future, fn, args) = self._next_job()
+            started = time.perf_counter()
+            QUEUE_WAIT_SECONDS.observe(started - enqueued)
+            # Thread-safe, and once running the job can no longer be cancelled
+            if not future.set_running_or_notify_cancel():
+                self._job_done(priority, None)
+                continue
+            try:
+                result = context.run(_run_job, enqueued, started, fn, args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self._job_done(priority, time.perf_counter() - started)
+
+
+def _run_job(enqueued: float, started: float, fn: Callable[..., R], args: tuple) -> R:
+    add_span("queue_wait", enqueued, started)
+    with span(getattr(fn, "__name__", "job")):
+        return fn(*args)
+
+
+@lru_cache
+def get_inference_executor() -> InferenceExecutor:
+    max_workers = int(os.getenv("INFERENCE_WORKERS", os.cpu_count() or 1))
+    max_queue_size = int(os.getenv("INFERENCE_QUEUE_SIZE", 64))
+    # Synthesis past the TTS pool size would only block workers waiting for a session
+    tts_workers = int(os.getenv("INFERENCE_TTS_WORKERS", os.getenv("TTS_POOL_SIZE", 1)))
+    # Batch TTS renders past the TTS pool size wait for a session, batch STT goes to the batcher
+    batch_workers = int(os.getenv("INFERENCE_BATCH_WORKERS", tts_workers))
+    slo = {
+        Priority.STT: float(os.getenv("INFERENCE_SLO_STT_MS", 1000)) / 1000,
+        Priority.TTS: float(os.getenv("INFERENCE_SLO_TTS_MS", 2000)) / 1000,
+        Priority.FIRST_AUDIO: float(os.getenv("INFERENCE_SLO_TTS_MS", 2000)) / 1000,
+        Priority.BATCH: float(os.getenv("INFERENCE_SLO_BATCH_MS", 0)) / 1000,
+    }
+    return InferenceExecutor(max_workers, max_queue_size, tts_workers, slo, batch_workers)
@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Generic, Literal, TypeVar
+
+M = TypeVar("M")
+
+GraphOptimization = Literal["disable", "basic", "extended", "all"]
+
+
+@dataclass
+class SessionConfig:
+    intra_op_threads: int = 0
+    """Threads per session for a single operator, ``0`` splits the cores evenly between sessions."""
+    inter_op_threads: int = 1
+    """Threads per session for independent operators, only used by parallel execution mode."""
+    graph_optimization: GraphOptimization = "all"
+    pin_cores: bool = False
+    """Give every session its own block of cores instead of letting the OS schedule them."""
+
+    @classmethod
+    def from_env(cls) -> "SessionConfig":
+        return cls(
+            intra_op_threads=int(os.getenv("ORT_INTRA_OP_THREADS", 0)),
+            inter_op_threads=int(os.getenv("ORT_INTER_OP_THREADS", 1)),
+            graph_optimization=os.getenv("ORT_GRAPH_OPTIMIZATION", "all").lower(),  # type: ignore[arg-type]
+            pin_cores=os.getenv("ORT_PIN_CORES", "").lower() in ("1", "true", "yes"),
+        )
+
+    def threads_per_session(self, sessions: int) -> int:
+        if self.intra_op_threads > 0:
+            return self.intra_op_threads
+        return max((os.cpu_count() or 1) // max(sessions, 1), 1)
+
+    def session_options(self, threads: int, cores: list[int] | None = None) -> Any:
+        import onnxruntime
+
+        levels = {
+            "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }
+        if self.graph_optimization not in levels:
+            raise ValueError(
+                f"Unknown graph optimization level {self.graph_optimization!r}, "
+                f"expected one of {', '.join(levels)}"
+            )
+        opts = onnxruntime.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = self.inter_op_threads
+        opts.graph_optimization_level = levels[self.graph_optimization]
+        if cores and threads > 1:
+            # One entry per extra intra-op thread; the calling thread is pinned on lease
+            opts.add_session_config_entry(
+                "session.intra_op_thread_affinities",
+                ";".join(str(core + 1) for core in cores[1:threads]),
+            )
+        return opts
+
+
+_core_lock = threading.Lock()
+_next_core = 0
+
+
+def allocate_cores(count: int) -> list[int]:
+    """Reserve the next ``count`` cores, wrapping around when the box is oversubscribed."""
+    global _next_core
+    total = os.cpu_count() or 1
+    with _core_lock:
+        cores = [(_next_core + i) % total for i in range(count)]
+        _next_core = (_next_core + count) % total
+    return cores
+
+
+class ModelPool(Generic[M]):
+    """
+    A fixed set of model instances leased to one caller at a time.
+
+    ONNX Runtime sessions are thread-safe, but two runs on one session split
+    its intra-op threads between them. Leasing whole instances lets each
+    request run on a session sized for it; callers block in ``lease`` until
+    one is free. Instances built with ``cores`` get the calling thread pinned
+    to the first of them for the duration of the lease.
+    """
+
+    def __init__(self, models: list[M], cores: list[list[int] | None] | None = None):
+        if not models:
+            raise ValueError("A model pool needs at least one model")
+        self.models = models
+        self._cores = cores or [None] * len(models)
+        self._free: queue.Queue[int] = queue.Queue()
+        for i in range(len(models)):
+            self._free.put(i)
+        self.leases = 0
+        self.wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        factory: Callable[[Any, list[int] | None], M],
+        size: int,
+        config: SessionConfig | None = None,
+    ) -> "ModelPool[M]":
+        """Create ``size`` models, passing each its session options and reserved cores."""
+        config = config or SessionConfig.from_env()
+        size = max(size, 1)
+        threads = config.threads_per_session(size)
+        models, cores = [], []
+        for _ in range(size):
+            reserved = allocate_cores(threads) if config.pin_cores else None
+            models.append(factory(config.session_options(threads, reserved), reserved))
+            cores.append(reserved)
+        return cls(models, cores)
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    @property
+    def available(self) -> int:
+        return self._free.qsize()
+
+    @contextmanager
+    def lease(self) -> Iterator[M]:
+        start = time.perf_counter()
+        index = self._free.get()
+        with self._stats_lock:
+            self.wait_seconds += time.perf_counter() - start
+            self.leases += 1
+        cores = self._cores[index]
+        previous = None
+        if cores and hasattr(os, "sched_setaffinity"):
+            previous = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, cores[:1])
+        try:
+            yield self.models[index]
+        finally:
+            if previous is not None:
+                os.sched_setaffinity(0, previous)
+            self._free.put(index)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "size": len(self.models),
+            "available": self.available,
+            "leases": self.leases,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
@@ -0,0 +1,191 @@
+import math
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import soxr
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.typing import NDArray
+
+from app.metrics import RESAMPLE_SECONDS
+from app.tracing import add_span, span
+from app.utils import audio_to_float32
+
+MAX_PHASES = 1024  # rate pairs needing more filter phases than this are refused
+
+
+@dataclass(frozen=True)
+class PolyphaseFilter:
+    """
+    Kaiser-windowed sinc low-pass split into ``up`` phases.
+
+    Output sample ``n`` is ``sum_k bank[p, k] * x[b + half_width - k]`` with
+    ``p = n * down % up`` and ``b = n * down // up``, so every output needs
+    ``2 * half_width + 1`` input samples centred on its position and the
+    filter adds no delay.
+    """
+
+    up: int
+    down: int
+    half_width: int
+    bank: NDArray[np.float32]
+
+    def output_length(self, n_samples: int) -> int:
+        return -(-n_samples * self.up // self.down)
+
+    def apply(
+        self, x: NDArray[np.float32], offset: int, start: int, stop: int
+    ) -> NDArray[np.float32]:
+        """Outputs ``start..stop`` computed from ``x``, whose first sample has input index ``offset``."""
+        y = np.zeros(stop - start, dtype=np.float32)
+        # Outputs up samples apart share a phase and advance down input samples
+        for j in range(min(self.up, stop - start)):
+            pos = (start + j) * self.down
+            first = pos // self.up + self.half_width - offset
+            count = len(range(start + j, stop, self.up))
+            taps = self.bank[pos % self.up]
+            if self.up == 1 or self.down == 1:
+                self._convolve(x, first, count, taps, y[j :: self.up])
+            else:
+                windows = sliding_window_view(x, len(taps))
+                low = first - len(taps) + 1
+                y[j :: self.up] = (
+                    windows[low : low + (count - 1) * self.down + 1 : self.down]
+                    @ taps[::-1]
+                )
+        return y
+
+    def _convolve(
+        self,
+        x: NDArray[np.float32],
+        first: int,
+        count: int,
+        taps: NDArray[np.float32],
+        out: NDArray[np.float32],
+    ) -> None:
+        """
+        Accumulate ``out[i] += sum_k taps[k] * x[first + i * down - k]``.
+
+        Splitting the taps by ``k % down`` turns the strided sum into ``down``
+        plain convolutions, which ``np.convolve`` runs in compiled code.
+        """
+        m = self.down
+        for r in range(min(m, len(taps))):
+            sub_taps = taps[r::m]
+            low = first - r - (len(sub_taps) - 1) * m
+            signal = x[low : low + (count + len(sub_taps) - 2) * m + 1 : m]
+            out += np.convolve(signal, sub_taps, mode="valid")
+
+
+@lru_cache(maxsize=32)
+def get_filter(
+    src: int,
+    dst: int,
+    zero_crossings: int = 16,
+    rolloff: float = 0.945,
+    beta: float = 8.6,
+) -> PolyphaseFilter:
+    if src <= 0 or dst <= 0:
+        raise ValueError(f"Sample rates must be positive, got {src} and {dst}")
+    g = math.gcd(src, dst)
+    up, down = dst // g, src // g
+    if up > MAX_PHASES:
+        # e.g. 44101 -> 16000 needs 16000 phases, megabytes of taps and as many passes per call
+        raise ValueError(f"Unsupported rate conversion {src} -> {dst} Hz")
+    half_width = math.ceil(zero_crossings * max(up, down) / up)
+    taps = 2 * half_width * up + 1
+    # Cutoff in cycles per sample of the upsampled signal, below both Nyquist rates
+    cutoff = 0.5 * rolloff / max(up, down)
+    t = np.arange(taps) - half_width * up
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(taps, beta)
+    h = np.concatenate([h, np.zeros(up - 1)])
+    bank = (h.reshape(2 * half_width + 1, up).T * up).astype(np.float32)
+    return PolyphaseFilter(up, down, half_width, bank)
+
+
+def resample(
+    audio: NDArray[np.int16 | np.float32], src: int, dst: int
+) -> NDArray[np.float32]:
+    """
+    Resample a whole signal from ``src`` Hz to ``dst`` Hz.
+
+    Whole utterances and renders go through soxr, which is compiled and 2-3x
+    faster than the polyphase filter on multi-second buffers. The filter is
+    only used by ``StreamingResampler``, where it wins on 20ms frames.
+    """
+    with span("audio_to_float32"):
+        audio = audio_to_float32(audio).reshape(-1)
+    if src == dst:
+        return audio
+    start = time.perf_counter()
+    out = soxr.resample(audio, src, dst)
+    end = time.perf_counter()
+    RESAMPLE_SECONDS.observe(end - start)
+    add_span("resample", start, end, src=src, dst=dst)
+    return out
+
+
+class StreamingResampler:
+    """
+    Resample a signal that arrives in chunks.
+
+    The tail of the previous chunks is carried over, so the output does not
+    depend on how the signal was split into chunks. Each ``process`` call
+    returns the samples that can already be computed, which lag the input by
+    ``half_width`` input samples; ``flush`` returns the rest at end of stream.
+    """
+
+    def __init__(self, src: int, dst: int):
+        self.src = src
+        self.dst = dst
+        self.filter = get_filter(src, dst) if src != dst else None
+        self.reset()
+
+    def reset(self) -> None:
+        r = self.filter.half_width if self.filter else 0
+        # Start with the zero padding that the one-shot path puts before the signal
+        self._buffer = np.zeros(r, dtype=np.float32)
+        self._offset = -r
+        self._consumed = 0
+        self._next = 0
+
+    def process(self, chunk: NDArray[np.int16 | np.float32]) -> NDArray[np.float32]:
+        chunk = audio_to_float32(chunk).reshape(-1)
+        if self.filter is None:
+            return chunk
+        f = self.filter
+        self._buffer = np.concatenate([self._buffer, chunk])
+        self._consumed += len(chunk)
+        # Output n is ready once input n * down // up + half_width has arrived
+        ready = self._consumed - f.half_width
+        stop = max((ready * f.up - 1) // f.down + 1, 0) if ready > 0 else 0
+        return self._emit(stop)
+
+    def flush(self) -> NDArray[np.float32]:
+        if self.filter is None:
+            return np.zeros(0, dtype=np.float32)
+        f = self.filter
+        self._buffer = np.concatenate(
+            [self._buffer, np.zeros(f.half_width, dtype=np.float32)]
+        )
+        out = self._emit(f.output_length(self._consumed))
+        self.reset()
+        return out
+
+    def _emit(self, stop: int) -> NDArray[np.float32]:
+        f = self.filter
+        if stop <= self._next:
+            return np.zeros(0, dtype=np.float32)
+        start = time.perf_counter()
+        out = f.apply(self._buffer, self._offset, self._next, stop)
+        end = time.perf_counter()
+        RESAMPLE_SECONDS.observe(end - start)
+        add_span("resample", start, end, src=self.src, dst=self.dst)
+        self._next = stop
+        # Drop input that no future output reaches back to
+        keep_from = self._next * f.down // f.up - f.half_width
+        drop = max(keep_from - self._offset, 0)
+        self._buffer = self._buffer[drop:]
+        self._offset += drop
+        return out
@@ -1,17 +1,66 @@
 
+import logging
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future
 from functools import lru_cache
 from pathlib import Path
-from typing import Literal, Protocol
+from typing import IO, Any, Literal, Protocol
 
-import click
-import librosa
 import numpy as np
 from numpy.typing import NDArray
 
-from app.utils import AudioChunk, audio_to_float32
+from app.metrics import STT_INFERENCE_SECONDS
+from app.service.executor import Priority, get_inference_executor
+from app.service.pool import ModelPool
+from app.service.resample import StreamingResampler, resample
+from app.tracing import span
+from app.service.vad import SpeechSegmenter, VADModel
+from app.utils import AudioChunk
 
 curr_dir = Path(__file__).parent
 
+logger = logging.getLogger(__name__)
+
+
+# Decoder cache shapes (layers, key/value heads, head size), as set by MoonshineOnnxModel
+_MOONSHINE_DECODER_SHAPES = {"tiny": (6, 8, 36), "base": (8, 8, 52)}
+
+
+def _load_moonshine(model_name: str, session_options: Any = None) -> Any:
+    """
+    ``MoonshineOnnxModel(model_name=...)`` with its sessions built from
+    ``session_options``. The upstream constructor always uses the defaults,
+    so with options this mirrors it instead of loading every graph twice.
+    It relies on the private weight loader of moonshine_onnx; a release
+    without it gets the public constructor and default session options.
+    """
+    name = model_name.split("/")[-1] if isinstance(model_name, str) else None
+    if name not in _MOONSHINE_DECODER_SHAPES:
+        raise ValueError(
+            f"Unknown Moonshine model {model_name!r}, expected one of "
+            + ", ".join(f'"moonshine/{n}"' for n in _MOONSHINE_DECODER_SHAPES)
+        )
+    import onnxruntime
+    from moonshine_onnx import MoonshineOnnxModel
+
+    if session_options is None:
+        return MoonshineOnnxModel(model_name=model_name)
+    if not hasattr(MoonshineOnnxModel, "_load_weights_from_hf_hub"):
+        logger.warning("This moonshine_onnx release cannot take session options, using its defaults.")
+        return MoonshineOnnxModel(model_name=model_name)
+    m = MoonshineOnnxModel.__new__(MoonshineOnnxModel)
+    encoder, decoder = m._load_weights_from_hf_hub(name, "float")
+    m.encoder = onnxruntime.InferenceSession(encoder, sess_options=session_options)
+    m.decoder = onnxruntime.InferenceSession(decoder, sess_options=session_options)
+    m.encoder_input_names = [x.name for x in m.encoder.get_inputs()]
+    m.decoder_input_names = [x.name for x in m.decoder.get_inputs()]
+    m.num_layers, m.num_key_value_heads, m.head_dim = _MOONSHINE_DECODER_SHAPES[name]
+    m.decoder_start_token_id = 1
+    m.eos_token_id = 2
+    return m
+
 
 class STTModel(Protocol):
     def stt(self, audio: tuple[int, NDArray[np.int16 | np.float32]]) -> str: ...
@@ -19,29 +68,143 @@ class STTModel(Protocol):
 
 class MoonshineSTT(STTModel):
     def __init__(
-        self, model: Literal["moonshine/base", "moonshine/tiny"] = "moonshine/base"
+        self,
+        model: Literal["moonshine/base", "moonshine/tiny"] = "moonshine/base",
+        session_options: Any = None,
     ):
         try:
-            from moonshine_onnx import MoonshineOnnxModel, load_tokenizer
+            from moonshine_onnx import load_tokenizer
         except (ImportError, ModuleNotFoundError):
             raise ImportError(
                 "Install fastrtc[stt] for speech-to-text and stopword detection support."
             )
 
-        self.model = MoonshineOnnxModel(model_name=model)
+        self.model = _load_moonshine(model, session_options)
         self.tokenizer = load_tokenizer()
+        # Cleared the first time the exported graphs reject a batch larger than one
+        self.supports_batching = True
 
     def stt(self, audio: tuple[int, NDArray[np.int16 | np.float32]]) -> str:
         sr, audio_np = audio  # type: ignore
-        audio_np = audio_to_float32(audio_np)
-        if sr != 16000:
-            audio_np: NDArray[np.float32] = librosa.resample(
-                audio_np, orig_sr=sr, target_sr=16000
-            )
+        audio_np = self._to_16k(sr, audio_np)
         if audio_np.ndim == 1:
             audio_np = audio_np.reshape(1, -1)
-        tokens = self.model.generate(audio_np)
-        return self.tokenizer.decode_batch(tokens)[0]
+        with STT_INFERENCE_SECONDS.labels("single").time(), span("generate", batch=1):
+            tokens = self.model.generate(audio_np)
+        with span("tokenizer.decode"):
+            return self.tokenizer.decode_batch(tokens)[0]
+
+    def stt_batch(
+        self, audios: list[tuple[int, NDArray[np.int16 | np.float32]]]
+    ) -> list[str]:
+        """
+        Transcribe several utterances with one encoder pass and one decoder loop.
+
+        The utterances are zero-padded to the longest one, so callers should
+        group them by similar length to keep the padding overhead small.
+        """
+        if len(audios) == 1:
+            return [self.stt(audios[0])]
+        signals = [self._to_16k(sr, audio_np).reshape(-1) for sr, audio_np in audios]
+        if self.supports_batching:
+            try:
+                with STT_INFERENCE_SECONDS.labels("batch").time(), span("generate", batch=len(signals)):
+                    tokens = self._generate_batch(signals)
+            except Exception as e:
+                if _rejects_batch(e):
+                    self.supports_batching = False
+                    logger.warning(
+                        "Batched STT is not supported by this model (%s), "
+                        "transcribing one utterance at a time from now on.", e
+                    )
+                else:
+                    logger.warning("Batched STT failed (%s), retrying one utterance at a time.", e)
+            else:
+                with span("tokenizer.decode"):
+                    return self.tokenizer.decode_batch(tokens)
+        with STT_INFERENCE_SECONDS.labels("sequential").time(), span("generate", batch=len(signals), sequential=True):
+            tokens = [self.model.generate(s.reshape(1, -1))[0] for s in signals]
+        with span("tokenizer.decode"):
+            return self.tokenizer.decode_batch(tokens)
+
+    def _to_16k(
+        self, sr: int, audio_np: NDArray[np.int16 | np.float32]
+    ) -> NDArray[np.float32]:
+        return resample(audio_np, sr, 16000)
+
+    def _generate_batch(
+        self, signals: list[NDArray[np.float32]], max_len: int | None = None
+    ) -> list[list[int]]:
+        """Greedy decoding over a padded batch, mirroring ``MoonshineOnnxModel.generate``."""
+        m = self.model
+        batch_size = len(signals)
+        lengths = np.array([len(s) for s in signals])
+        if max_len is None:
+            # Same cap as upstream, 6 tokens per second of the longest utterance
+            max_len = int((lengths.max() / 16000) * 6)
+        audio = np.zeros((batch_size, lengths.max()), dtype=np.float32)
+        for i, s in enumerate(signals):
+            audio[i, : len(s)] = s
+        attention_mask = (np.arange(audio.shape[1]) < lengths[:, None]).astype(np.int64)
+
+        encoder_inputs = dict(input_values=audio)
+        if "attention_mask" in m.encoder_input_names:
+            encoder_inputs["attention_mask"] = attention_mask
+        last_hidden_state = m.encoder.run(None, encoder_inputs)[0]
+
+        past_key_values = {
+            f"past_key_values.{i}.{a}.{b}": np.zeros(
+                (0, m.num_key_value_heads, 1, m.head_dim), dtype=np.float32
+            )
+            for i in range(m.num_layers)
+            for a in ("decoder", "encoder")
+            for b in ("key", "value")
+        }
+
+        tokens = [[m.decoder_start_token_id] for _ in range(batch_size)]
+        finished = np.zeros(batch_size, dtype=bool)
+        input_ids = np.full((batch_size, 1), m.decoder_start_token_id, dtype=np.int64)
+        for step in range(max_len):
+            use_cache_branch = step > 0
+            decoder_inputs = dict(
+                input_ids=input_ids,
+                encoder_hidden_states=last_hidden_state,
+                use_cache_branch=[use_cache_branch],
+                **past_key_values,
+            )
+            if "encoder_attention_mask" in m.decoder_input_names:
+                decoder_inputs["encoder_attention_mask"] = attention_mask
+
+            logits, *present_key_values = m.decoder.run(None, decoder_inputs)
+            next_tokens = logits[:, -1].argmax(axis=-1)
+            # Finished rows keep emitting EOS so the batch stays rectangular
+            next_tokens[finished] = m.eos_token_id
+            for i in np.flatnonzero(~finished):
+                tokens[i].append(int(next_tokens[i]))
+            finished |= next_tokens == m.eos_token_id
+            if finished.all():
+                break
+
+            input_ids = next_tokens.reshape(-1, 1).astype(np.int64)
+            for k, v in zip(past_key_values.keys(), present_key_values):
+                if not use_cache_branch or "decoder" in k:
+                    past_key_values[k] = v
+
+        return tokens
+
+
+def _rejects_batch(e: Exception) -> bool:
+    """Whether ONNX Runtime refused the batch shape or graph, which a retry will not fix."""
+    try:
+        from onnxruntime.capi.onnxruntime_pybind11_state import (
+            InvalidArgument,
+            InvalidGraph,
+            NotImplemented,
+            RuntimeException,
+        )
+    except ImportError:
+        return False
+    return isinstance(e, (InvalidArgument, InvalidGraph, NotImplemented, RuntimeException))
 
 
 @lru_cache
@@ -50,31 +213,141 @@ def get_stt_model(
 ) -> STTModel:
     import os
 
+    from app.service.batching import BatchingSTT
+
     os.environ["TOKENIZERS_PARALLELISM"] = "false"
-    m = MoonshineSTT(model)
-    from moonshine_onnx import load_audio
-    test_file = curr_dir / ".." / ".." / "tests" / "test_file.wav"
-    test_file = test_file.resolve()
-    if test_file.exists():
-        audio = load_audio(str(test_file))
-        print(click.style("INFO", fg="green") + ":\t  Warming up STT model.")
-
-        m.stt((24000, audio))
-        print(click.style("INFO", fg="green") + ":\t  STT model warmed up.")
-    else:
-        print(click.style("WARNING", fg="yellow") + f":\t  No test_file.wav found, skipping STT model warmup.")
+    pool = ModelPool.build(
+        lambda options, cores: MoonshineSTT(model, options),
+        int(os.getenv("STT_POOL_SIZE", 1)),
+    )
+    m: STTModel = pool.models[0]
+    max_batch_size = int(os.getenv("STT_BATCH_MAX_SIZE", 8))
+    if max_batch_size > 1 or len(pool) > 1:
+        m = BatchingSTT(
+            pool,
+            max_batch_size=max(max_batch_size, 1),
+            max_wait=float(os.getenv("STT_BATCH_MAX_WAIT_MS", 20)) / 1000,
+        )
+    for member in pool.models:
+        warmup_stt(member)
     return m
 
 
+def warmup_stt(model: STTModel, sample_rate: int = 8000) -> None:
+    """Transcribe the bundled test file at the rate telephony sessions stream in."""
+    test_file = (curr_dir / ".." / ".." / "tests" / "test_file.wav").resolve()
+    if not test_file.exists():
+        logger.warning("No test_file.wav found, skipping STT model warmup.")
+        return
+    import soundfile as sf
+
+    audio, file_rate = sf.read(str(test_file), dtype="float32")
+    audio = resample(audio, file_rate, sample_rate)
+    logger.info("Warming up STT model.")
+    model.stt((sample_rate, audio))
+    if hasattr(model, "stt_batch"):
+        # A second, shorter utterance so the padded batch path is compiled too
+        model.stt_batch([(sample_rate, audio), (sample_rate, audio[: len(audio) * 4 // 5])])
+    logger.info("STT model warmed up.")
+
+
 def stt_for_chunks(
     stt_model: STTModel,
     audio: tuple[int, NDArray[np.int16 | np.float32]],
     chunks: list[AudioChunk],
 ) -> str:
     sr, audio_np = audio
-    return " ".join(
-        [
-            stt_model.stt((sr, audio_np[chunk["start"] : chunk["end"]]))
-            for chunk in chunks
-        ]
-    )
\ No newline at end of file
+    segments = [(sr, audio_np[chunk["start"] : chunk["end"]]) for chunk in chunks]
+    stt_batch = getattr(stt_model, "stt_batch", None)
+    if stt_batch is not None:
+        return " ".join(stt_batch(segments))
+    return " ".join([stt_model.stt(segment) for segment in segments])
+
+
+def read_blocks(
+    file: str | IO[bytes], sample_rate: int = 16000, block_duration: float = 10.0
+) -> Iterator[NDArray[np.float32]]:
+    """Decode an audio file block by block, downmixed to mono and resampled to ``sample_rate``."""
+    import soundfile as sf
+
+    try:
+        f = sf.SoundFile(file)
+    except sf.LibsndfileError as e:
+        raise ValueError(f"Unsupported or corrupt audio file: {e}") from None
+    with f:
+        resampler = StreamingResampler(f.samplerate, sample_rate)
+        for block in f.blocks(
+            blocksize=int(block_duration * f.samplerate), dtype="float32", always_2d=True
+        ):
+            yield resampler.process(block.mean(axis=1))
+        yield resampler.flush()
+
+
+def transcribe_file(
+    file: str | IO[bytes],
+    stt_model: STTModel,
+    vad_model: VADModel | None = None,
+    max_segment_duration: float = 30.0,
+    max_in_flight: int = 16,
+) -> dict:
+    """
+    Transcribe a long recording without holding it in memory.
+
+    The file is decoded in blocks and cut into speech segments as it is read.
+    Each segment is queued at ``Priority.BATCH`` as soon as it is found, so
+    live STT is served first. A batching model takes the segments straight
+    into its queue and decodes them in batches across the model pool while
+    the rest of the file is still being read; any other model runs them as
+    batch jobs on the inference executor. At most ``max_in_flight`` wait at a
+    time. Segments come back in order with their offsets in seconds.
+    """
+    sample_rate = 16000
+    start = time.perf_counter()
+    segmenter = SpeechSegmenter(sample_rate, vad_model, max_duration=max_segment_duration)
+    executor = get_inference_executor()
+
+    def submit(audio: tuple[int, NDArray[np.float32]], priority: Priority) -> Future:
+        if hasattr(stt_model, "submit"):
+            # The batcher orders by priority itself, no worker waits on the batch
+            return stt_model.submit(audio, priority)
+        return executor.submit_future(stt_model.stt, audio, priority=priority)
+
+    pending: deque[tuple[AudioChunk, Future]] = deque()
+    segments = []
+
+    def collect(chunk: AudioChunk, text: str) -> None:
+        segments.append(
+            {
+                "start": round(chunk["start"] / sample_rate, 3),
+                "end": round(chunk["end"] / sample_rate, 3),
+                "text": text.strip(),
+            }
+        )
+
+    def decode(found: list[tuple[AudioChunk, NDArray[np.float32]]]) -> None:
+        for chunk, audio in found:
+            future = submit((sample_rate, audio), Priority.BATCH)
+            pending.append((chunk, future))
+            while len(pending) > max_in_flight:
+                collect(pending[0][0], pending.popleft()[1].result())
+
+    duration = 0
+    try:
+        for block in read_blocks(file, sample_rate):
+            duration += len(block)
+            decode(segmenter.push(block))
+        decode(segmenter.flush())
+        while pending:
+            collect(pending[0][0], pending.popleft()[1].result())
+    finally:
+        # Do not decode the rest of a file that failed
+        for _, future in pending:
+            future.cancel()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "text": " ".join(s["text"] for s in segments if s["text"]),
+        "duration": round(duration / sample_rate, 3),
+        "segments": segments,
+        "elapsed_s": round(elapsed, 3),
+    }
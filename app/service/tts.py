@@ -1,14 +1,28 @@
 import asyncio
+import os
 import re
+import threading
+import time
+from collections import deque
 from collections.abc import AsyncGenerator, Generator
+from concurrent.futures import Future
 from dataclasses import dataclass
-from functools import lru_cache
-from typing import Protocol, TypeVar
+from typing import Callable, Literal, Protocol, TypeVar
 
 import numpy as np
-from huggingface_hub import hf_hub_download
 from numpy.typing import NDArray
 
+from app.service.cache import LRUCache
+from app.service.executor import Priority, get_inference_executor, inference_priority
+from app.service.pool import ModelPool
+from app.tracing import span
+
+# Sentence ends: whitespace after terminal punctuation
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+# Clause ends, used to cut long sentences while text is still streaming in
+CLAUSE_BOUNDARY = re.compile(r"(?<=[,;:])\s+")
+
+
 class TTSOptions:
     pass
 
@@ -37,11 +51,83 @@ class KokoroTTSOptions(TTSOptions):
     lang: str = "en-us"
 
 
-@lru_cache
-def get_tts_model() -> TTSModel:
-    m = KokoroTTSModel()
-    m.tts("Hello, world!")
-    return m
+TTSEngine = Literal["onnx", "torch"]
+
+DEFAULT_TTS_ENGINE = os.getenv("TTS_ENGINE", "onnx")
+
+_tts_models: dict[str, TTSModel] = {}
+_tts_model_locks: dict[str, threading.Lock] = {}
+_tts_models_lock = threading.Lock()
+
+
+def get_tts_model(engine: TTSEngine | None = None) -> TTSModel:
+    """The loaded and warmed model for ``engine``, ``TTS_ENGINE`` when not given."""
+    engine = engine or DEFAULT_TTS_ENGINE  # type: ignore[assignment]
+    if engine not in TTS_ENGINES:
+        raise ValueError(
+            f"Unknown TTS engine {engine!r}, expected one of {', '.join(TTS_ENGINES)}"
+        )
+    # One lock per engine, so loading one engine does not hold up the other
+    with _tts_models_lock:
+        lock = _tts_model_locks.setdefault(engine, threading.Lock())
+    with lock:
+        if engine not in _tts_models:
+            m = TTS_ENGINES[engine]()
+            warmup_tts(m)
+            _tts_models[engine] = m
+        return _tts_models[engine]
+
+
+def loaded_tts_models() -> dict[str, TTSModel]:
+    return dict(_tts_models)
+
+
+WARMUP_TEXT = "Thanks for calling, how can I help you today?"
+
+
+def warmup_tts(model: TTSModel) -> None:
+    """Render a typical reply with every configured voice on every pooled session."""
+    voices = [v.strip() for v in os.getenv("TTS_WARMUP_VOICES", "af_heart").split(",") if v.strip()]
+    if not isinstance(model, KokoroTTSModel):
+        for voice in voices:
+            model.tts(WARMUP_TEXT, KokoroTTSOptions(voice=voice))
+        return
+    # Straight to the sessions, warmup output should not land in the segment cache
+    for kokoro in model.pool.models:
+        for voice in voices:
+            kokoro.create(WARMUP_TEXT, voice=voice, speed=1.0, lang="en-us")
+
+
+def _iterate_sync(
+    stream: AsyncGenerator[tuple[int, NDArray[np.float32]], None],
+) -> Generator[tuple[int, NDArray[np.float32]], None, None]:
+    loop = asyncio.new_event_loop()
+
+    # Use the new loop to run the async generator
+    iterator = stream.__aiter__()
+    while True:
+        try:
+            yield loop.run_until_complete(iterator.__anext__())
+        except StopAsyncIteration:
+            break
+
+
+def _join_sentences(
+    results: list[tuple[int, NDArray[np.float32]] | None],
+) -> tuple[int, NDArray[np.float32]]:
+    """Concatenate rendered sentences with the pause ``stream_tts`` leaves between them."""
+    sample_rate = 24000
+    parts: list[NDArray[np.float32]] = []
+    for result in results:
+        if result is None:
+            continue
+        sample_rate, audio = result
+        if parts:
+            parts.append(np.zeros(sample_rate // 7, dtype=np.float32))
+        parts.append(audio)
+    if not parts:
+        return sample_rate, np.zeros(0, dtype=np.float32)
+    return sample_rate, np.concatenate(parts)
 
 
 class KokoroFixedBatchSize:
@@ -86,79 +172,303 @@ class KokoroFixedBatchSize:
         return batched_phonemes
 
 
+def _traced_split_phonemes(phonemes: str) -> list[str]:
+    with span("split_phonemes", chars=len(phonemes)):
+        return KokoroFixedBatchSize()._split_phonemes(phonemes)
+
+
 class KokoroTTSModel(TTSModel):
     def __init__(self):
+        from huggingface_hub import hf_hub_download
         from kokoro_onnx import Kokoro
+        from onnxruntime import InferenceSession
+
+        model_path = hf_hub_download("fastrtc/kokoro-onnx", "kokoro-v1.0.onnx")
+        voices_path = hf_hub_download("fastrtc/kokoro-onnx", "voices-v1.0.bin")
+
+        def load(options, cores) -> Kokoro:
+            kokoro = Kokoro.from_session(
+                InferenceSession(
+                    model_path,
+                    sess_options=options,
+                    providers=["CPUExecutionProvider"],
+                ),
+                voices_path,
+            )
+            kokoro._split_phonemes = _traced_split_phonemes
+            return kokoro
+
+        # Each sentence worker leases its own session, see TTS_POOL_SIZE
+        self.pool = ModelPool.build(load, int(os.getenv("TTS_POOL_SIZE", 1)))
+        # Phonemization and voices do not depend on the session
+        self.model = self.pool.models[0]
+
+        # Templated prompts share most of their sentences, so cache below the prompt
+        # level: (sentence, lang) -> phonemes and (phonemes, voice, speed) -> audio.
+        # Entries keep the seconds they took to compute to report the time saved.
+        mb = 1024 * 1024
+        self.phoneme_cache: LRUCache[tuple[str, str], tuple[str, float]] = LRUCache(
+            int(float(os.getenv("TTS_PHONEME_CACHE_MB", 8)) * mb),
+            sizeof=lambda entry: len(entry[0].encode()),
+        )
+        self.segment_cache: LRUCache[
+            tuple[str, str, float], tuple[int, NDArray[np.float32], float]
+        ] = LRUCache(
+            int(float(os.getenv("TTS_SEGMENT_CACHE_MB", 128)) * mb),
+            sizeof=lambda entry: entry[1].nbytes,
+        )
+        self.seconds_saved = 0.0
+        # espeak is not reentrant, but the ONNX session releases the GIL and can
+        # render several sentences of a long input at once
+        self._phonemize_lock = threading.Lock()
+        # Sentences of one input queued on the inference executor at a time
+        self.sentence_workers = max(
+            int(os.getenv("TTS_SENTENCE_WORKERS", len(self.pool))), 1
+        )
 
-        self.model = Kokoro(
-            model_path=hf_hub_download("fastrtc/kokoro-onnx", "kokoro-v1.0.onnx"),
-            voices_path=hf_hub_download("fastrtc/kokoro-onnx", "voices-v1.0.bin"),
+    def phonemize(self, sentence: str, lang: str) -> str:
+        key = (sentence.strip(), lang)
+        entry = self.phoneme_cache.get(key)
+        if entry is not None:
+            self.seconds_saved += entry[1]
+            return entry[0]
+        start = time.perf_counter()
+        with span("phonemize", lang=lang), self._phonemize_lock:
+            phonemes = self.model.tokenizer.phonemize(key[0], lang)
+        self.phoneme_cache.put(key, (phonemes, time.perf_counter() - start))
+        return phonemes
+
+    def synthesize_sentence(
+        self, sentence: str, options: KokoroTTSOptions
+    ) -> tuple[int, NDArray[np.float32]] | None:
+        """Audio for one sentence, from the segment cache if it was rendered before."""
+        phonemes = self.phonemize(sentence, options.lang)
+        if not phonemes.strip():
+            return None
+        key = (phonemes, options.voice, options.speed)
+        entry = self.segment_cache.get(key)
+        if entry is not None:
+            self.seconds_saved += entry[2]
+            return entry[0], entry[1]
+        start = time.perf_counter()
+        with self.pool.lease() as kokoro, span("generate", voice=options.voice):
+            audio, sample_rate = kokoro.create(
+                phonemes,
+                voice=options.voice,
+                speed=options.speed,
+                lang=options.lang,
+                is_phonemes=True,
+            )
+        self.segment_cache.put(key, (sample_rate, audio, time.perf_counter() - start))
+        return sample_rate, audio
+
+    def _submit(
+        self, sentence: str, options: KokoroTTSOptions, priority: Priority | None = None
+    ) -> Future:
+        # Queued with the priority of the request unless given, see inference_priority
+        return get_inference_executor().submit_future(
+            self.synthesize_sentence, sentence, options, priority=priority
         )
 
-        self.model._split_phonemes = KokoroFixedBatchSize()._split_phonemes
+    def cache_stats(self) -> dict:
+        return {
+            "phonemes": self.phoneme_cache.stats(),
+            "segments": self.segment_cache.stats(),
+            "inference_seconds_saved": round(self.seconds_saved, 3),
+            "pool": self.pool.stats(),
+        }
 
     def tts(
         self, text: str, options: KokoroTTSOptions | None = None
     ) -> tuple[int, NDArray[np.float32]]:
         options = options or KokoroTTSOptions()
-        a, b = self.model.create(
-            text, voice=options.voice, speed=options.speed, lang=options.lang
-        )
-        return b, a
+        sentences = [s for s in SENTENCE_BOUNDARY.split(text.strip()) if s.strip()]
+        # Results are joined in submission order, whichever sentence finishes first.
+        # Long inputs keep sentence_workers in the queue rather than all of them.
+        results = []
+        pending: deque[Future] = deque()
+        try:
+            for sentence in sentences:
+                if len(pending) >= self.sentence_workers:
+                    results.append(pending.popleft().result())
+                pending.append(self._submit(sentence, options))
+            results.extend(future.result() for future in pending)
+        finally:
+            for future in pending:
+                future.cancel()
+        return _join_sentences(results)
 
     async def stream_tts(
         self, text: str, options: KokoroTTSOptions | None = None
     ) -> AsyncGenerator[tuple[int, NDArray[np.float32]], None]:
         options = options or KokoroTTSOptions()
 
-        sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+        sentences = [s for s in SENTENCE_BOUNDARY.split(text.strip()) if s.strip()]
+        if not sentences:
+            return
+
+        # The first sentence is submitted alone and, for interactive requests,
+        # ahead of the later sentences other requests have queued, so time to
+        # first audio does not grow with their backlog. Later sentences are
+        # rendered up to sentence_workers ahead while earlier ones are played.
+        first_priority = Priority.FIRST_AUDIO if inference_priority.get() == Priority.TTS else None
+        pending: deque[Future] = deque(
+            [self._submit(sentences[0], options, first_priority)]
+        )
+        next_index = 1
+        first = True
+        try:
+            while pending:
+                result = await asyncio.wrap_future(pending.popleft())
+                while next_index < len(sentences) and len(pending) < self.sentence_workers:
+                    pending.append(self._submit(sentences[next_index], options))
+                    next_index += 1
+                if result is None:
+                    continue
+                sample_rate, audio = result
+                if not first:
+                    yield sample_rate, np.zeros(sample_rate // 7, dtype=np.float32)
+                first = False
+                yield sample_rate, audio
+        finally:
+            # The client went away, do not render sentences nobody will hear
+            for future in pending:
+                future.cancel()
+
+    def stream_tts_sync(
+        self, text: str, options: KokoroTTSOptions | None = None
+    ) -> Generator[tuple[int, NDArray[np.float32]], None, None]:
+        return _iterate_sync(self.stream_tts(text, options))
+
 
-        for s_idx, sentence in enumerate(sentences):
+def _rss_bytes() -> int:
+    """Resident set size of this process, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class KPipelineTTSModel(TTSModel):
+    """
+    Kokoro through the PyTorch ``KPipeline``.
+
+    All languages share one ``KModel``; only the per-language G2P pipelines
+    are cached, in an LRU bounded by ``TTS_PIPELINE_CACHE_MB``. A pipeline's
+    cost is the growth of the process's resident memory while it was built.
+    """
+
+    repo_id = "hexgrad/Kokoro-82M"
+
+    def __init__(self):
+        from kokoro import KModel
+
+        self.kmodel = KModel(repo_id=self.repo_id).eval()
+        self.pipelines: LRUCache[str, tuple[object, int]] = LRUCache(
+            int(float(os.getenv("TTS_PIPELINE_CACHE_MB", 512)) * 1024 * 1024),
+            sizeof=lambda entry: entry[1],
+        )
+        # KPipeline keeps per-call state, one render at a time per engine
+        self._lock = threading.Lock()
+
+    def get_pipeline(self, lang: str):
+        lang_code = _lang_codes.get(lang.lower(), "a")
+        entry = self.pipelines.get(lang_code)
+        if entry is not None:
+            return entry[0]
+        from kokoro import KPipeline
+
+        before = _rss_bytes()
+        pipeline = KPipeline(lang_code=lang_code, repo_id=self.repo_id, model=self.kmodel)
+        # Never count a pipeline as free, or the cache would grow without bound
+        self.pipelines.put(lang_code, (pipeline, max(_rss_bytes() - before, 1024 * 1024)))
+        return pipeline
+
+    def synthesize_sentence(
+        self, sentence: str, options: KokoroTTSOptions
+    ) -> tuple[int, NDArray[np.float32]] | None:
+        with span("generate", voice=options.voice), self._lock:
+            pipeline = self.get_pipeline(options.lang)
+            segments = [
+                np.asarray(audio, dtype=np.float32)
+                for _, _, audio in pipeline(
+                    sentence, voice=options.voice, speed=options.speed, split_pattern=r"\n+"
+                )
+                if audio is not None
+            ]
+        if not segments:
+            return None
+        return 24000, np.concatenate(segments)
+
+    def tts(
+        self, text: str, options: KokoroTTSOptions | None = None
+    ) -> tuple[int, NDArray[np.float32]]:
+        options = options or KokoroTTSOptions()
+        sentences = [s for s in SENTENCE_BOUNDARY.split(text.strip()) if s.strip()]
+        executor = get_inference_executor()
+        return _join_sentences(
+            [executor.submit_future(self.synthesize_sentence, s, options).result() for s in sentences]
+        )
+
+    async def stream_tts(
+        self, text: str, options: KokoroTTSOptions | None = None
+    ) -> AsyncGenerator[tuple[int, NDArray[np.float32]], None]:
+        options = options or KokoroTTSOptions()
+        first = True
+        for sentence in SENTENCE_BOUNDARY.split(text.strip()):
             if not sentence.strip():
                 continue
-
-            chunk_idx = 0
-            async for chunk in self.model.create_stream(
-                sentence, voice=options.voice, speed=options.speed, lang=options.lang
-            ):
-                if s_idx != 0 and chunk_idx == 0:
-                    yield chunk[1], np.zeros(chunk[1] // 7, dtype=np.float32)
-                chunk_idx += 1
-                yield chunk[1], chunk[0]
+            result = await get_inference_executor().submit(self.synthesize_sentence, sentence, options)
+            if result is None:
+                continue
+            sample_rate, audio = result
+            if not first:
+                yield sample_rate, np.zeros(sample_rate // 7, dtype=np.float32)
+            first = False
+            yield sample_rate, audio
 
     def stream_tts_sync(
         self, text: str, options: KokoroTTSOptions | None = None
     ) -> Generator[tuple[int, NDArray[np.float32]], None, None]:
-        loop = asyncio.new_event_loop()
+        return _iterate_sync(self.stream_tts(text, options))
 
-        # Use the new loop to run the async generator
-        iterator = self.stream_tts(text, options).__aiter__()
-        while True:
-            try:
-                yield loop.run_until_complete(iterator.__anext__())
-            except StopAsyncIteration:
-                break
 
-lang_map = {
-    "en-US": "a", "en-GB": "b", "es": "e", "fr-fr": "f", "hi": "h", "it": "i", "ja": "j", "pt-br": "p", "zh": "z"
+TTS_ENGINES: dict[str, Callable[[], TTSModel]] = {
+    "onnx": KokoroTTSModel,
+    "torch": KPipelineTTSModel,
 }
 
-@lru_cache
-def get_pipeline(language):
-    from kokoro import KPipeline
-    lang_code = lang_map.get(language, "a")
-    return KPipeline(lang_code=lang_code, repo_id="hexgrad/Kokoro-82M")
 
-def synthesize(voice, text, language):
+class TextSegmenter:
+    """
+    Buffer incrementally arriving text and release it in speakable segments.
 
-    pipeline = get_pipeline(language)
-    generator = pipeline(text, voice=voice, speed=1, split_pattern=r'\\n+')
-    
-    audio_segments = []
-    for i, (gs, ps, audio) in enumerate(generator):
-        audio_segments.append(audio)
-        
-    audio_concat = np.concatenate(audio_segments)
-    sample_rate = 24000
-    return sample_rate, audio_concat
+    A segment is released once a sentence boundary has been seen, or, when the
+    buffered sentence grows past ``max_chars``, at its last clause boundary, so
+    synthesis can start while the rest of the text is still being generated.
+    """
+
+    def __init__(self, max_chars: int = 150):
+        self.max_chars = max_chars
+        self._buffer = ""
 
+    def push(self, delta: str) -> list[str]:
+        self._buffer += delta
+        *segments, self._buffer = SENTENCE_BOUNDARY.split(self._buffer)
+        if len(self._buffer) > self.max_chars:
+            *clauses, self._buffer = CLAUSE_BOUNDARY.split(self._buffer)
+            if clauses:
+                segments.append(" ".join(clauses))
+        return [s.strip() for s in segments if s.strip()]
+
+    def flush(self) -> str:
+        segment, self._buffer = self._buffer.strip(), ""
+        return segment
+
+
+lang_map = {
+    "en-US": "a", "en-GB": "b", "es": "e", "fr-fr": "f", "hi": "h", "it": "i", "ja": "j", "pt-br": "p", "zh": "z"
+}
+# Requests carry lowercased language tags
+_lang_codes = {lang.lower(): code for lang, code in lang_map.items()}
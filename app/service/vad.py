@@ -0,0 +1,297 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Literal, Protocol
+
+import numpy as np
+from numpy.typing import NDArray
+
+from app.service.resample import resample
+from app.utils import AudioChunk, audio_to_float32
+
+
+@dataclass
+class VADOptions:
+    threshold: float = 0.5
+    """Speech probability above which a Silero window counts as speech."""
+    threshold_db: float = -45.0
+    """Frame energy in dBFS above which an energy frame may be speech."""
+    max_zcr: float = 0.4
+    """Zero-crossing rate above which a frame is treated as broadband noise."""
+    min_flux: float = 0.02
+    """Spectral flux below which a frame is treated as a stationary tone or hum."""
+    frame_duration: float = 0.02
+    min_speech_duration: float = 0.06
+    min_silence_duration: float = 0.1
+
+
+class VADModel(Protocol):
+    def vad(
+        self,
+        audio: tuple[int, NDArray[np.int16 | np.float32]],
+        options: VADOptions | None = None,
+    ) -> tuple[float, list[AudioChunk]]:
+        """Return the seconds of speech in ``audio`` and the speech regions in samples."""
+        ...
+
+
+def _frames_to_chunks(
+    is_speech: NDArray[np.bool_], hop: int, n_samples: int
+) -> list[AudioChunk]:
+    edges = np.diff(np.concatenate([[False], is_speech, [False]]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [
+        AudioChunk(start=int(s * hop), end=int(min(e * hop, n_samples)))
+        for s, e in zip(starts, ends)
+    ]
+
+
+def _smooth(is_speech: NDArray[np.bool_], min_speech: int, min_silence: int):
+    """Close silence gaps shorter than ``min_silence`` frames, then drop speech runs shorter than ``min_speech``."""
+    for value, min_run in ((False, min_silence), (True, min_speech)):
+        padded = np.concatenate([[not value], is_speech, [not value]])
+        edges = np.diff(padded.astype(np.int8))
+        if value:
+            starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        else:
+            starts, ends = np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)
+        for s, e in zip(starts, ends):
+            # Leading and trailing silence is left alone, only interior gaps are closed
+            if e - s < min_run and (value or (s > 0 and e < len(is_speech))):
+                is_speech[s:e] = not value
+    return is_speech
+
+
+class EnergyVADModel(VADModel):
+    """
+    Vectorized NumPy voice activity detector.
+
+    A frame is speech when it is loud enough, is not broadband noise (low
+    zero-crossing rate) and is not a steady tone or mains hum (non-zero
+    spectral flux). Decisions are then smoothed so short gaps do
+    not split words and isolated clicks are dropped.
+    """
+
+    def vad(
+        self,
+        audio: tuple[int, NDArray[np.int16 | np.float32]],
+        options: VADOptions | None = None,
+    ) -> tuple[float, list[AudioChunk]]:
+        options = options or VADOptions()
+        sr, audio_np = audio
+        audio_np = audio_to_float32(audio_np).reshape(-1)
+        hop = max(int(sr * options.frame_duration), 1)
+        n_frames = len(audio_np) // hop
+        if n_frames == 0:
+            return 0.0, []
+
+        frames = audio_np[: n_frames * hop].reshape(n_frames, hop)
+        energy_db = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        spectrum = np.abs(np.fft.rfft(frames * np.hanning(hop), axis=1))
+        rise = np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)
+        flux = np.concatenate([[1.0], rise / (spectrum[1:].sum(axis=1) + 1e-10)])
+        # Steady vowels have little frame-to-frame change, so look across neighbours
+        padded = np.pad(flux, 1, mode="edge")
+        flux = np.maximum.reduce([padded[:-2], padded[1:-1], padded[2:]])
+
+        is_speech = (
+            (energy_db > options.threshold_db)
+            & (zcr < options.max_zcr)
+            & (flux > options.min_flux)
+        )
+        is_speech = _smooth(
+            is_speech,
+            min_speech=round(options.min_speech_duration / options.frame_duration),
+            min_silence=round(options.min_silence_duration / options.frame_duration),
+        )
+        return float(is_speech.sum() * hop / sr), _frames_to_chunks(
+            is_speech, hop, len(audio_np)
+        )
+
+
+class SileroVADModel(VADModel):
+    """Silero VAD through ONNX Runtime, for deployments that can afford a model per frame."""
+
+    SAMPLE_RATE = 16000
+    WINDOW = 512
+
+    def __init__(self):
+        try:
+            import onnxruntime
+        except (ImportError, ModuleNotFoundError):
+            raise ImportError("Install onnxruntime to use the Silero VAD model.")
+        from huggingface_hub import hf_hub_download
+
+        opts = onnxruntime.SessionOptions()
+        opts.inter_op_num_threads = 1
+        opts.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            hf_hub_download("freddyaboulton/silero-vad", "silero_vad.onnx"),
+            providers=["CPUExecutionProvider"],
+            sess_options=opts,
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _probabilities(self, audio: NDArray[np.float32]) -> NDArray[np.float32]:
+        n_windows = len(audio) // self.WINDOW
+        windows = audio[: n_windows * self.WINDOW].reshape(n_windows, self.WINDOW)
+        sr = np.array(self.SAMPLE_RATE, dtype=np.int64)
+        probs = np.empty(n_windows, dtype=np.float32)
+        if "state" in self.input_names:
+            # v5 graphs keep one recurrent state and need 64 samples of left context
+            state = np.zeros((2, 1, 128), dtype=np.float32)
+            context = np.zeros(64, dtype=np.float32)
+            for i, window in enumerate(windows):
+                x = np.concatenate([context, window])[None, :]
+                out, state = self.session.run(
+                    None, {"input": x, "state": state, "sr": sr}
+                )
+                probs[i] = out.item()
+                context = window[-64:]
+        else:
+            h = np.zeros((2, 1, 64), dtype=np.float32)
+            c = np.zeros((2, 1, 64), dtype=np.float32)
+            for i, window in enumerate(windows):
+                out, h, c = self.session.run(
+                    None, {"input": window[None, :], "h": h, "c": c, "sr": sr}
+                )
+                probs[i] = out.item()
+        return probs
+
+    def vad(
+        self,
+        audio: tuple[int, NDArray[np.int16 | np.float32]],
+        options: VADOptions | None = None,
+    ) -> tuple[float, list[AudioChunk]]:
+        options = options or VADOptions()
+        sr, audio_np = audio
+        audio_np = resample(audio_np, sr, self.SAMPLE_RATE)
+        is_speech = self._probabilities(audio_np) > options.threshold
+        window_s = self.WINDOW / self.SAMPLE_RATE
+        is_speech = _smooth(
+            is_speech,
+            min_speech=round(options.min_speech_duration / window_s),
+            min_silence=round(options.min_silence_duration / window_s),
+        )
+        # Report regions in samples of the caller's rate
+        scale = sr / self.SAMPLE_RATE
+        chunks = [
+            AudioChunk(start=int(c["start"] * scale), end=int(c["end"] * scale))
+            for c in _frames_to_chunks(is_speech, self.WINDOW, len(audio_np))
+        ]
+        return float(is_speech.sum() * window_s), chunks
+
+
+def quietest_point(
+    audio: NDArray[np.int16 | np.float32],
+    sample_rate: int,
+    start: int,
+    end: int,
+    frame_duration: float = 0.02,
+) -> int:
+    """Sample index of the lowest-energy frame in ``audio[start:end]``, a safe place to cut between words."""
+    hop = max(int(sample_rate * frame_duration), 1)
+    n_frames = (end - start) // hop
+    if n_frames <= 0:
+        return start
+    frames = audio_to_float32(audio[start : start + n_frames * hop]).reshape(n_frames, hop)
+    return start + int(np.argmin(np.mean(frames**2, axis=1))) * hop + hop // 2
+
+
+class SpeechSegmenter:
+    """
+    Cut a long signal that arrives in blocks into speech segments.
+
+    Each ``push`` runs the VAD over the audio not yet emitted and returns the
+    speech regions that have ended, padded by ``padding`` seconds, as
+    ``(AudioChunk, samples)`` with offsets from the start of the signal. A
+    region still open at the end of the block is kept for the next push, so
+    only the audio of the current region is ever held. Regions longer than
+    ``max_duration`` are cut at their quietest point.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        vad_model: VADModel | None = None,
+        options: VADOptions | None = None,
+        max_duration: float = 30.0,
+        padding: float = 0.2,
+    ):
+        self.sample_rate = sample_rate
+        self.vad_model = vad_model or EnergyVADModel()
+        # Pauses between sentences should not split a segment, only real gaps
+        self.options = options or VADOptions(min_silence_duration=0.5)
+        self.max_samples = int(max_duration * sample_rate)
+        self.padding = int(padding * sample_rate)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        # Position of _buffer[0] in the whole signal
+        self._offset = 0
+        self._emitted = 0
+
+    def push(
+        self, audio: NDArray[np.int16 | np.float32]
+    ) -> list[tuple[AudioChunk, NDArray[np.float32]]]:
+        self._buffer = np.concatenate([self._buffer, audio_to_float32(audio).reshape(-1)])
+        return self._segments(final=False)
+
+    def flush(self) -> list[tuple[AudioChunk, NDArray[np.float32]]]:
+        segments = self._segments(final=True)
+        self._offset += len(self._buffer)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        return segments
+
+    def _split(self, start: int, end: int) -> list[tuple[int, int]]:
+        parts = []
+        while end - start > self.max_samples:
+            cut = quietest_point(
+                self._buffer, self.sample_rate, start + self.max_samples // 2, start + self.max_samples
+            )
+            parts.append((start, cut))
+            start = cut
+        parts.append((start, end))
+        return parts
+
+    def _emit(self, start: int, end: int) -> tuple[AudioChunk, NDArray[np.float32]]:
+        start = max(start - self.padding, self._emitted - self._offset, 0)
+        end = min(end + self.padding, len(self._buffer))
+        self._emitted = self._offset + end
+        chunk = AudioChunk(start=self._offset + start, end=self._offset + end)
+        # Copy, so the emitted segment does not keep the whole buffer alive
+        return chunk, self._buffer[start:end].copy()
+
+    def _segments(self, final: bool) -> list[tuple[AudioChunk, NDArray[np.float32]]]:
+        _, regions = self.vad_model.vad((self.sample_rate, self._buffer), self.options)
+        # A region this close to the end of the buffer may continue in the next block
+        open_from = len(self._buffer) - int(
+            (self.options.min_silence_duration + self.options.frame_duration) * self.sample_rate
+        )
+        segments = []
+        keep_from = max(open_from - self.padding, 0)
+        for region in regions:
+            if self._offset + region["end"] <= self._emitted:
+                # The tail of a region emitted by the previous push
+                continue
+            parts = self._split(region["start"], region["end"])
+            if not final and region["end"] >= open_from:
+                # Emit the finished parts of a long open region, keep the last one
+                keep_from = parts[-1][0] - self.padding
+                parts = parts[:-1]
+                segments.extend(self._emit(*part) for part in parts)
+                break
+            segments.extend(self._emit(*part) for part in parts)
+        if not final:
+            keep_from = max(keep_from, 0)
+            self._buffer = self._buffer[keep_from:]
+            self._offset += keep_from
+        return segments
+
+
+@lru_cache
+def get_vad_model(model: Literal["energy", "silero"] = "energy") -> VADModel:
+    if model == "silero":
+        return SileroVADModel()
+    return EnergyVADModel()
@@ -0,0 +1,291 @@
+"""
+Per-request tracing spans, exported as Chrome trace JSON.
+
+A request is traced when it asks for it, with an ``X-Trace: 1`` header or a
+``?trace=1`` query parameter and a valid API key, or when it falls in the
+``TRACE_SAMPLE_RATE`` fraction of requests. The trace rides on
+``current_context``, so ``span`` calls anywhere below the endpoint
+(including jobs on the inference executor, which run in a copy of the
+caller's context) record into it, and untraced requests pay one context
+variable lookup per span. If ``TRACE_ALLOW_PROFILE`` is set,
+``X-Trace: profile`` additionally runs a sampling profiler over the threads
+that are inside one of the request's spans.
+
+When the request ends the trace is written to ``TRACE_DIR``, which keeps the
+newest ``TRACE_MAX_FILES`` traces. Open them in chrome://tracing or
+https://ui.perfetto.dev.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs
+
+from app.utils import Context, current_context
+
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")  # where finished traces are written
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))  # fraction of requests traced unasked
+TRACE_PROFILE_INTERVAL_MS = float(os.getenv("TRACE_PROFILE_INTERVAL_MS", 5))  # sampling profiler period
+TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", 100000))  # events kept per trace, long sessions are cut
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", 200))  # traces kept in TRACE_DIR, oldest are deleted
+TRACE_ALLOW_PROFILE = os.getenv("TRACE_ALLOW_PROFILE", "").lower() in ("1", "true", "yes")  # honour X-Trace: profile
+
+logger = logging.getLogger(__name__)
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Trace:
+    """Spans (and optionally stack samples) recorded for one request."""
+
+    def __init__(self, name: str, profile: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.events: list[dict] = []
+        self.dropped = 0
+        self._threads: dict[int, str] = {}
+        # Depth of open spans per thread, read by the profiler
+        self._active: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._profiler = _Profiler(self) if profile else None
+        if self._profiler is not None:
+            self._profiler.start()
+
+    def _us(self, t: float) -> float:
+        return round((t - self.start) * 1e6, 3)
+
+    def _append(self, event: dict) -> None:
+        # Called with the lock held
+        if len(self.events) >= TRACE_MAX_EVENTS:
+            self.dropped += 1
+            return
+        self.events.append(event)
+
+    def add(self, name: str, start: float, end: float, tid: int | None = None, **args: Any) -> None:
+        """Record a finished span, ``start`` and ``end`` as ``time.perf_counter()`` values."""
+        tid = threading.get_ident() if tid is None else tid
+        event = {"name": name, "ph": "X", "ts": self._us(start), "dur": round((end - start) * 1e6, 3), "pid": 1, "tid": tid}
+        if args:
+            event["args"] = args
+        with self._lock:
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+            self._append(event)
+
+    def _enter(self, tid: int) -> None:
+        with self._lock:
+            self._active[tid] = self._active.get(tid, 0) + 1
+
+    def _exit(self, tid: int) -> None:
+        with self._lock:
+            depth = self._active.pop(tid) - 1
+            if depth:
+                self._active[tid] = depth
+
+    def to_chrome(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}},
+            *(
+                {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                for tid, name in threads.items()
+            ),
+        ]
+        trace = {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "trace_id": self.id,
+                "request": self.name,
+                "started_at": self.started_at,
+                "dropped_events": self.dropped,
+            },
+        }
+        if self._profiler is not None:
+            trace["stackFrames"] = self._profiler.stack_frames
+        return trace
+
+    def finish(self, directory: str | None = None) -> Path:
+        """Stop the profiler and write the trace, returning its path."""
+        if self._profiler is not None:
+            self._profiler.stop()
+        path = Path(directory or TRACE_DIR)
+        path.mkdir(parents=True, exist_ok=True)
+        path = path / f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}-{self.id}.json"
+        path.write_text(json.dumps(self.to_chrome()))
+        _prune(path.parent)
+        return path
+
+
+def _prune(directory: Path) -> None:
+    """Delete the oldest traces in ``directory`` beyond ``TRACE_MAX_FILES``."""
+    if TRACE_MAX_FILES <= 0:
+        return
+    # Names start with the start time, so they sort oldest first
+    traces = sorted(directory.glob("*.json"), key=lambda p: p.name)
+    for old in traces[:-TRACE_MAX_FILES]:
+        old.unlink(missing_ok=True)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "args", "tid", "start")
+
+    def __init__(self, trace: Trace, name: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.tid = threading.get_ident()
+        self.trace._enter(self.tid)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter()
+        self.trace._exit(self.tid)
+        self.trace.add(self.name, self.start, end, self.tid, **self.args)
+
+
+class _Profiler(threading.Thread):
+    """Sample the stacks of threads that are inside one of the trace's spans."""
+
+    def __init__(self, trace: Trace):
+        super().__init__(name=f"profiler-{trace.id}", daemon=True)
+        self.trace = trace
+        self.interval = TRACE_PROFILE_INTERVAL_MS / 1000
+        self.stack_frames: dict[str, dict] = {}
+        self._frame_ids: dict[tuple[str | None, str], str] = {}
+        self._done = threading.Event()
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+    def _frame_id(self, parent: str | None, label: str) -> str:
+        key = (parent, label)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = str(len(self._frame_ids))
+            frame = {"name": label, "category": "python"}
+            if parent is not None:
+                frame["parent"] = parent
+            self.stack_frames[frame_id] = frame
+        return frame_id
+
+    def run(self) -> None:
+        trace = self.trace
+        while not self._done.wait(self.interval):
+            now = time.perf_counter()
+            with trace._lock:
+                active = list(trace._active)
+            frames = sys._current_frames()
+            for tid in active:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parent = None
+                for label in reversed(stack):
+                    parent = self._frame_id(parent, label)
+                if parent is None:
+                    continue
+                with trace._lock:
+                    trace._append({"name": "sample", "ph": "P", "ts": trace._us(now), "pid": 1, "tid": tid, "sf": parent})
+
+
+def get_trace() -> Trace | None:
+    context = current_context.get()
+    return context.trace if context is not None else None
+
+
+def span(name: str, **args: Any):
+    """Time the enclosed block as ``name`` if the current request is traced."""
+    trace = get_trace()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name, args)
+
+
+def add_span(name: str, start: float, end: float, **args: Any) -> None:
+    """Record a span measured elsewhere, e.g. time spent waiting in a queue."""
+    trace = get_trace()
+    if trace is not None:
+        trace.add(name, start, end, **args)
+
+
+def start_trace(toggle: str | None, name: str) -> Trace | None:
+    """
+    A new trace if ``toggle`` (the X-Trace header or trace query parameter)
+    asks for one or the request is sampled, else None.
+    """
+    toggle = (toggle or "").strip().lower()
+    if toggle == "profile":
+        return Trace(name, profile=TRACE_ALLOW_PROFILE)
+    if toggle in ("1", "true", "yes"):
+        return Trace(name)
+    if toggle in ("0", "false", "no"):
+        return None
+    if TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE:
+        return Trace(name)
+    return None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that starts a trace for requests that ask for one and
+    writes it at the end. Only requests carrying ``api_key`` as a bearer token
+    may ask; without an ``api_key`` traces are only sampled.
+    """
+
+    def __init__(self, app, api_key: str | None = None):
+        self.app = app
+        self.api_key = api_key
+
+    def _authorized(self, headers: dict[bytes, bytes]) -> bool:
+        scheme, _, key = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+        return self.api_key is not None and scheme.lower() == "bearer" and key == self.api_key
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or ())
+        toggle = headers.get(b"x-trace", b"").decode("latin-1")
+        if not toggle:
+            toggle = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("trace", [""])[0]
+        if toggle and not self._authorized(headers):
+            # Anonymous clients must not be able to start profilers or write files
+            toggle = ""
+        trace = start_trace(toggle, f"{scope['type']} {scope['path']}")
+        if trace is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", trace.id.encode())]}
+            await send(message)
+
+        token = current_context.set(Context(webrtc_id=trace.id, trace=trace))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            # Not a span: the event loop thread runs other requests while this one awaits
+            trace.add("request", start, time.perf_counter(), path=scope["path"])
+            current_context.reset(token)
+            path = await asyncio.to_thread(trace.finish)
+            logger.info("Trace written to %s", path, extra={"trace_id": trace.id})
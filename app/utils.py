@@ -2,17 +2,21 @@
 import io
 import json
 import logging
+import struct
 import tempfile
 import warnings
 from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import Any, Literal, Protocol, TypedDict
+from typing import TYPE_CHECKING, Any, Literal, Protocol, TypedDict
 
 import numpy as np
 from fastapi import WebSocket
 from numpy.typing import NDArray
 # from pydub import AudioSegment
 
+if TYPE_CHECKING:
+    from app.tracing import Trace
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +27,104 @@ class AudioChunk(TypedDict):
     start: int
     end: int
 
+class AudioBuffer:
+    """
+    Growable int16 arena for accumulating an utterance.
+
+    Appends copy the chunk into preallocated storage, doubling the capacity
+    only when it runs out, so accumulating N samples costs O(N) instead of
+    the O(N^2) of repeated ``np.concatenate``. ``view`` returns the
+    accumulated samples without copying; it is only valid until the next
+    ``append`` or ``clear``.
+    """
+
+    __slots__ = ("_data", "_size")
+
+    def __init__(self, capacity: int = 16000):
+        self._data = np.empty(max(capacity, 1), dtype=np.int16)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def append(self, chunk: NDArray[np.int16]) -> None:
+        end = self._size + len(chunk)
+        if end > len(self._data):
+            grown = np.empty(max(end, 2 * len(self._data)), dtype=np.int16)
+            grown[: self._size] = self._data[: self._size]
+            self._data = grown
+        self._data[self._size : end] = chunk
+        self._size = end
+
+    def view(self) -> NDArray[np.int16]:
+        return self._data[: self._size]
+
+    def clear(self) -> None:
+        # Keep the storage so the next utterance does not allocate again
+        self._size = 0
+
+
+class FrameAssembler:
+    """
+    Re-frame int16 audio arriving in packets of any size into fixed hops.
+
+    ``append`` copies each packet once into preallocated storage, and
+    ``extend`` lets a decoder write a packet there directly. Every time
+    another ``hop`` samples are available, ``next_window`` returns a view of
+    the ``window`` samples ending there (fewer at the start of the stream),
+    so analysis slides by one hop whatever the packet size. Storage is only
+    compacted when it fills up, which keeps the cost per sample constant.
+    Views are valid until the next ``append``.
+    """
+
+    __slots__ = ("hop", "window", "_data", "_size", "_next")
+
+    def __init__(self, hop: int, window: int):
+        self.hop = max(hop, 1)
+        self.window = max(window, self.hop)
+        self._data = np.empty(4 * self.window, dtype=np.int16)
+        self._size = 0
+        # End of the next hop in _data
+        self._next = self.hop
+
+    def __len__(self) -> int:
+        """Samples received but not yet handed out by ``next_window``."""
+        return self._size - (self._next - self.hop)
+
+    def extend(self, n: int) -> NDArray[np.int16]:
+        """Add ``n`` samples and return the (uninitialized) view to write them into."""
+        end = self._size + n
+        if end > len(self._data):
+            # Only the window ending at the next hop is still needed
+            keep_from = max(self._next - self.window, 0)
+            kept = self._size - keep_from
+            if kept + n > len(self._data):
+                grown = np.empty(max(kept + n, 2 * len(self._data)), dtype=np.int16)
+                grown[:kept] = self._data[keep_from : self._size]
+                self._data = grown
+            else:
+                self._data[:kept] = self._data[keep_from : self._size]
+            self._size = kept
+            self._next -= keep_from
+            end = kept + n
+        start, self._size = self._size, end
+        return self._data[start:end]
+
+    def append(self, frame: NDArray[np.int16]) -> None:
+        self.extend(len(frame))[:] = frame
+
+    def next_window(self) -> NDArray[np.int16] | None:
+        if self._next > self._size:
+            return None
+        end = self._next
+        self._next += self.hop
+        return self._data[max(end - self.window, 0) : end]
+
+
 class AdditionalOutputs:
     def __init__(self, *args) -> None:
         self.args = args
@@ -62,6 +164,7 @@ current_channel: ContextVar[DataChannel | None] = ContextVar(
 class Context:
     webrtc_id: str
     websocket: WebSocket | None = None
+    trace: "Trace | None" = None
 
 
 current_context: ContextVar[Context | None] = ContextVar(
@@ -214,3 +317,54 @@ def audio_to_int16(
     else:
         raise TypeError(f"Unsupported audio data type: {audio.dtype}")
 
+
+def wav_header(
+    sample_rate: int,
+    num_samples: int | None = None,
+    channels: int = 1,
+    sample_width: int = 2,
+) -> bytes:
+    """
+    Build a 44-byte PCM WAV header.
+
+    Parameters
+    ----------
+    sample_rate : int
+        The audio sample rate in Hz
+    num_samples : int | None
+        Number of samples per channel that will follow, or None when streaming
+        and the length is not known yet. The RIFF and data sizes are then set to
+        0xFFFFFFFF, which players treat as "read until the end of the stream".
+
+    Returns
+    -------
+    bytes
+        The header, to be followed by little-endian PCM samples
+
+    Example
+    -------
+    >>> header = wav_header(24000)
+    >>> len(header)
+    44
+    """
+    if num_samples is None:
+        data_size = riff_size = 0xFFFFFFFF
+    else:
+        data_size = num_samples * channels * sample_width
+        riff_size = 36 + data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        riff_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        channels,
+        sample_rate,
+        sample_rate * channels * sample_width,
+        channels * sample_width,
+        sample_width * 8,
+        b"data",
+        data_size,
+    )
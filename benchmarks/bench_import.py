@@ -0,0 +1,82 @@
+"""
+Cold import time of the app, as reported by ``python -X importtime``.
+
+    python -m benchmarks.bench_import [--module app.main] [--budget-ms 2000] [--top 15]
+
+Prints the slowest modules by cumulative time and exits non-zero when the
+module takes longer than the budget (``IMPORT_BUDGET_MS``, shared with the
+import-time test) or pulls in one of the heavy dependencies that should
+only load on first use.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Generous enough for a loaded CI box, tight enough to catch torch or librosa
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 2000))
+
+# Loaded by model constructors or lifespan warmup, never by importing the app
+DEFERRED_MODULES = [
+    "click",
+    "huggingface_hub",
+    "kokoro",
+    "kokoro_onnx",
+    "librosa",
+    "moonshine_onnx",
+    "onnxruntime",
+    "scipy",
+    "soundfile",
+    "torch",
+]
+
+
+def measure_import(module: str) -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in microseconds of every module ``module`` loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def deferred_imports(times: dict[str, tuple[int, int]]) -> list[str]:
+    return sorted(
+        {name.split(".")[0] for name in times} & set(DEFERRED_MODULES)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    times = measure_import(args.module)
+    print(f"{'module':<50} {'self ms':>9} {'total ms':>9}")
+    for name, (self_us, cumulative_us) in sorted(
+        times.items(), key=lambda item: -item[1][1]
+    )[: args.top]:
+        print(f"{name:<50} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}")
+
+    total_ms = times[args.module][1] / 1000
+    heavy = deferred_imports(times)
+    print(f"\n{args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    if heavy:
+        print(f"Imported at module level: {', '.join(heavy)}")
+    if total_ms > args.budget_ms or heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compare the two resampling paths: soxr, used by ``resample`` for whole
+signals, and the cached polyphase filter behind ``StreamingResampler``.
+The librosa column is the ``librosa.resample`` call they replaced; librosa
+is no longer a dependency, so it is only measured when installed and shows
+as "-" otherwise.
+
+    python -m benchmarks.bench_resample [--repeat N]
+
+Per-chunk times are the best of N runs with warm caches. The cold lines are
+the first call in a fresh interpreter, including imports and filter design.
+"""
+import argparse
+import importlib.util
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from app.service.resample import StreamingResampler, get_filter, resample
+
+RATE_PAIRS = [(8000, 16000), (24000, 16000), (24000, 8000), (48000, 16000)]
+CHUNK_DURATIONS = [0.02, 0.4, 5.0]
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+COLD_SNIPPETS = {
+    "soxr": "from app.service.resample import resample; resample(x, 8000, 16000)",
+    "polyphase": "from app.service.resample import StreamingResampler; StreamingResampler(8000, 16000).process(x)",
+}
+HAS_LIBROSA = importlib.util.find_spec("librosa") is not None
+if HAS_LIBROSA:
+    COLD_SNIPPETS["librosa"] = "import librosa; librosa.resample(x, orig_sr=8000, target_sr=16000)"
+
+
+def _cold_start(snippet: str) -> float:
+    code = (
+        "import time, numpy as np; x = np.zeros(3200, dtype=np.float32); "
+        f"t = time.perf_counter(); {snippet}; print(time.perf_counter() - t)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, snippet in COLD_SNIPPETS.items():
+        print(f"cold first call ({name}, 8000->16000, 400ms): {_cold_start(snippet) * 1e3:.1f}ms")
+    print()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'rates':>14} {'chunk':>7} {'librosa':>10} {'soxr':>10} {'polyphase':>10} "
+        f"{'streaming':>10} {'speedup':>8}"
+    )
+    for src, dst in RATE_PAIRS:
+        get_filter(src, dst)  # build the filter outside the timed region, as the cache does
+        for chunk_duration in CHUNK_DURATIONS:
+            n_chunks = max(int(5.0 / chunk_duration), 1)
+            chunk = (0.1 * rng.standard_normal(int(src * chunk_duration))).astype(np.float32)
+
+            f = get_filter(src, dst)
+            padded = np.pad(chunk, f.half_width)
+
+            def run_librosa():
+                import librosa
+
+                for _ in range(n_chunks):
+                    librosa.resample(chunk, orig_sr=src, target_sr=dst)
+
+            def run_soxr():
+                for _ in range(n_chunks):
+                    resample(chunk, src, dst)
+
+            def run_polyphase():
+                for _ in range(n_chunks):
+                    f.apply(padded, -f.half_width, 0, f.output_length(len(chunk)))
+
+            def run_streaming():
+                r = StreamingResampler(src, dst)
+                for _ in range(n_chunks):
+                    r.process(chunk)
+                r.flush()
+
+            librosa_column = (
+                f"{_best_of(run_librosa, args.repeat) / n_chunks * 1e3:>8.3f}ms" if HAS_LIBROSA else f"{'-':>10}"
+            )
+            t_soxr = _best_of(run_soxr, args.repeat) / n_chunks
+            t_polyphase = _best_of(run_polyphase, args.repeat) / n_chunks
+            t_streaming = _best_of(run_streaming, args.repeat) / n_chunks
+            # Above 1x the polyphase filter is faster than soxr for this chunk size
+            print(
+                f"{src:>6}->{dst:<6} {chunk_duration * 1000:>5.0f}ms {librosa_column} "
+                f"{t_soxr * 1e3:>8.3f}ms {t_polyphase * 1e3:>8.3f}ms "
+                f"{t_streaming * 1e3:>8.3f}ms {t_soxr / t_polyphase:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compare latency and real-time factor of the TTS engines.
+
+    python -m benchmarks.bench_tts_engines [--engines onnx torch] [--repeat N] [--voice af_heart]
+
+For each engine and input length this reports load time (including warmup),
+time to first audio through ``stream_tts``, total ``tts`` latency and the
+real-time factor (synthesis time / audio duration, lower is better). Times
+are the median of N runs. The segment cache of the ONNX engine is cleared
+before every run so repeated inputs are really synthesized.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.service.cache import LRUCache
+from app.service.tts import KokoroTTSOptions, TTS_ENGINES, get_tts_model
+
+TEXTS = {
+    "short": "Thanks for calling.",
+    "medium": (
+        "Thanks for calling, how can I help you today? "
+        "I can check your balance, update your address or connect you to an agent."
+    ),
+    "long": " ".join(
+        [
+            "Your order shipped this morning and should arrive within three business days.",
+            "You will get a text message with the tracking number shortly.",
+            "If the package has not arrived by Friday, call us back and we will send a replacement.",
+            "Is there anything else I can help you with today?",
+        ]
+        * 3
+    ),
+}
+
+
+def _clear_caches(model) -> None:
+    # Measure synthesis, not cache hits
+    for name in ("segment_cache", "phoneme_cache"):
+        cache = getattr(model, name, None)
+        if cache is not None:
+            setattr(model, name, LRUCache(cache.max_bytes, cache.sizeof))
+
+
+async def _first_audio(model, text: str, options: KokoroTTSOptions) -> float:
+    start = time.perf_counter()
+    stream = model.stream_tts(text, options)
+    async for _ in stream:
+        elapsed = time.perf_counter() - start
+        await stream.aclose()
+        return elapsed
+    return float("nan")
+
+
+def bench_engine(engine: str, repeat: int, voice: str) -> list[dict]:
+    start = time.perf_counter()
+    model = get_tts_model(engine)
+    load = time.perf_counter() - start
+    options = KokoroTTSOptions(voice=voice)
+
+    rows = []
+    for name, text in TEXTS.items():
+        ttfa, total, rtf = [], [], []
+        for _ in range(repeat):
+            _clear_caches(model)
+            ttfa.append(asyncio.run(_first_audio(model, text, options)))
+            _clear_caches(model)
+            start = time.perf_counter()
+            sample_rate, audio = model.tts(text, options)
+            elapsed = time.perf_counter() - start
+            total.append(elapsed)
+            rtf.append(elapsed / (len(audio) / sample_rate))
+        rows.append(
+            {
+                "engine": engine,
+                "input": name,
+                "chars": len(text),
+                "load_s": load,
+                "ttfa_s": statistics.median(ttfa),
+                "total_s": statistics.median(total),
+                "rtf": statistics.median(rtf),
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", default=list(TTS_ENGINES), choices=list(TTS_ENGINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--voice", default="af_heart")
+    args = parser.parse_args()
+
+    print(
+        f"{'engine':<7} {'input':<7} {'chars':>6} {'load s':>8} "
+        f"{'ttfa s':>8} {'total s':>8} {'rtf':>6}"
+    )
+    for engine in args.engines:
+        for row in bench_engine(engine, args.repeat, args.voice):
+            print(
+                f"{row['engine']:<7} {row['input']:<7} {row['chars']:>6} "
+                f"{row['load_s']:>8.2f} {row['ttfa_s']:>8.3f} {row['total_s']:>8.3f} "
+                f"{row['rtf']:>6.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Latency and real-time-factor benchmarks for the STT and TTS hot paths.
+
+    python -m benchmarks.run [--suites stt tts pause websocket] [--repeat N]
+                             [--callers N] [--output results.json]
+                             [--baseline benchmarks/baseline.json] [--tolerance 0.15]
+                             [--save-baseline]
+
+Inputs are the bundled tests/test_file.wav and synthetic text and audio, so
+nothing beyond the model weights in the Hugging Face cache is needed.
+
+Suites:
+  stt        MoonshineSTT.stt RTF by audio length and input sample rate
+  tts        KokoroTTSModel.tts RTF and stream_tts time to first chunk by text length
+  pause      determine_pause cost per chunk, for speech and silence
+  websocket  /stt/ end-of-speech to final transcript latency with N concurrent callers
+
+Every metric is "lower is better" and reported as the median of --repeat runs
+(the websocket suite reports p50/p95 over callers). Results are written as
+JSON; with --baseline, each metric is compared with the stored value and the
+run exits non-zero when one is more than --tolerance slower.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+
+from app.service.resample import resample
+
+ROOT = Path(__file__).resolve().parent.parent
+TEST_FILE = ROOT / "tests" / "test_file.wav"
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baseline.json"
+SUITES = ["stt", "tts", "pause", "websocket"]
+
+
+def _median_time(fn: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def load_test_audio(sample_rate: int) -> np.ndarray:
+    import soundfile as sf
+
+    audio, file_rate = sf.read(str(TEST_FILE), dtype="float32")
+    return resample(audio, file_rate, sample_rate)
+
+
+def _audio_of_length(audio: np.ndarray, sample_rate: int, seconds: float) -> np.ndarray:
+    n = int(seconds * sample_rate)
+    return np.tile(audio, -(-n // len(audio)))[:n]
+
+
+def bench_stt(repeat: int) -> dict[str, float]:
+    from app.api.stt import STT_REPO
+    from app.service.batching import BatchingSTT
+    from app.service.stt import get_stt_model
+
+    model = get_stt_model(STT_REPO)
+    # Time the model itself, not the batching scheduler in front of it. Without
+    # batching or a pool get_stt_model returns the bare MoonshineSTT.
+    if isinstance(model, BatchingSTT):
+        model = model.model
+    results = {}
+    for sample_rate in (8000, 16000):
+        speech = load_test_audio(sample_rate)
+        for seconds in (1, 2, 5, 10):
+            audio = _audio_of_length(speech, sample_rate, seconds)
+            elapsed = _median_time(lambda: model.stt((sample_rate, audio)), repeat)
+            results[f"stt/{sample_rate}hz/{seconds}s/latency_s"] = elapsed
+            results[f"stt/{sample_rate}hz/{seconds}s/rtf"] = elapsed / seconds
+    return results
+
+
+def bench_tts(repeat: int) -> dict[str, float]:
+    import asyncio
+
+    from benchmarks.bench_tts_engines import TEXTS, _clear_caches, _first_audio
+    from app.service.tts import KokoroTTSOptions, get_tts_model
+
+    model = get_tts_model("onnx")
+    options = KokoroTTSOptions()
+    results = {}
+    for name, text in TEXTS.items():
+        ttfc, total, rtf = [], [], []
+        for _ in range(repeat):
+            _clear_caches(model)
+            ttfc.append(asyncio.run(_first_audio(model, text, options)))
+            _clear_caches(model)
+            start = time.perf_counter()
+            sample_rate, audio = model.tts(text, options)
+            total.append(time.perf_counter() - start)
+            rtf.append(total[-1] / (len(audio) / sample_rate))
+        results[f"tts/{name}/stream_first_chunk_s"] = statistics.median(ttfc)
+        results[f"tts/{name}/latency_s"] = statistics.median(total)
+        results[f"tts/{name}/rtf"] = statistics.median(rtf)
+    return results
+
+
+def bench_pause(repeat: int) -> dict[str, float]:
+    from app.api.stt import STT_CHUNK_DURATION, AudioState, determine_pause
+
+    sample_rate = 8000
+    n = int(STT_CHUNK_DURATION * sample_rate)
+    speech = (load_test_audio(sample_rate)[:n] * 32767).astype(np.int16)
+    silence = np.zeros(n, dtype=np.int16)
+    results = {}
+    calls = 50
+    for name, chunk in (("speech", speech), ("silence", silence)):
+
+        def run():
+            state = AudioState(sample_rate)
+            for _ in range(calls):
+                determine_pause(chunk, state)
+                state.reset()
+
+        elapsed = _median_time(run, repeat)
+        results[f"pause/{name}/per_chunk_us"] = elapsed / calls * 1e6
+    return results
+
+
+def _caller(client, api_key: str, audio: np.ndarray, sample_rate: int, chunk: int, realtime: bool) -> float | None:
+    """
+    Stream the recording, then silence and stop; seconds from the first silent
+    chunk to the last final transcript. The test recording holds two
+    utterances and the first is final before the silence is sent, so
+    everything is read until the server closes and the last final is timed.
+    """
+    silence = np.zeros(chunk, dtype=np.int16)
+    with client.websocket_connect("/stt/", headers={"Authorization": f"Bearer {api_key}"}) as ws:
+        ws.send_json({"type": "start", "language": "en-US", "sampleRateHz": sample_rate})
+        for i in range(0, len(audio), chunk):
+            ws.send_bytes(audio[i : i + chunk].tobytes())
+            if realtime:
+                time.sleep(chunk / sample_rate)
+        start = time.perf_counter()
+        ws.send_bytes(silence.tobytes())
+        ws.send_json({"type": "stop"})
+        last = None
+        while True:
+            try:
+                message = ws.receive_json()
+            except Exception:
+                break
+            if message.get("type") != "transcription":
+                return None
+            last = time.perf_counter() - start
+        return last
+
+
+def bench_websocket(callers: int, realtime: bool) -> dict[str, float]:
+    from fastapi.testclient import TestClient
+
+    from app.api.stt import STT_CHUNK_DURATION, STT_REPO
+    from app.auth import API_KEY
+    from app.main import app
+    from app.service.stt import get_stt_model
+
+    get_stt_model(STT_REPO)  # load outside the measurement
+    sample_rate = 8000
+    chunk = int(STT_CHUNK_DURATION * sample_rate)
+    audio = (load_test_audio(sample_rate) * 32767).astype(np.int16)
+    # Whole chunks only, so the last speech chunk is not merged with the silence
+    audio = audio[: len(audio) // chunk * chunk]
+
+    client = TestClient(app)
+    latencies: list[float | None] = [None] * callers
+
+    def run(i: int):
+        latencies[i] = _caller(client, API_KEY, audio, sample_rate, chunk, realtime)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(callers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done = [latency for latency in latencies if latency is not None]
+    return {
+        f"websocket/{callers}_callers/final_p50_s": _percentile(done, 50),
+        f"websocket/{callers}_callers/final_p95_s": _percentile(done, 95),
+        f"websocket/{callers}_callers/failed": float(callers - len(done)),
+    }
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Print each metric against the baseline and return the ones that regressed."""
+    regressions = []
+    print(f"{'metric':<48} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None or not base:
+            print(f"{name:<48} {'-':>10} {value:>10.4g} {'new':>8}")
+            continue
+        change = value / base - 1
+        flag = " !" if change > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<48} {base:>10.4g} {value:>10.4g} {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", nargs="+", default=SUITES, choices=SUITES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--callers", type=int, default=4)
+    parser.add_argument("--no-realtime", action="store_true", help="send websocket audio as fast as possible")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    results: dict[str, float] = {}
+    for suite in args.suites:
+        print(f"Running {suite} benchmarks...", file=sys.stderr)
+        if suite == "stt":
+            results.update(bench_stt(args.repeat))
+        elif suite == "tts":
+            results.update(bench_tts(args.repeat))
+        elif suite == "pause":
+            results.update(bench_pause(args.repeat))
+        elif suite == "websocket":
+            results.update(bench_websocket(args.callers, not args.no_realtime))
+
+    report = json.dumps({"meta": metadata(), "results": results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(report)
+        print(f"Saved baseline to {baseline_path}", file=sys.stderr)
+        return
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())["results"]
+        with contextlib.redirect_stdout(sys.stderr):
+            regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+
+class FakeTokenizer:
+    def phonemize(self, text, lang):
+        return text.lower()
+
+
+class FakeKokoro:
+    """Stands in for kokoro_onnx.Kokoro: each sentence becomes render(phonemes) at 24 kHz"""
+
+    calls = 0
+
+    def __init__(self):
+        self.tokenizer = FakeTokenizer()
+
+    @classmethod
+    def from_session(cls, session, voices_path):
+        return cls()
+
+    @staticmethod
+    def render(phonemes: str) -> np.ndarray:
+        return np.zeros(2400, dtype=np.float32)
+
+    def create(self, phonemes, voice, speed, lang, is_phonemes=False):
+        FakeKokoro.calls += 1
+        return self.render(phonemes), 24000
+
+
+@pytest.fixture
+def fake_kokoro(monkeypatch):
+    """Load KokoroTTSModel without weights; tests set ``render`` on the returned class"""
+    import huggingface_hub
+    import kokoro_onnx
+    import onnxruntime
+
+    monkeypatch.setattr(huggingface_hub, "hf_hub_download", lambda *args: "unused")
+    monkeypatch.setattr(onnxruntime, "InferenceSession", lambda *args, **kwargs: None)
+    monkeypatch.setattr(kokoro_onnx, "Kokoro", FakeKokoro)
+    monkeypatch.setattr(FakeKokoro, "calls", 0)
+    return FakeKokoro
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.service.batching import BatchingSTT
+from app.service.pool import ModelPool, SessionConfig
+
+
+class FakeSTT:
+    def __init__(self, name):
+        self.name = name
+        self.threads = set()
+
+    def stt_batch(self, audios):
+        self.threads.add(threading.current_thread().name)
+        return [f"{self.name}:{len(a)}" for _, a in audios]
+
+
+def test_lease_hands_out_each_model_once():
+    pool = ModelPool(["a", "b"])
+
+    with pool.lease() as first, pool.lease() as second:
+        assert {first, second} == {"a", "b"}
+        assert pool.available == 0
+    assert pool.available == 2
+    assert pool.stats()["leases"] == 2
+
+
+def test_lease_counts_are_not_lost_between_threads():
+    pool = ModelPool(["a", "b"])
+
+    def lease_many():
+        for _ in range(2000):
+            with pool.lease():
+                pass
+
+    threads = [threading.Thread(target=lease_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool.stats()["leases"] == 8000
+
+
+def test_batching_stt_runs_one_scheduler_per_pooled_model():
+    pool = ModelPool([FakeSTT("a"), FakeSTT("b")])
+    batcher = BatchingSTT(pool, max_batch_size=1)
+
+    texts = batcher.stt_batch([(16000, np.zeros(n, dtype=np.float32)) for n in range(1, 9)])
+
+    assert [t.split(":")[1] for t in texts] == [str(n) for n in range(1, 9)]
+    assert len(batcher._threads) == 2
+
+
+def test_session_options_follow_config():
+    ort = pytest.importorskip("onnxruntime")
+    config = SessionConfig(inter_op_threads=2, graph_optimization="basic")
+
+    opts = config.session_options(threads=3, cores=[4, 5, 6])
+
+    assert opts.intra_op_num_threads == 3
+    assert opts.inter_op_num_threads == 2
+    assert opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    assert opts.get_session_config_entry("session.intra_op_thread_affinities") == "6;7"
+    with pytest.raises(ValueError):
+        SessionConfig(graph_optimization="max").session_options(threads=1)
@@ -0,0 +1,23 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+
+
+def test_ready_fails_until_warmup_is_done(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(main, "get_tts_model", lambda: release.wait(5))
+    monkeypatch.setattr(main, "get_stt_model", lambda repo: None)
+
+    with TestClient(main.app) as client:
+        assert client.get("/ready").status_code == 503
+        release.set()
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            threading.Event().wait(0.05)
+
+        assert response.status_code == 200
+        assert {"tts", "stt", "vad", "resample"} <= set(response.json()["stages"])
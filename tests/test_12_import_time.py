@@ -0,0 +1,14 @@
+from benchmarks.bench_import import IMPORT_BUDGET_MS, deferred_imports, measure_import
+
+
+def test_app_import_defers_heavy_dependencies():
+    times = measure_import("app.main")
+
+    assert deferred_imports(times) == []
+
+
+def test_app_import_fits_budget():
+    # Best of three, the first run also pays for a cold disk cache
+    total_ms = min(measure_import("app.main")["app.main"][1] for _ in range(3)) / 1000
+
+    assert total_ms < IMPORT_BUDGET_MS
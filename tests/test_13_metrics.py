@@ -0,0 +1,32 @@
+from app.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.labels("tts").observe(value)
+
+    text = registry.render()
+
+    assert 'latency_seconds_bucket{route="tts",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="tts",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="tts",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="tts"} 3' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_counters_and_gauges():
+    registry = Registry()
+    registry.counter("shed", "Shed jobs.").inc(2)
+    sessions = registry.gauge("sessions", "Open sessions.", ("endpoint",))
+    sessions.labels("stt").inc()
+    sessions.labels("stt").inc()
+    sessions.labels("stt").dec()
+    registry.gauge("depth", "Queue depth.").set_function(lambda: 7)
+
+    text = registry.render()
+
+    assert "shed_total 2" in text
+    assert 'sessions{endpoint="stt"} 1' in text
+    assert "depth 7" in text
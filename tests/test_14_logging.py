@@ -0,0 +1,33 @@
+import json
+import logging
+
+from app.log import JSONFormatter, SamplingFilter, SessionFilter
+from app.utils import Context, current_context
+
+
+def _record(level=logging.INFO, **extra):
+    record = logging.LogRecord("app.test", level, __file__, 1, "Pause %s", ("detected",), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_records_carry_session_and_extra_fields():
+    token = current_context.set(Context(webrtc_id="abc123"))
+    try:
+        record = _record(dur_vad=0.05)
+        SessionFilter().filter(record)
+    finally:
+        current_context.reset(token)
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry["session"] == "abc123"
+    assert entry["message"] == "Pause detected"
+    assert entry["dur_vad"] == 0.05
+
+
+def test_sampling_keeps_warnings():
+    sampler = SamplingFilter(0.0)
+
+    assert not sampler.filter(_record(logging.DEBUG))
+    assert sampler.filter(_record(logging.WARNING))
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import tracing
+from app.service.executor import InferenceExecutor
+from app.tracing import Trace, TracingMiddleware, span
+from app.utils import Context, current_context
+
+
+def _names(trace: Trace) -> list[str]:
+    return [e["name"] for e in trace.to_chrome()["traceEvents"] if e["ph"] == "X"]
+
+
+def test_spans_are_recorded_only_for_traced_contexts():
+    with span("untraced"):
+        pass
+
+    trace = Trace("test")
+    token = current_context.set(Context(webrtc_id="abc", trace=trace))
+    try:
+        with span("outer", n=1):
+            with span("inner"):
+                pass
+    finally:
+        current_context.reset(token)
+
+    events = {e["name"]: e for e in trace.to_chrome()["traceEvents"] if e["ph"] == "X"}
+    assert set(events) == {"outer", "inner"}
+    assert events["outer"]["args"] == {"n": 1}
+    assert events["outer"]["dur"] >= events["inner"]["dur"]
+
+
+def test_executor_jobs_record_into_the_callers_trace():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=4)
+    trace = Trace("test")
+
+    def job():
+        with span("work"):
+            return 42
+
+    async def run():
+        current_context.set(Context(webrtc_id="abc", trace=trace))
+        return await executor.submit(job)
+
+    assert asyncio.run(run()) == 42
+    assert _names(trace) == ["queue_wait", "work", "job"]
+
+
+def traced_app(tmp_path, monkeypatch) -> FastAPI:
+    monkeypatch.setattr(tracing, "TRACE_DIR", str(tmp_path))
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware, api_key="secret")
+
+    @app.get("/slow")
+    def slow():
+        with span("sleep"):
+            time.sleep(0.05)
+        return {}
+
+    return app
+
+
+def test_middleware_writes_chrome_trace(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_ALLOW_PROFILE", True)
+    client = TestClient(traced_app(tmp_path, monkeypatch))
+    assert "x-trace-id" not in client.get("/slow").headers
+    assert not list(tmp_path.iterdir())
+
+    response = client.get("/slow?trace=profile", headers={"Authorization": "Bearer secret"})
+    trace_id = response.headers["x-trace-id"]
+    (path,) = tmp_path.iterdir()
+    assert trace_id in path.name
+
+    trace = json.loads(path.read_text())
+    phases = {e["name"]: e["ph"] for e in trace["traceEvents"]}
+    assert phases["sleep"] == "X"
+    assert phases["request"] == "X"
+    samples = [e for e in trace["traceEvents"] if e["ph"] == "P"]
+    assert samples
+    assert all(e["sf"] in trace["stackFrames"] for e in samples)
+
+
+def test_anonymous_requests_cannot_ask_for_traces(tmp_path, monkeypatch):
+    client = TestClient(traced_app(tmp_path, monkeypatch))
+
+    assert "x-trace-id" not in client.get("/slow", headers={"X-Trace": "profile"}).headers
+    assert "x-trace-id" not in client.get("/slow?trace=1", headers={"Authorization": "Bearer wrong"}).headers
+    assert not list(tmp_path.iterdir())
+
+
+def test_only_the_newest_traces_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_MAX_FILES", 2)
+    for i in range(3):
+        Trace(f"request {i}").finish(str(tmp_path))
+
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,65 @@
+import io
+import json
+import zipfile
+
+from fastapi.testclient import TestClient
+
+import app.api.tts as tts_api
+from app.auth import API_KEY
+from app.main import app
+from app.service.cache import CachedAudio
+from app.utils import wav_header
+
+HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+
+ITEMS = [
+    {"text": "Please hold.", "voice": "af_heart"},
+    {"text": "Goodbye.", "voice": "am_adam"},
+    {"text": "Please hold.", "voice": "af_heart"},
+    {"text": "Fail me.", "voice": "af_heart"},
+]
+
+
+def fake_render(calls):
+    def render(tts_request):
+        calls.append(tts_request.text)
+        if tts_request.text == "Fail me.":
+            raise RuntimeError("synthesis failed")
+        # A quarter second of silence at 8 kHz
+        return CachedAudio(8000, wav_header(8000, 2000) + bytes(4000))
+
+    return render
+
+
+def test_batch_ndjson_dedupes_and_reports_throughput(monkeypatch):
+    calls = []
+    monkeypatch.setattr(tts_api, "render", fake_render(calls))
+
+    response = TestClient(app).post("/tts/batch", json={"items": ITEMS}, headers=HEADERS)
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {tuple(line["indices"]): line for line in lines[:-1]}
+    assert sorted(calls) == ["Fail me.", "Goodbye.", "Please hold."]
+    assert set(results) == {(0, 2), (1,), (3,)}
+    assert results[(3,)]["type"] == "error"
+    assert results[(1,)]["sample_rate"] == 8000
+
+    summary = lines[-1]
+    assert summary["type"] == "summary"
+    assert (summary["items"], summary["unique"], summary["failed"]) == (4, 3, 1)
+    assert summary["audio_s"] == 0.5
+
+
+def test_batch_zip_has_a_file_per_item(monkeypatch):
+    monkeypatch.setattr(tts_api, "render", fake_render([]))
+
+    response = TestClient(app).post(
+        "/tts/batch", json={"items": ITEMS, "output": "zip"}, headers=HEADERS
+    )
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == ["00000.wav", "00001.wav", "00002.wav", "summary.json"]
+    assert archive.read("00000.wav") == archive.read("00002.wav")
+    summary = json.loads(archive.read("summary.json"))
+    assert summary["errors"] == {"3": "synthesis failed"}
@@ -0,0 +1,128 @@
+import io
+import os
+
+import numpy as np
+import soundfile as sf
+from fastapi.testclient import TestClient
+
+import app.api.stt as stt_api
+import app.service.stt as stt_service
+from app.auth import API_KEY
+from app.main import app
+from app.service.batching import BatchingSTT
+from app.service.executor import InferenceExecutor, Priority
+from app.service.vad import SpeechSegmenter
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), "test_file.wav")
+HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+
+
+def recording() -> tuple[np.ndarray, int]:
+    """Speech at 2 s and 12 s in 20 s of silence"""
+    speech, sample_rate = sf.read(TEST_FILE, dtype="float32")
+    audio = np.zeros(20 * sample_rate, dtype=np.float32)
+    for start in (2, 12):
+        audio[start * sample_rate : start * sample_rate + len(speech)] = speech
+    return audio, sample_rate
+
+
+def wav_bytes(audio: np.ndarray, sample_rate: int) -> bytes:
+    wav = io.BytesIO()
+    sf.write(wav, audio, sample_rate, format="WAV")
+    return wav.getvalue()
+
+
+class FakeSTT:
+    """Transcribes to the segment length in seconds"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def stt(self, audio):
+        self.calls += 1
+        return f"{len(audio[1]) / audio[0]:.1f}s"
+
+
+class RecordingExecutor(InferenceExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2, max_queue_size=8)
+        self.priorities = []
+
+    def submit_future(self, fn, *args, priority=None):
+        self.priorities.append(priority)
+        return super().submit_future(fn, *args, priority=priority)
+
+
+def test_segmenter_is_independent_of_block_size():
+    audio, sample_rate = recording()
+
+    def segments(block: int):
+        segmenter = SpeechSegmenter(sample_rate)
+        found = []
+        for i in range(0, len(audio), block):
+            found += segmenter.push(audio[i : i + block])
+        found += segmenter.flush()
+        return [(c["start"], c["end"]) for c, _ in found]
+
+    whole = segments(len(audio))
+    assert len(whole) == 2
+    assert segments(sample_rate // 10) == whole
+
+
+def test_file_endpoint_returns_ordered_segments(monkeypatch):
+    model = FakeSTT()
+    executor = RecordingExecutor()
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: model)
+    monkeypatch.setattr(stt_service, "get_inference_executor", lambda: executor)
+    audio, sample_rate = recording()
+    # Telephony rate, so the upload is resampled on the way in
+    wav = wav_bytes(audio[::2], sample_rate // 2)
+
+    response = TestClient(app).post(
+        "/stt/file", files={"file": ("call.wav", wav, "audio/wav")}, headers=HEADERS
+    )
+
+    result = response.json()
+    assert result["duration"] == 20.0
+    assert model.calls == 2
+    # Queued behind live STT
+    assert executor.priorities == [Priority.BATCH] * 2
+    (first, second) = result["segments"]
+    assert 1.5 < first["start"] < 2.5 and first["end"] < second["start"]
+    assert 11.5 < second["start"] < 12.5
+    assert result["text"] == f"{first['text']} {second['text']}"
+
+
+class FakeBatchSTT:
+    """Records the size of each batch it decodes"""
+
+    def __init__(self):
+        self.batches = []
+
+    def stt_batch(self, audios):
+        self.batches.append(len(audios))
+        return [f"{len(audio) / sr:.1f}s" for sr, audio in audios]
+
+
+def test_file_segments_are_batched_with_one_batch_worker(monkeypatch):
+    model = FakeBatchSTT()
+    executor = InferenceExecutor(max_workers=2, max_queue_size=8, tts_workers=1)
+    monkeypatch.setattr(stt_service, "get_inference_executor", lambda: executor)
+    audio, sample_rate = recording()
+
+    result = stt_service.transcribe_file(
+        io.BytesIO(wav_bytes(audio, sample_rate)), BatchingSTT(model, max_batch_size=2, max_wait=1.0)
+    )
+
+    assert len(result["segments"]) == 2
+    assert model.batches == [2]
+
+
+def test_file_endpoint_rejects_unreadable_audio(monkeypatch):
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: FakeSTT())
+
+    response = TestClient(app).post(
+        "/stt/file", files={"file": ("call.wav", b"not audio", "audio/wav")}, headers=HEADERS
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,177 @@
+import os
+import threading
+
+import numpy as np
+import soundfile as sf
+from fastapi.testclient import TestClient
+
+import app.api.stt as stt_api
+from app.api.stt import AudioState, determine_pause, finish_stream, stream_stt_with_pause_detection
+from app.auth import API_KEY
+from app.main import app
+from app.service.batching import BatchingSTT
+from app.service.codecs import FRAME_HEADER, encode_audio
+from app.service.resample import resample
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), "test_file.wav")
+
+
+def pauses(signal: np.ndarray, packet: int) -> list[tuple[float, float]]:
+    """(time of the packet that ended the utterance, seconds buffered) per utterance"""
+    state = AudioState(8000)
+    found = []
+    for i in range(0, len(signal), packet):
+        if determine_pause(signal[i : i + packet], state):
+            found.append(((i + packet) / 8000, len(state.buffer) / 8000))
+            state.reset()
+    return found
+
+
+def utterance() -> np.ndarray:
+    """Speech between a second of silence before and two after, at 8 kHz"""
+    speech, sample_rate = sf.read(TEST_FILE, dtype="float32")
+    speech = (resample(speech, sample_rate, 8000) * 32767).astype(np.int16)
+    silence = np.zeros(8000, dtype=np.int16)
+    return np.concatenate([silence, speech, silence, silence])
+
+
+def test_20ms_packets_detect_the_same_utterances_sooner():
+    signal = utterance()
+
+    rtp = pauses(signal, 160)
+    batched = pauses(signal, 3200)
+
+    assert rtp
+    assert [buffered for _, buffered in rtp] == [buffered for _, buffered in batched]
+    assert all(a <= b for (a, _), (b, _) in zip(rtp, batched))
+
+
+class FakeSTT:
+    def __init__(self):
+        self.seconds = []
+
+    def stt(self, audio):
+        sample_rate, samples = audio
+        self.seconds.append(len(samples) / sample_rate)
+        return "hello"
+
+
+def test_mulaw_frames_with_headers_report_and_fill_lost_frames(monkeypatch):
+    model = FakeSTT()
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: model)
+    signal = utterance()
+    frames = [signal[i : i + 160] for i in range(0, len(signal), 160)]
+    lost = {100, 101, 102}
+
+    client = TestClient(app)
+    with client.websocket_connect("/stt/", headers={"Authorization": f"Bearer {API_KEY}"}) as ws:
+        ws.send_json({"type": "start", "sampleRateHz": 8000, "encoding": "MULAW", "frameHeader": True})
+        for seq, frame in enumerate(frames):
+            if seq not in lost:
+                ws.send_bytes(FRAME_HEADER.pack(seq, seq * 160) + encode_audio(frame, "mulaw"))
+        ws.send_bytes(FRAME_HEADER.pack(50, 50 * 160) + encode_audio(frames[50], "mulaw"))
+        ws.send_json({"type": "stop"})
+        messages = []
+        while True:
+            try:
+                messages.append(ws.receive_json())
+            except Exception:
+                break
+
+    warnings = [m for m in messages if m["type"] == "warning"]
+    assert warnings[0] == {"type": "warning", "code": "frames_lost", "seq": 103, "lost": 3, "silence_ms": 60}
+    assert warnings[1]["code"] == "frame_out_of_order"
+    assert any(m["type"] == "transcription" for m in messages)
+
+
+def test_one_frame_with_several_utterances_gets_a_final_for_each(monkeypatch):
+    model = FakeSTT()
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: model)
+    silence = np.zeros(8000, dtype=np.int16)
+    speech = utterance()[8000:-16000]
+    # Two utterances that end in a pause and a third cut off by stop
+    signal = np.concatenate([silence, speech, silence, speech, silence, speech[:8000]])
+
+    client = TestClient(app)
+    with client.websocket_connect("/stt/", headers={"Authorization": f"Bearer {API_KEY}"}) as ws:
+        ws.send_json({"type": "start", "sampleRateHz": 8000})
+        ws.send_bytes(signal.tobytes())
+        ws.send_json({"type": "stop"})
+        messages = []
+        while True:
+            try:
+                messages.append(ws.receive_json())
+            except Exception:
+                break
+
+    # The recording pauses once, so each copy is two utterances, then the cut-off second
+    assert [m["is_final"] for m in messages] == [True] * 5
+    assert len(model.seconds) == 5
+    assert np.allclose(model.seconds[:2], model.seconds[2:4], atol=0.1)
+    assert 0.5 < model.seconds[4] <= 1.0
+
+
+def test_stop_runs_unjudged_hops_through_pause_detection(monkeypatch):
+    model = FakeSTT()
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: model)
+    state = AudioState(8000)
+    # Audio decoded but never judged, as when its chunk was refused with queue_full
+    state.frames.append(np.concatenate([utterance(), utterance()[:24000]]))
+
+    assert [final.result(1) for final in finish_stream(state)] == ["hello"] * 3
+    assert len(state.buffer) == 0
+
+
+def test_malformed_frames_are_rejected_without_ending_the_session(monkeypatch):
+    signal = utterance()
+    frames = [
+        FRAME_HEADER.pack(seq, i) + signal[i : i + 160].tobytes()
+        for seq, i in enumerate(range(0, len(signal), 160))
+    ]
+
+    def session(malformed: list[bytes]) -> tuple[list[dict], list[float]]:
+        model = FakeSTT()
+        monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: model)
+        with TestClient(app).websocket_connect("/stt/", headers={"Authorization": f"Bearer {API_KEY}"}) as ws:
+            ws.send_json({"type": "start", "sampleRateHz": 8000, "frameHeader": True})
+            for frame in malformed + frames:
+                ws.send_bytes(frame)
+            ws.send_json({"type": "stop"})
+            messages = []
+            while True:
+                try:
+                    messages.append(ws.receive_json())
+                except Exception:
+                    break
+        return messages, model.seconds
+
+    # Shorter than the header, then an odd number of PCM16 bytes
+    messages, seconds = session([b"\x00\x01\x02", frames[0] + b"\x00"])
+    clean, clean_seconds = session([])
+
+    assert [m.get("code") for m in messages[:2]] == ["bad_frame"] * 2
+    # The rejected frames left nothing behind in the audio
+    assert messages[2:] == clean
+    assert seconds == clean_seconds
+
+
+class HeldBatchSTT:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def stt_batch(self, audios):
+        self.release.wait(1)
+        return ["hello"] * len(audios)
+
+
+def test_finals_are_decoded_without_holding_the_caller(monkeypatch):
+    model = HeldBatchSTT()
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: BatchingSTT(model, max_wait=0))
+    state = AudioState(8000)
+
+    finals, _ = stream_stt_with_pause_detection(utterance(), state)
+
+    # Pause detection returns while the batch is still running
+    assert finals and not any(final.done() for final in finals)
+    model.release.set()
+    assert [final.result(1) for final in finals] == ["hello"] * len(finals)
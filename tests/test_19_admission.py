@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import app.admission as admission
+import app.api.tts as tts_api
+from app.admission import Admission, AdmissionDenied
+from app.auth import API_KEY
+from app.main import app
+from app.service.cache import CachedAudio
+from app.service.executor import InferenceExecutor, LoadShed, Priority
+from app.utils import wav_header
+
+HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+
+
+def blocked(executor: InferenceExecutor, priority: Priority = Priority.STT) -> threading.Event:
+    """Occupy a worker until the returned event is set"""
+    release, started = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    executor.submit_future(block, priority=priority)
+    assert started.wait(1)
+    return release
+
+
+def test_most_urgent_class_runs_first():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=8)
+    order = []
+    release = blocked(executor)
+    futures = [
+        executor.submit_future(order.append, priority, priority=priority)
+        for priority in (Priority.BATCH, Priority.TTS, Priority.FIRST_AUDIO, Priority.BATCH, Priority.STT)
+    ]
+    release.set()
+    for future in futures:
+        future.result(1)
+
+    assert order == [Priority.STT, Priority.FIRST_AUDIO, Priority.TTS, Priority.BATCH, Priority.BATCH]
+
+
+def test_synthesis_leaves_workers_for_stt():
+    executor = InferenceExecutor(max_workers=2, max_queue_size=8, tts_workers=1)
+    release = blocked(executor, Priority.TTS)
+    try:
+        waiting = executor.submit_future(lambda: "tts", priority=Priority.TTS)
+        assert executor.submit_future(lambda: "stt", priority=Priority.STT).result(1) == "stt"
+        assert not waiting.done()
+    finally:
+        release.set()
+    assert waiting.result(1) == "tts"
+
+
+def test_jobs_past_their_slo_are_shed():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=8, slo={Priority.TTS: 0.05})
+    executor.submit_future(time.sleep, 0.1, priority=Priority.TTS).result(1)
+    release = blocked(executor)
+    try:
+        executor.submit_future(time.sleep, 0, priority=Priority.TTS)
+        with pytest.raises(LoadShed) as shed:
+            executor.submit_future(time.sleep, 0, priority=Priority.TTS)
+        assert shed.value.wait >= 0.05
+        # Other classes have their own budgets
+        executor.submit_future(time.sleep, 0, priority=Priority.STT)
+    finally:
+        release.set()
+
+
+def test_per_key_session_and_rate_budgets():
+    budgets = Admission(max_sessions=1, rate=1, burst=2)
+
+    first = budgets.session("Bearer a", "test")
+    with pytest.raises(AdmissionDenied) as denied:
+        budgets.session("Bearer a", "test")
+    assert denied.value.reason == "too_many_sessions"
+    # Keys have budgets of their own
+    budgets.session("Bearer b", "test").close()
+    first.close()
+
+    budgets.session("Bearer a", "test").close()
+    with pytest.raises(AdmissionDenied) as denied:
+        budgets.session("Bearer a", "test")
+    assert denied.value.reason == "rate_limited"
+    assert 0 < denied.value.retry_after <= 1
+
+
+def test_http_refusal_is_429_with_retry_after(monkeypatch):
+    budgets = Admission(max_sessions=0, rate=0.5, burst=1)
+    monkeypatch.setattr(admission, "get_admission", lambda: budgets)
+    monkeypatch.setattr(tts_api, "render", lambda tts_request: CachedAudio(8000, wav_header(8000, 0)))
+    client = TestClient(app)
+
+    assert client.post("/tts/", json={"text": "Hello."}, headers=HEADERS).status_code == 200
+    response = client.post("/tts/", json={"text": "Hello."}, headers=HEADERS)
+
+    assert response.status_code == 429
+    assert response.json()["detail"]["code"] == "rate_limited"
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_websocket_refusal_closes_with_1013(monkeypatch):
+    budgets = Admission(max_sessions=1, rate=0)
+    monkeypatch.setattr(admission, "get_admission", lambda: budgets)
+    held = budgets.session(f"Bearer {API_KEY}", "test")
+
+    with TestClient(app).websocket_connect("/stt/", headers=HEADERS) as websocket:
+        message = websocket.receive_json()
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    held.close()
+    assert message["type"] == "error"
+    assert message["code"] == "too_many_sessions"
+    assert closed.value.code == 1013
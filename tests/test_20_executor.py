@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.service.executor import InferenceExecutor, InferenceQueueFull, Priority
+
+
+def test_jobs_run_off_the_event_loop_thread():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=8)
+
+    async def run():
+        return threading.get_ident(), await executor.submit(threading.get_ident)
+
+    loop_thread, job_thread = asyncio.run(run())
+
+    assert job_thread != loop_thread
+
+
+def test_a_full_queue_refuses_jobs_immediately():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=1)
+    release, started = threading.Event(), threading.Event()
+    executor.submit_future(lambda: (started.set(), release.wait()))
+    assert started.wait(1)
+    try:
+        executor.submit_future(time.sleep, 0)
+        with pytest.raises(InferenceQueueFull):
+            executor.submit_future(time.sleep, 0)
+    finally:
+        release.set()
+
+
+def test_a_caller_that_awaits_each_job_keeps_its_order():
+    executor = InferenceExecutor(max_workers=4, max_queue_size=8)
+    order = []
+
+    async def session(name: str):
+        for i in range(20):
+            await executor.submit(order.append, (name, i))
+
+    async def run():
+        await asyncio.gather(session("a"), session("b"))
+
+    asyncio.run(run())
+
+    for name in "ab":
+        assert [i for n, i in order if n == name] == list(range(20))
+
+
+def test_workers_survive_callers_whose_loop_closed():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=8)
+
+    async def give_up():
+        # The first job finishes after its loop is gone, the second is dropped unstarted
+        jobs = [asyncio.ensure_future(executor.submit(time.sleep, 0.05)) for _ in range(2)]
+        await asyncio.wait(jobs, timeout=0.01)
+
+    asyncio.run(give_up())
+    time.sleep(0.1)
+
+    assert executor.submit_future(lambda: "alive").result(1) == "alive"
+
+
+def test_batch_jobs_have_slots_of_their_own():
+    executor = InferenceExecutor(max_workers=3, max_queue_size=8, tts_workers=1, batch_workers=1)
+    release, started = threading.Event(), threading.Event()
+    executor.submit_future(lambda: (started.set(), release.wait()), priority=Priority.BATCH)
+    assert started.wait(1)
+    try:
+        # A long batch job does not hold the TTS slot, but a second one waits for its own
+        assert executor.submit_future(lambda: "tts", priority=Priority.TTS).result(1) == "tts"
+        waiting = executor.submit_future(lambda: "batch", priority=Priority.BATCH)
+        time.sleep(0.05)
+        assert not waiting.done()
+    finally:
+        release.set()
+    assert waiting.result(1) == "batch"
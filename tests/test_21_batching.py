@@ -0,0 +1,150 @@
+import threading
+
+import numpy as np
+import pytest
+from onnxruntime.capi.onnxruntime_pybind11_state import InvalidArgument
+
+from app.service.batching import BatchingSTT
+from app.service.executor import Priority
+from app.service.stt import MoonshineSTT, _load_moonshine
+
+
+class FakeMoonshine:
+    """Stands in for MoonshineSTT: transcribes each utterance to its length in samples"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def stt_batch(self, audios):
+        self.started.set()
+        self.release.wait(1)
+        self.batches.append([len(audio) for _, audio in audios])
+        if self.fail:
+            raise RuntimeError("decoder failed")
+        return [str(len(audio)) for _, audio in audios]
+
+
+def held(model: FakeMoonshine, batcher: BatchingSTT) -> None:
+    """Keep the scheduler busy on a first utterance so the next ones queue up together"""
+    model.release.clear()
+    batcher.submit((16000, np.zeros(1, dtype=np.float32)))
+    assert model.started.wait(1)
+
+
+def test_utterances_are_bucketed_by_length_and_routed_back():
+    model = FakeMoonshine()
+    batcher = BatchingSTT(model, max_batch_size=8, max_wait=0.01, max_pad_ratio=1.5)
+    held(model, batcher)
+    lengths = [16000, 48000, 20000, 8000 * 4, 16000 * 10]
+    # Two callers at 8 kHz, compared by duration rather than sample count
+    audios = [(16000, np.zeros(n, dtype=np.float32)) for n in lengths[:3]]
+    audios += [(8000, np.zeros(n, dtype=np.float32)) for n in lengths[3:]]
+    futures = [batcher.submit(audio) for audio in audios]
+    model.release.set()
+
+    assert [f.result(1) for f in futures] == [str(n) for n in lengths]
+    assert model.batches[1:] == [[16000, 20000], [48000, 8000 * 4], [16000 * 10]]
+
+
+def test_a_failed_batch_fails_every_caller_in_it():
+    model = FakeMoonshine(fail=True)
+    batcher = BatchingSTT(model, max_batch_size=8, max_wait=0.01)
+    held(model, batcher)
+    futures = [batcher.submit((16000, np.zeros(16000, dtype=np.float32))) for _ in range(3)]
+    model.release.set()
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="decoder failed"):
+            future.result(1)
+    assert model.batches[1:] == [[16000] * 3]
+
+
+def test_live_utterances_are_batched_ahead_of_upload_segments():
+    model = FakeMoonshine()
+    batcher = BatchingSTT(model, max_batch_size=2, max_wait=0.01)
+    held(model, batcher)
+    uploads = [batcher.submit((16000, np.zeros(16000, dtype=np.float32)), Priority.BATCH) for _ in range(3)]
+    live = batcher.submit((16000, np.zeros(16001, dtype=np.float32)))
+    model.release.set()
+
+    assert [f.result(1) for f in uploads + [live]] == ["16000"] * 3 + ["16001"]
+    # The live utterance goes in the first batch, after the one upload segment it has room for
+    assert model.batches[1:] == [[16000, 16001], [16000, 16000]]
+
+
+class FakeSession:
+    def __init__(self, run):
+        self.run = run
+
+
+class FakeOnnxModel:
+    """Encoder and decoder of one layer whose decoder never emits EOS"""
+
+    num_layers, num_key_value_heads, head_dim = 1, 1, 1
+    decoder_start_token_id, eos_token_id = 1, 2
+    encoder_input_names = ["input_values"]
+    decoder_input_names = []
+
+    def __init__(self):
+        self.steps = 0
+        self.encoder = FakeSession(lambda _, inputs: [np.zeros((len(inputs["input_values"]), 4, 1))])
+        self.decoder = FakeSession(self.decode)
+
+    def decode(self, _, inputs):
+        self.steps += 1
+        batch_size = len(inputs["input_ids"])
+        logits = np.zeros((batch_size, 1, 8), dtype=np.float32)
+        logits[..., 5] = 1
+        return [logits] + [np.zeros((batch_size, 1, 1, 1), dtype=np.float32)] * 4
+
+    def generate(self, audio):
+        return [[1, 5, 2]]
+
+
+class FakeTokenizer:
+    def decode_batch(self, tokens):
+        return [" ".join(map(str, t)) for t in tokens]
+
+
+def moonshine(model=None) -> MoonshineSTT:
+    stt = MoonshineSTT.__new__(MoonshineSTT)
+    stt.model = model or FakeOnnxModel()
+    stt.tokenizer = FakeTokenizer()
+    stt.supports_batching = True
+    return stt
+
+
+def test_batched_decoding_is_capped_by_the_longest_utterance():
+    stt = moonshine()
+    # 6 tokens per second of the 5 s utterance
+    tokens = stt._generate_batch([np.zeros(16000, dtype=np.float32), np.zeros(5 * 16000, dtype=np.float32)])
+
+    assert stt.model.steps == 30
+    assert [len(t) for t in tokens] == [31, 31]
+
+
+@pytest.mark.parametrize(
+    "error, disabled",
+    [(InvalidArgument("Got invalid dimensions for input"), True), (MemoryError(), False)],
+)
+def test_only_rejected_batch_shapes_disable_batching(monkeypatch, error, disabled):
+    stt = moonshine()
+
+    def rejected(signals):
+        raise error
+
+    monkeypatch.setattr(stt, "_generate_batch", rejected)
+    audios = [(16000, np.zeros(16000, dtype=np.float32))] * 2
+
+    assert stt.stt_batch(audios) == ["1 5 2", "1 5 2"]
+    assert stt.supports_batching is not disabled
+
+
+@pytest.mark.parametrize("name", [None, "moonshine/large"])
+def test_unknown_moonshine_models_are_refused_before_loading(name):
+    with pytest.raises(ValueError, match="Unknown Moonshine model"):
+        _load_moonshine(name)
@@ -0,0 +1,79 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+import app.api.stt as stt_api
+from app.api.stt import AudioState, determine_pause
+from app.auth import API_KEY
+from app.main import app
+
+
+def tones(seconds: float, seed: int = 0) -> np.ndarray:
+    """Speech-like 8 kHz signal of 50 ms tones, never silent and never repeating"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(400) / 8000
+    pieces = [
+        rng.uniform(0.2, 0.5) * np.sin(2 * np.pi * rng.uniform(150, 600) * t + rng.uniform(0, 6))
+        for _ in range(int(seconds * 20))
+    ]
+    return (np.concatenate(pieces) * 32767).astype(np.int16)
+
+
+def test_forced_flushes_do_not_repeat_audio(monkeypatch):
+    monkeypatch.setattr(stt_api, "STT_MAX_UTTERANCE_DURATION", 2.0)
+    signal = tones(10)
+    state = AudioState(8000)
+    utterances = []
+    for i in range(0, len(signal), 160):
+        if determine_pause(signal[i : i + 160], state):
+            utterances.append(state.buffer.view().copy())
+            state.reset()
+
+    assert len(utterances) == 5
+    # Each utterance picks up exactly where the one before was cut
+    assert np.array_equal(np.concatenate(utterances), signal[: sum(map(len, utterances))])
+
+
+class FakeSTT:
+    """Transcribes to the decoded duration, so transcripts show which audio was decoded"""
+
+    def __init__(self):
+        self.seconds = []
+
+    def stt(self, audio):
+        sample_rate, samples = audio
+        self.seconds.append(len(samples) / sample_rate)
+        return f"{self.seconds[-1]:.2f}"
+
+
+def test_interim_results_precede_the_final_and_decode_bounded_windows(monkeypatch):
+    model = FakeSTT()
+    monkeypatch.setattr(stt_api, "get_stt_model", lambda repo: model)
+    monkeypatch.setattr(stt_api, "STT_INTERIM_INTERVAL", 1.0)
+    monkeypatch.setattr(stt_api, "STT_INTERIM_WINDOW", 2.0)
+    speech = tones(6)
+    silence = np.zeros(8000, dtype=np.int16)
+    signal = np.concatenate([silence, speech, silence, silence])
+
+    with TestClient(app).websocket_connect("/stt/", headers={"Authorization": f"Bearer {API_KEY}"}) as ws:
+        ws.send_json({"type": "start", "sampleRateHz": 8000, "interim_results": True})
+        for i in range(0, len(signal), 160):
+            ws.send_bytes(signal[i : i + 160].tobytes())
+        ws.send_json({"type": "stop"})
+        messages = []
+        while True:
+            try:
+                messages.append(ws.receive_json())
+            except Exception:
+                break
+
+    finals = [m["is_final"] for m in messages if m["type"] == "transcription"]
+    assert finals[-1] and not any(finals[:-1])
+    # At most one interim result per STT_INTERIM_INTERVAL of speech
+    assert 2 <= len(finals) - 1 <= len(speech) / 8000
+    # Committed prefixes and the tail decoded with the final cover the utterance once
+    final = [m for m in messages if m["type"] == "transcription"][-1]
+    parts = [float(p) for p in final["alternatives"][0]["transcript"].split()]
+    assert len(parts) > 1
+    assert abs(sum(parts) - len(speech) / 8000) < 1.0
+    # No decode covers more than the window plus the new speech since the last one
+    assert max(model.seconds) <= 2.0 + 1.0 + 0.02
@@ -0,0 +1,89 @@
+import struct
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.tts as tts_api
+import app.service.tts as tts
+from app.auth import API_KEY
+from app.main import app
+from app.service.cache import SynthesisCache
+from app.utils import wav_header
+
+HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+TEXT = "Hello there. Please hold. Goodbye now."
+# Three sentences of 2400 samples with two gaps of 24000 // 7 between them
+SAMPLES = 3 * 2400 + 2 * (24000 // 7)
+
+
+def tone(phonemes: str) -> np.ndarray:
+    """A 200 Hz tone whose level is set by the sentence length"""
+    t = np.arange(2400) / 24000
+    return (0.01 * len(phonemes) * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+
+
+@pytest.fixture
+def client(monkeypatch, fake_kokoro):
+    monkeypatch.setattr(fake_kokoro, "render", staticmethod(tone))
+    model = tts.KokoroTTSModel()
+    cache = SynthesisCache(1024 * 1024)
+    monkeypatch.setattr(tts_api, "get_tts_model", lambda engine=None: model)
+    monkeypatch.setattr(tts_api, "get_synthesis_cache", lambda: cache)
+    return TestClient(app)
+
+
+def post(client: TestClient, **fields):
+    return client.post("/tts/", json={"text": TEXT, **fields}, headers=HEADERS)
+
+
+def test_streamed_wav_has_a_streaming_header_and_the_buffered_audio(client):
+    streamed = post(client, stream=True)
+    buffered = post(client)
+
+    assert streamed.headers["X-Cache"] == "miss"
+    assert streamed.content[:44] == wav_header(24000)
+    assert len(streamed.content) == 44 + 2 * SAMPLES
+    assert streamed.content[44:] == buffered.content[44:]
+
+
+@pytest.mark.parametrize("fmt", ["wav", "pcm_s16le", "mulaw"])
+def test_a_streamed_miss_is_served_byte_identical_from_the_cache(client, fmt):
+    miss = post(client, stream=True, format=fmt, sample_rate=8000)
+    hit = post(client, stream=True, format=fmt, sample_rate=8000)
+
+    assert (miss.headers["X-Cache"], hit.headers["X-Cache"]) == ("miss", "hit")
+    assert hit.headers["X-Sample-Rate"] == "8000"
+    if fmt == "wav":
+        # The cached file gets a header with its real length
+        assert hit.content == wav_header(8000, (len(miss.content) - 44) // 2) + miss.content[44:]
+    else:
+        assert hit.content == miss.content
+
+
+@pytest.mark.parametrize("rate", [8000, 16000, 48000])
+def test_streamed_audio_is_resampled_to_the_requested_rate(client, rate):
+    response = post(client, stream=True, sample_rate=rate)
+
+    assert response.headers["X-Sample-Rate"] == str(rate)
+    assert struct.unpack_from("<I", response.content, 24)[0] == rate
+    samples = (len(response.content) - 44) // 2
+    assert abs(samples - SAMPLES * rate / 24000) <= 2
+
+
+def test_streamed_requests_are_served_from_prewarmed_prompts(client):
+    prompt = {"text": TEXT, "format": "mulaw", "sample_rate": 8000}
+    assert client.post("/tts/cache/prewarm", json=[prompt], headers=HEADERS).json()["entries"] == 1
+
+    response = post(client, stream=True, format="mulaw", sample_rate=8000)
+
+    assert response.headers["X-Cache"] == "hit"
+    assert response.content == post(client, format="mulaw", sample_rate=8000).content
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_blank_text_is_a_bad_request(client, stream):
+    response = client.post("/tts/", json={"text": " \n ", "stream": stream}, headers=HEADERS)
+
+    assert response.status_code == 400
+    assert response.content == b""
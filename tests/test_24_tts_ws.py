@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import app.admission as admission
+import app.api.tts as tts_api
+from app.admission import Admission
+from app.auth import API_KEY
+from app.main import app
+
+HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+
+
+class FakeTTS:
+    """Streams each segment as one 24 kHz sentence of 2400 samples per word"""
+
+    def __init__(self):
+        self.segments = []
+
+    async def stream_tts(self, text, options=None):
+        self.segments.append(text)
+        yield 24000, np.full(2400 * len(text.split()), 0.5, dtype=np.float32)
+
+
+def receive_all(ws) -> list:
+    """JSON messages as dicts and binary frames as bytes, until the socket closes"""
+    messages = []
+    while True:
+        message = ws.receive()
+        if message["type"] == "websocket.close":
+            return messages
+        messages.append(message["bytes"] if message.get("bytes") is not None else json.loads(message["text"]))
+
+
+def test_incremental_text_is_answered_per_segment_then_done(monkeypatch):
+    model = FakeTTS()
+    monkeypatch.setattr(tts_api, "get_tts_model", lambda engine=None: model)
+
+    with TestClient(app).websocket_connect("/tts/ws", headers=HEADERS) as ws:
+        ws.send_json({"type": "start", "format": "pcm_s16le", "sample_rate": 8000})
+        for delta in ("Hello th", "ere. Please", " hold", " on"):
+            ws.send_json({"type": "text", "text": delta})
+        ws.send_json({"type": "close"})
+        messages = receive_all(ws)
+
+    assert model.segments == ["Hello there.", "Please hold on"]
+    assert messages[-1] == {"type": "done"}
+    starts = [i for i, m in enumerate(messages) if isinstance(m, dict) and m["type"] == "segment"]
+    assert [messages[i]["text"] for i in starts] == model.segments
+    assert all(messages[i]["sample_rate"] == 8000 for i in starts)
+    # Between the segment messages only audio, 16-bit at 8 kHz
+    audio = [messages[starts[0] + 1 : starts[1]], messages[starts[1] + 1 : -1]]
+    assert all(isinstance(m, bytes) for frames in audio for m in frames)
+    first, second = (b"".join(frames) for frames in audio)
+    assert abs(len(first) // 2 - 2 * 800) <= 2
+    # The second segment starts with the gap left between sentences
+    assert abs(len(second) // 2 - (8000 // 7 + 3 * 800)) <= 2
+
+
+def test_unsupported_formats_are_reported(monkeypatch):
+    monkeypatch.setattr(tts_api, "get_tts_model", lambda engine=None: FakeTTS())
+
+    with TestClient(app).websocket_connect("/tts/ws", headers=HEADERS) as ws:
+        ws.send_json({"type": "start", "format": "wav"})
+        messages = receive_all(ws)
+
+    assert messages == [{"type": "error", "error": "Unsupported websocket audio format: wav"}]
+
+
+def test_refused_sessions_are_closed_with_1013(monkeypatch):
+    budgets = Admission(max_sessions=1, rate=0)
+    monkeypatch.setattr(admission, "get_admission", lambda: budgets)
+    held = budgets.session(f"Bearer {API_KEY}", "test")
+
+    with TestClient(app).websocket_connect("/tts/ws", headers=HEADERS) as ws:
+        message = ws.receive_json()
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+
+    held.close()
+    assert message["code"] == "too_many_sessions"
+    assert closed.value.code == 1013
@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+from app.service.vad import EnergyVADModel
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), "test_file.wav")
+
+
+def test_energy_vad_measures_speech_duration():
+    audio, sample_rate = sf.read(TEST_FILE, dtype="int16")
+    duration, chunks = EnergyVADModel().vad((sample_rate, audio))
+
+    assert 0 < duration < len(audio) / sample_rate
+    assert chunks
+    assert all(0 <= c["start"] < c["end"] <= len(audio) for c in chunks)
+
+
+def test_energy_vad_ignores_silence_and_noise():
+    model = EnergyVADModel()
+    rng = np.random.default_rng(0)
+    t = np.arange(8000) / 8000
+
+    assert model.vad((8000, np.zeros(8000, dtype=np.int16)))[0] == 0.0
+    assert model.vad((8000, (0.1 * rng.standard_normal(8000)).astype(np.float32)))[0] == 0.0
+    assert model.vad((8000, (0.3 * np.sin(2 * np.pi * 400 * t)).astype(np.float32)))[0] == 0.0
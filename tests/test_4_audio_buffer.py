@@ -0,0 +1,48 @@
+import numpy as np
+
+from app.utils import AudioBuffer, FrameAssembler
+
+
+def test_audio_buffer_appends_and_grows():
+    buffer = AudioBuffer(4)
+    chunks = [np.arange(i, i + 3, dtype=np.int16) for i in range(0, 30, 3)]
+    for chunk in chunks:
+        buffer.append(chunk)
+
+    assert len(buffer) == 30
+    assert buffer.capacity >= 30
+    np.testing.assert_array_equal(buffer.view(), np.concatenate(chunks))
+
+
+def test_audio_buffer_clear_keeps_storage():
+    buffer = AudioBuffer(8)
+    buffer.append(np.ones(100, dtype=np.int16))
+    capacity = buffer.capacity
+    previous = buffer.view()
+
+    buffer.clear()
+    buffer.append(np.full(10, 7, dtype=np.int16))
+
+    assert buffer.capacity == capacity
+    assert np.shares_memory(previous, buffer.view())
+    np.testing.assert_array_equal(buffer.view(), np.full(10, 7, dtype=np.int16))
+
+
+def test_frame_assembler_slides_by_hop_whatever_the_packet_size():
+    signal = np.arange(1000, dtype=np.int16)
+
+    def windows(packet: int) -> list[np.ndarray]:
+        frames = FrameAssembler(hop=20, window=80)
+        found = []
+        for i in range(0, len(signal), packet):
+            frames.append(signal[i : i + packet])
+            while (window := frames.next_window()) is not None:
+                found.append(window.copy())
+        return found
+
+    expected = windows(len(signal))
+    assert len(expected) == 50
+    np.testing.assert_array_equal(expected[0], signal[:20])
+    np.testing.assert_array_equal(expected[-1], signal[920:1000])
+    for packet in (7, 20, 33, 400):
+        assert all(np.array_equal(a, b) for a, b in zip(windows(packet), expected))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.service.resample import StreamingResampler, get_filter, resample
+
+RATE_PAIRS = [(8000, 16000), (24000, 16000), (24000, 8000), (48000, 16000)]
+
+
+def _tone(sample_rate: int, n_samples: int) -> np.ndarray:
+    return 0.5 * np.sin(2 * np.pi * 440 * np.arange(n_samples) / sample_rate)
+
+
+@pytest.mark.parametrize("src,dst", RATE_PAIRS)
+def test_resample_preserves_tone(src, dst):
+    audio = _tone(src, src).astype(np.float32)
+    out = resample(audio, src, dst)
+
+    assert len(out) == dst
+    # Ignore the edges, where the signal starts and stops abruptly
+    np.testing.assert_allclose(out[200:-200], _tone(dst, dst)[200:-200], atol=1e-4)
+
+
+@pytest.mark.parametrize("src,dst", RATE_PAIRS)
+def test_streaming_resampler_does_not_depend_on_chunking(src, dst):
+    rng = np.random.default_rng(0)
+    audio = (0.1 * rng.standard_normal(src)).astype(np.float32)
+    resampler = StreamingResampler(src, dst)
+
+    parts, start = [], 0
+    while start < len(audio):
+        size = int(rng.integers(1, src // 10))
+        parts.append(resampler.process(audio[start : start + size]))
+        start += size
+    parts.append(resampler.flush())
+    whole = np.concatenate([resampler.process(audio), resampler.flush()])
+
+    np.testing.assert_allclose(np.concatenate(parts), whole, atol=1e-6)
+
+
+@pytest.mark.parametrize("src,dst", RATE_PAIRS)
+def test_streaming_resampler_preserves_tone(src, dst):
+    resampler = StreamingResampler(src, dst)
+    audio = _tone(src, src).astype(np.float32)
+    out = np.concatenate([resampler.process(audio), resampler.flush()])
+
+    assert len(out) == dst
+    np.testing.assert_allclose(out[200:-200], _tone(dst, dst)[200:-200], atol=1e-4)
+
+
+def test_filters_for_odd_rates_are_refused():
+    with pytest.raises(ValueError):
+        get_filter(44101, 16000)
+    with pytest.raises(ValueError):
+        get_filter(0, 16000)
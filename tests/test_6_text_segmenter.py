@@ -0,0 +1,20 @@
+from app.service.tts import TextSegmenter
+
+
+def test_text_segmenter_releases_sentences_as_they_complete():
+    segmenter = TextSegmenter()
+
+    assert segmenter.push("Hello th") == []
+    assert segmenter.push("ere. How are") == ["Hello there."]
+    assert segmenter.push(" you? Fine") == ["How are you?"]
+    assert segmenter.flush() == "Fine"
+    assert segmenter.flush() == ""
+
+
+def test_text_segmenter_cuts_long_sentences_at_clauses():
+    segmenter = TextSegmenter(max_chars=30)
+
+    segments = segmenter.push("I am fine, thanks for asking, and this clause keeps going")
+
+    assert segments == ["I am fine, thanks for asking,"]
+    assert segmenter.flush() == "and this clause keeps going"
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from app.models.schemas import TTSRequest
+from app.service.codecs import (
+    ALAW_DECODE,
+    MULAW_DECODE,
+    AudioEncoder,
+    FrameSequence,
+    decode_audio,
+    encode_audio,
+    encode_file,
+)
+
+
+def test_g711_round_trip_is_within_quantization_error():
+    pcm = np.linspace(-32768, 32767, 4001).astype(np.int16)
+
+    for fmt, table in (("mulaw", MULAW_DECODE), ("alaw", ALAW_DECODE)):
+        encoded = np.frombuffer(encode_audio(pcm, fmt), dtype=np.uint8)
+        decoded = table[encoded].astype(np.int32)
+        expected = pcm.astype(np.int32)
+        # Companding keeps the error proportional to the amplitude
+        assert np.all(np.abs(decoded - expected) <= np.maximum(np.abs(expected) // 16, 16))
+
+
+def test_encode_file_resamples_and_sizes_output():
+    audio = np.zeros(24000, dtype=np.float32)
+
+    wav, rate = encode_file(audio, 24000, "wav", 8000)
+    mulaw, _ = encode_file(audio, 24000, "mulaw", 8000)
+
+    assert rate == 8000
+    assert wav[:4] == b"RIFF" and len(wav) == 44 + 2 * 8000
+    assert len(mulaw) == 8000
+
+
+def test_streaming_encoder_does_not_depend_on_chunking():
+    rng = np.random.default_rng(0)
+    audio = (0.2 * rng.standard_normal(24000)).astype(np.float32)
+
+    def streamed(chunks: int) -> bytes:
+        encoder = AudioEncoder("pcm_s16le", 24000, 8000)
+        return encoder.header() + b"".join(
+            encoder.encode(chunk) for chunk in np.array_split(audio, chunks)
+        ) + encoder.flush()
+
+    assert streamed(7) == streamed(1)
+    # The buffered path resamples with soxr, the same length but not the same bytes
+    assert len(streamed(7)) == len(encode_file(audio, 24000, "pcm_s16le", 8000)[0])
+
+
+def test_decode_audio_matches_encoders_for_every_encoding():
+    pcm = np.linspace(-32768, 32767, 4001).astype(np.int16)
+
+    for encoding, fmt in (("linear16", "pcm_s16le"), ("mulaw", "mulaw"), ("alaw", "alaw"), ("float32", "float32")):
+        data = encode_audio(pcm, fmt)
+        out = np.empty(len(pcm), dtype=np.int16)
+        decoded = decode_audio(data, encoding, out=out)
+
+        assert decoded is out
+        assert np.all(np.abs(decoded.astype(np.int32) - pcm) <= np.maximum(np.abs(pcm.astype(np.int32)) // 16, 16))
+        np.testing.assert_array_equal(decode_audio(data, encoding), decoded)
+
+
+def test_frame_sequence_fills_gaps_and_drops_late_frames():
+    sequence = FrameSequence(max_gap=8000)
+
+    assert sequence.check(0xFFFFFFFF, 0, 160) == (0, 0)
+    # Sequence numbers wrap around, two frames of 160 samples are missing
+    assert sequence.check(2, 480, 160) == (2, 320)
+    assert sequence.check(1, 320, 160) is None
+    assert sequence.check(3, 640, 160) == (0, 0)
+
+
+def test_output_rates_are_restricted_to_supported_ones():
+    assert TTSRequest(text="Hi.", sample_rate=8000).sample_rate == 8000
+    for rate in (0, -8000, 44101):
+        with pytest.raises(ValidationError):
+            TTSRequest(text="Hi.", sample_rate=rate)
@@ -0,0 +1,55 @@
+import os
+
+from app.service.cache import CachedAudio, LRUCache, SynthesisCache, synthesis_key
+
+
+def test_lru_cache_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    cache.get("a")
+    cache.put("c", b"1234")
+
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats()["evictions"] == 1
+    assert cache.nbytes == 8
+
+
+def test_synthesis_key_ignores_whitespace_only():
+    key = synthesis_key("Please  hold. ", "af_heart", 1.0, "en-US", "wav", None)
+
+    assert key == synthesis_key("Please hold.", "af_heart", 1.0, "en-us", "wav", None)
+    assert key != synthesis_key("Please hold.", "af_heart", 1.0, "en-us", "mulaw", 8000)
+
+
+def test_synthesis_cache_disk_tier_survives_restart(tmp_path):
+    entry = CachedAudio(8000, b"\x01\x02\x03")
+    SynthesisCache(1024, str(tmp_path)).put("key", entry)
+
+    restarted = SynthesisCache(1024, str(tmp_path))
+
+    assert restarted.get("key") == entry
+    assert restarted.get("other") is None
+    assert restarted.get("key") == entry
+    # One lookup per tier and one miss; the disk hit is not also a memory miss
+    stats = restarted.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_streamed_and_buffered_renders_are_keyed_apart():
+    args = ("Please hold.", "af_heart", 1.0, "en-us", "wav", 8000)
+
+    assert synthesis_key(*args, streamed=True) != synthesis_key(*args)
+
+
+def test_synthesis_cache_disk_tier_drops_least_recently_read(tmp_path):
+    cache = SynthesisCache(1024, str(tmp_path), max_disk_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, CachedAudio(8000, bytes(100)))
+        os.utime(tmp_path / key, (0, 0 if key == "a" else 1))
+    SynthesisCache(1024, str(tmp_path)).get("a")
+    cache.put("c", CachedAudio(8000, bytes(100)))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "c"]
+    assert cache.stats()["disk_evictions"] == 1
+    assert cache.stats()["disk_bytes"] == 208
@@ -0,0 +1,85 @@
+import random
+import time
+
+import numpy as np
+import pytest
+
+import app.service.tts as tts
+
+
+def render(phonemes: str) -> np.ndarray:
+    """A constant signal whose value is the sentence length"""
+    # Finish out of order to exercise the reassembly
+    time.sleep(random.uniform(0, 0.02))
+    return np.full(100, len(phonemes), dtype=np.float32)
+
+
+@pytest.fixture
+def model(monkeypatch, fake_kokoro):
+    monkeypatch.setattr(fake_kokoro, "render", staticmethod(render))
+    monkeypatch.setenv("TTS_POOL_SIZE", "4")
+    return tts.KokoroTTSModel()
+
+
+TEXT = " ".join(f"Sentence {'x' * i}." for i in range(8))
+
+
+def test_tts_reassembles_parallel_sentences_in_order(model):
+    sample_rate, audio = model.tts(TEXT)
+
+    speech = audio.reshape(-1)
+    starts = np.flatnonzero(np.diff(np.concatenate([[0], speech])) > 0)
+    assert [int(speech[i]) for i in starts] == [10 + i for i in range(8)]
+    assert len(audio) == 8 * 100 + 7 * (sample_rate // 7)
+
+
+def test_stream_tts_matches_buffered_output(model):
+    streamed = np.concatenate([chunk for _, chunk in model.stream_tts_sync(TEXT)])
+
+    np.testing.assert_array_equal(streamed, model.tts(TEXT)[1])
+
+
+def test_buffered_tts_bounds_its_queued_sentences(model):
+    submit, outstanding, most = model._submit, [], [0]
+
+    def tracked(*args):
+        future = submit(*args)
+        outstanding.append(future)
+        most[0] = max(most[0], sum(not f.done() for f in outstanding))
+        return future
+
+    model._submit = tracked
+    model.sentence_workers = 2
+    model.tts(TEXT)
+
+    assert len(outstanding) == 8
+    assert most[0] <= 2
+
+
+def test_repeated_sentences_are_served_from_the_segment_cache(model, fake_kokoro):
+    model.tts("Hello there. Please hold.")
+    model.tts("Please hold. Goodbye.")
+
+    assert fake_kokoro.calls == 3
+    assert model.cache_stats()["pool"]["size"] == 4
+    assert model.cache_stats()["segments"]["hits"] == 1
+
+
+def test_engines_are_loaded_once_and_selected_by_name(monkeypatch):
+    loaded = []
+
+    class FakeEngine:
+        def __init__(self):
+            loaded.append(self)
+
+        def tts(self, text, options=None):
+            return 24000, np.zeros(10, dtype=np.float32)
+
+    monkeypatch.setattr(tts, "TTS_ENGINES", {"fake": FakeEngine})
+    monkeypatch.setattr(tts, "_tts_models", {})
+
+    assert tts.get_tts_model("fake") is tts.get_tts_model("fake")
+    assert len(loaded) == 1
+    assert list(tts.loaded_tts_models()) == ["fake"]
+    with pytest.raises(ValueError):
+        tts.get_tts_model("onnx")